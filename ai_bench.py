@@ -0,0 +1,229 @@
+# ai_bench.py - ai_expert 離線壓測（本地 Gemini stub 注入延遲 / 429 / 壞 JSON / 逾時，量測不同並行數下的表現）
+"""
+取代原本逐一印出線上回應的 test_ai.py：不需要 API Key、不消耗額度
+量測項目：吞吐（次/秒）、延遲百分位、退回快取 / 規則判斷的比例、備用解析（_rescue_json）比例
+
+    python ai_bench.py                         # 預設故障比例，並行 1 / 4 / 8 / 16
+    python ai_bench.py --rate-limit 0 --json before.json
+    python ai_bench.py --levels 8 --timeout-ratio 0.1 --client-timeout 2
+    python ai_bench.py --fail-model gemma-3-27b-it=garbage   # 主力模型固定回壞資料（備援模型不會自動接手）
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# === 固定的測試輸入（與各模組實際送出的欄位一致）===
+US_SAMPLE = {"spx": "6,932 (+1.97%)", "nasdaq": "23,031 (+2.18%)", "tsm": "348.85 (+5.48%)", "tech": "科技股強勁"}
+TW_SAMPLE = {
+    "tech_summary": "現價 10.09, 距發行價 +0.9%, 價格位階 35%, 年化報酬 17.7%, 美股推估開盤 +0.42%（信心 61%）",
+    "score": "75/100", "position": "35%（0.35）", "outlook": "2027目標 11.20, 複利年化 17.7%",
+}
+GRID_SAMPLE = {"price": "175.30", "trend": "🔴 強勢多頭", "rsi": "68.5", "grid_buy": "172.50", "gap_est": "+0.38%（信心 58%）"}
+LEGACY_SAMPLE = {"price": 15.5, "k_line": "上漲", "valuation": "50%", "tech": "多頭"}  # 舊版 get_ai_point 呼叫方式
+
+def _workload(ai_expert):
+    """(名稱, 函式, 參數)；依序輪流送出"""
+    return [
+        ("us_market", ai_expert.analyze_us_market, (US_SAMPLE,), {}),
+        ("taiwan_stock", ai_expert.analyze_taiwan_stock, (TW_SAMPLE, "凱基台灣 TOP 50"), {}),
+        ("grid_trading", ai_expert.analyze_grid_trading, (GRID_SAMPLE, "2317 鴻海"), {}),
+        ("get_ai_point", ai_expert.get_ai_point, (), {"extra_data": LEGACY_SAMPLE, "target_name": "測試標的A"}),
+    ]
+
+class _Probe:
+    """
+    包住 _call_gemini_api 與 _rescue_json，記錄每次分析實際走了哪條路：
+    ai（正常解析）/ rescued（備用解析且決策正確）/ rescued_bad（備用解析拼出的決策與 stub 回應不符）/
+    api_failed（呼叫了但拿不到結果）/ skipped（額度或降級，未呼叫）
+    """
+
+    def __init__(self, ai_expert):
+        self.ai_expert = ai_expert
+        self._local = threading.local()
+        self._call = ai_expert._call_gemini_api
+        self._rescue = ai_expert._rescue_json
+
+    def install(self):
+        local, call, rescue = self._local, self._call, self._rescue
+
+        def probed_call(*args, **kwargs):
+            local.called = True
+            result = call(*args, **kwargs)
+            local.ok = result is not None
+            return result
+
+        def probed_rescue(text):
+            local.rescued = True
+            return rescue(text)
+
+        self.ai_expert._call_gemini_api = probed_call
+        self.ai_expert._rescue_json = probed_rescue
+
+    def uninstall(self):
+        self.ai_expert._call_gemini_api = self._call
+        self.ai_expert._rescue_json = self._rescue
+
+    def run(self, fn, args, kwargs, expected):
+        local = self._local
+        local.called = local.ok = local.rescued = False
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        ms = (time.perf_counter() - t0) * 1000
+        if not local.called:
+            outcome = "skipped"
+        elif not local.ok:
+            outcome = "api_failed"
+        elif not local.rescued:
+            outcome = "ai"
+        else:
+            # 備用解析遇到沒有 JSON 的回應會填「觀望 / 50」：決策不符就不算答對
+            outcome = "rescued" if result.get("decision") == expected else "rescued_bad"
+        return ms, outcome, result
+
+def run_level(ai_expert, probe, concurrency, requests, state_dir):
+    """單一並行數：新的額度帳與 AI 快取，送出 requests 次分析"""
+    import gemini_stub
+    from ai_budget import AIBudget
+
+    ai_expert.BUDGET = AIBudget(name=f"bench_budget_c{concurrency}", state_dir=state_dir)
+    ai_expert.AI_CACHE.clear()
+    gemini_stub.reset_stats()
+    work = _workload(ai_expert)
+    cfg = gemini_stub.STUB_CONFIG
+    expected = {"us_market": cfg["us_response"]["next_day"]}
+
+    def one(i):
+        name, fn, args, kwargs = work[i % len(work)]
+        ms, outcome, result = probe.run(fn, args, kwargs, expected.get(name, cfg["response"]["decision"]))
+        return name, ms, outcome, result
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        rows = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - t0
+
+    lat = np.array([ms for _, ms, _, _ in rows])
+    outcomes = [o for _, _, o, _ in rows]
+    count = {k: outcomes.count(k) for k in ("ai", "rescued", "rescued_bad", "api_failed", "skipped")}
+    answered = count["ai"] + count["rescued"] + count["rescued_bad"]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_s": wall,
+        "throughput": requests / wall if wall else 0.0,
+        "latency_ms": dict(zip(("p50", "p90", "p99"), np.percentile(lat, (50, 90, 99)).tolist())),
+        "latency_max_ms": float(lat.max()),
+        "outcomes": count,
+        "fallback_rate": (count["api_failed"] + count["skipped"]) / requests,
+        # 失敗 = 退回快取 / 規則 + 備用解析拼出錯誤決策（看似有回應，實際不是模型的判斷）
+        "failure_rate": (count["api_failed"] + count["skipped"] + count["rescued_bad"]) / requests,
+        "rescue_rate": (count["rescued"] + count["rescued_bad"]) / answered if answered else 0.0,
+        "per_kind_p50_ms": {
+            name: float(np.median([ms for n, ms, _, _ in rows if n == name])) for name, *_ in work
+        },
+        "stub": dict(gemini_stub.STUB_STATS),
+        "models": dict(gemini_stub.MODEL_STATS),
+    }
+
+def format_level(r):
+    lat = r["latency_ms"]
+    o = r["outcomes"]
+    stub = r["stub"]
+    return "\n".join([
+        f"⚙️ 並行 {r['concurrency']:>2}：{r['requests']} 次 / {r['wall_s']:.1f}s → {r['throughput']:.1f} 次/秒",
+        f"   ⏱️ P50 {lat['p50']:.0f}ms / P90 {lat['p90']:.0f}ms / P99 {lat['p99']:.0f}ms / 最大 {r['latency_max_ms']:.0f}ms",
+        f"   🛟 失敗 {r['failure_rate'] * 100:.0f}%（API 失敗 {o['api_failed']}、額度冷卻未呼叫 {o['skipped']}、"
+        f"備用解析決策錯誤 {o['rescued_bad']}）｜ 🔧 備用解析 {r['rescue_rate'] * 100:.0f}%"
+        f"（{o['rescued'] + o['rescued_bad']} 次，決策正確 {o['rescued']}）",
+        f"   🧪 stub：正常 {stub.get('ok', 0)}、429 {stub.get('rate_limit', 0)}、壞 JSON {stub.get('malformed', 0)}、"
+        f"無 JSON {stub.get('garbage', 0)}、逾時 {stub.get('timeout', 0)}"
+        f" ｜ 模型 " + "、".join(f"{m} {n}" for m, n in sorted(r["models"].items())),
+    ])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ai_expert 離線壓測（本地 Gemini stub）")
+    parser.add_argument("--levels", default="1,4,8,16", help="並行數，逗號分隔")
+    parser.add_argument("--requests", type=int, default=40, help="每個並行數送出的分析次數")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub 開始輸出前的固定延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="stub 額外延遲平均值（指數分佈長尾，秒）")
+    parser.add_argument("--rate-limit", type=float, default=0.05, help="429 比例")
+    parser.add_argument("--malformed", type=float, default=0.08, help="JSON 寫壞的比例")
+    parser.add_argument("--garbage", type=float, default=0.03, help="完全沒有 JSON 的比例")
+    parser.add_argument("--timeout-ratio", type=float, default=0.03, help="卡住不回應的比例")
+    parser.add_argument("--hang", type=float, default=6.0, help="卡住的秒數")
+    parser.add_argument("--client-timeout", type=float, default=3.0, help="用戶端請求逾時上限（秒，正式環境為 25）")
+    parser.add_argument("--fail-model", action="append", default=[], metavar="MODEL=FAULT",
+                        help="指定模型固定發生某種故障（rate_limit / malformed / garbage / timeout），可重複")
+    parser.add_argument("--cooldown", type=float, help="429 後的模型冷卻秒數（預設沿用 ai_budget.RATE_COOLDOWN）")
+    parser.add_argument("--no-stream", action="store_true", help="改走阻塞端點")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="把結果寫成 JSON（比較改版前後）")
+    parser.add_argument("--verbose", action="store_true", help="顯示 ai_expert 的日誌")
+    args = parser.parse_args(argv)
+
+    # 額度帳 / 美股情緒等共享狀態寫到暫存目錄，不碰正式狀態
+    scratch = tempfile.mkdtemp(prefix="ai-bench-")
+    os.environ["SHARED_STATE_DIR"] = scratch
+    os.environ.setdefault("GEMINI_API_KEY", "stub-key")
+
+    import ai_budget
+    import ai_expert
+    import gemini_stub
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+    if any("=" not in item for item in args.fail_model):
+        parser.error("--fail-model 格式為 模型=故障，例如 gemma-3-27b-it=garbage")
+    gemini_stub.STUB_CONFIG.update({
+        "latency": args.latency, "latency_jitter": args.jitter, "rate_limit": args.rate_limit,
+        "malformed": args.malformed, "garbage": args.garbage, "timeout": args.timeout_ratio,
+        "hang_seconds": args.hang, "seed": args.seed, "trailing_chunks": 10,
+        "model_faults": dict(item.split("=", 1) for item in args.fail_model),
+    })
+    unknown = set(gemini_stub.STUB_CONFIG["model_faults"].values()) - set(gemini_stub.FAULTS)
+    if unknown:
+        parser.error(f"未知的故障種類：{', '.join(sorted(unknown))}（可用 {' / '.join(gemini_stub.FAULTS)}）")
+    if args.cooldown is not None:
+        ai_budget.RATE_COOLDOWN = args.cooldown
+
+    server, base = gemini_stub.start_stub()
+    saved = (ai_expert.GEMINI_API_BASE, ai_expert.GEMINI_STREAM, ai_expert.request_timeout, ai_expert.BUDGET)
+    ai_expert.GEMINI_API_BASE = base
+    ai_expert.GEMINI_STREAM = not args.no_stream
+    ai_expert.request_timeout = lambda cap: min(cap, args.client_timeout)
+    probe = _Probe(ai_expert)
+    probe.install()
+
+    cfg = gemini_stub.STUB_CONFIG
+    print(f"🧪 ai_expert 壓測：{'串流' if not args.no_stream else '阻塞'}端點，延遲 {cfg['latency']:.2f}s + 長尾 {cfg['latency_jitter']:.2f}s，"
+          f"429 {cfg['rate_limit']:.0%} / 壞 JSON {cfg['malformed']:.0%} / 無 JSON {cfg['garbage']:.0%} / 逾時 {cfg['timeout']:.0%}"
+          f"（用戶端逾時 {args.client_timeout:g}s，429 冷卻 {ai_budget.RATE_COOLDOWN:g}s）")
+    results = []
+    try:
+        for level in (int(x) for x in args.levels.split(",") if x.strip()):
+            results.append(run_level(ai_expert, probe, level, args.requests, scratch))
+            print(format_level(results[-1]))
+    finally:
+        probe.uninstall()
+        ai_expert.GEMINI_API_BASE, ai_expert.GEMINI_STREAM, ai_expert.request_timeout, ai_expert.BUDGET = saved
+        server.shutdown()
+
+    if len(results) > 1:
+        base_tp = results[0]["throughput"]
+        print("📈 吞吐倍數：" + " ／ ".join(f"並行 {r['concurrency']} {r['throughput'] / base_tp:.1f}×" for r in results))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"config": {k: v for k, v in cfg.items() if k not in ("response", "us_response")}, "results": results},
+                      fh, ensure_ascii=False, indent=2)
+        print(f"💾 已寫入 {args.json}")
+    return results
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,267 @@
+# ai_budget.py - Gemini 每日額度管理（依模型記錄請求數 / 估計 token，依剩餘巡檢次數配給 AI 呼叫）
+import os
+import json
+import math
+import logging
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from prompt_templates import TICK_MIX
+from shared_state import SharedState
+from tick_context import TICK_SECONDS, current_tick
+import market_clock as clock
+
+# 免費方案的每日上限（tokens 為 None 表示只限請求數）；可用環境變數 JSON 覆寫，例如
+# GEMINI_DAILY_LIMITS='{"gemini-2.0-flash": {"requests": 1500}}'
+DAILY_LIMITS = {
+    "gemma-3-27b-it": {"requests": 14400, "tokens": None},
+    "gemini-2.0-flash": {"requests": 200, "tokens": None},
+    "gemini-2.0-flash-001": {"requests": 200, "tokens": None},
+}
+try:
+    for _model, _limit in json.loads(os.environ.get("GEMINI_DAILY_LIMITS", "{}")).items():
+        DAILY_LIMITS[_model] = {**DAILY_LIMITS.get(_model, {"requests": None, "tokens": None}), **_limit}
+except (ValueError, AttributeError, TypeError) as e:
+    logging.error(f"❌ GEMINI_DAILY_LIMITS 格式錯誤，使用預設額度: {e}")
+
+QUOTA_TZ = ZoneInfo("America/Los_Angeles")  # Gemini 額度在太平洋時間午夜重置
+SESSION_OPEN = (9, 0)                       # 台股巡檢時段（與排程一致）
+SESSION_CLOSE = (13, 35)
+RESERVE_CALLS = 6           # 保留給盤後美股分析 / 手動巡檢的請求數
+DEFAULT_DEMAND = sum(TICK_MIX.values())  # 尚無當天紀錄時，假設每次巡檢都要完整的 1 存股 + 3 網格
+DEFAULT_CALL_TOKENS = 1200  # 尚無紀錄時每次呼叫的估計 token（有 token 上限的模型才用得到）
+RATE_COOLDOWN = 60          # 429 後暫停該模型的秒數（多半是每分鐘上限）
+MAX_STRIKES = 3             # 連續 429 次數達此值視為當日額度用盡
+
+def _session_minutes(dt):
+    return (dt.hour - SESSION_OPEN[0]) * 60 + dt.minute - SESSION_OPEN[1]
+
+def _session_length():
+    return (SESSION_CLOSE[0] - SESSION_OPEN[0]) * 60 + SESSION_CLOSE[1] - SESSION_OPEN[1]
+
+def _next_reset(now):
+    """下一次額度重置（太平洋時間午夜）的 epoch 秒"""
+    local = now.astimezone(QUOTA_TZ)
+    midnight = datetime.combine(local.date() + timedelta(days=1), datetime.min.time(), QUOTA_TZ)
+    return midnight.timestamp()
+
+class AIBudget:
+    """
+    每日額度帳：
+    - 每個模型的請求數 / 估計 token / 429 冷卻，跨 worker 與重啟共享（STATE_DIR 下的共享狀態檔）
+    - 盤中依「今天每次巡檢實際要幾次 AI」推估剩餘需求，超過剩餘額度就只在每 N 次巡檢呼叫一次，
+      其餘巡檢由 ai_expert 沿用上次的 AI 判斷（或規則判斷）
+    """
+
+    def __init__(self, limits=None, name="ai_budget", state_dir=None, reserve=RESERVE_CALLS):
+        self.limits = limits or DAILY_LIMITS
+        self.reserve = reserve
+        self._local = {}
+        self._lock = threading.Lock()
+        try:
+            self._state = SharedState(name, default={}, state_dir=state_dir)
+        except OSError as e:
+            self._state = None
+            logging.warning(f"⚠️ 無法建立共享額度檔，改用行程內計數（重啟後歸零）: {e}")
+
+    # ---------- 狀態存取 ----------
+    def _fresh(self, state, now):
+        """換日（太平洋時間）就清空模型計數；盤中需求以台北日期另計"""
+        day = now.astimezone(QUOTA_TZ).strftime("%Y-%m-%d")
+        if state.get("day") != day:
+            state = {"day": day, "models": {}, "session": state.get("session", {})}
+        session_day = now.astimezone(clock.TW_TZ).strftime("%Y-%m-%d")
+        if state["session"].get("day") != session_day:
+            state["session"] = {"day": session_day, "wanted": 0, "first_tick": None, "last_tick": None,
+                                "skipped": {}, "stride": 1}
+        return state
+
+    def _update(self, fn):
+        now = clock.now(clock.TW_TZ)
+        def apply(state):
+            state = self._fresh(dict(state), now)
+            fn(state, now)
+            return state
+        if self._state is not None:
+            return self._state.update(apply)[1]
+        with self._lock:
+            self._local = apply(self._local)
+            return self._local
+
+    def _read(self):
+        now = clock.now(clock.TW_TZ)
+        state = self._state.snapshot()[1] if self._state is not None else self._local
+        return self._fresh(dict(state), now), now
+
+    # ---------- 模型額度 ----------
+    def _usable(self, model, usage, now_ts):
+        limit = self.limits.get(model, {})
+        if usage.get("blocked_until", 0) > now_ts:
+            return False
+        if limit.get("requests") is not None and usage.get("requests", 0) >= limit["requests"]:
+            return False
+        if limit.get("tokens") is not None and usage.get("tokens", 0) >= limit["tokens"]:
+            return False
+        return True
+
+    def usable(self, models):
+        """依序過濾出今天還能用的模型（冷卻中 / 用盡的直接跳過，不必再撞一次 429）"""
+        state, now = self._read()
+        return [m for m in models if self._usable(m, state["models"].get(m, {}), now.timestamp())]
+
+    def record(self, model, tokens=0, status=200):
+        """記錄一次請求；429 先冷卻，連續多次就封到下次額度重置"""
+        def apply(state, now):
+            usage = state["models"].setdefault(model, {"requests": 0, "tokens": 0, "strikes": 0, "blocked_until": 0})
+            if status == 429:
+                usage["strikes"] += 1
+                exhausted = usage["strikes"] >= MAX_STRIKES
+                usage["blocked_until"] = _next_reset(now) if exhausted else now.timestamp() + RATE_COOLDOWN
+                if exhausted:
+                    logging.warning(f"🪫 {model} 連續 {usage['strikes']} 次 429，今日不再使用")
+                return
+            usage["requests"] += 1
+            usage["tokens"] += int(tokens)
+            usage["strikes"] = 0
+        self._update(apply)
+
+    def _remaining_calls(self, state, now_ts):
+        """所有可用模型合計還能發出的請求數（有 token 上限的模型以平均每次 token 換算）"""
+        models = state["models"]
+        total_req = sum(u.get("requests", 0) for u in models.values())
+        per_call = sum(u.get("tokens", 0) for u in models.values()) / total_req if total_req else DEFAULT_CALL_TOKENS
+        left = 0
+        for model, limit in self.limits.items():
+            usage = models.get(model, {})
+            if not self._usable(model, usage, now_ts):
+                continue
+            if limit.get("requests") is None and limit.get("tokens") is None:
+                return math.inf
+            calls = [math.inf]
+            if limit.get("requests") is not None:
+                calls.append(limit["requests"] - usage.get("requests", 0))
+            if limit.get("tokens") is not None:
+                calls.append((limit["tokens"] - usage.get("tokens", 0)) // max(per_call, 1))
+            left += min(calls)
+        return left
+
+    # ---------- 盤中配給 ----------
+    def _plan(self, state, now):
+        """剩餘巡檢次數 × 每次巡檢需求 vs 剩餘額度 → 每 N 次巡檢呼叫一次"""
+        session = state["session"]
+        minutes = _session_minutes(now)
+        tick = minutes // (TICK_SECONDS // 60)
+        in_session = 0 <= minutes <= _session_length()
+        remaining_ticks = (_session_length() - minutes) // (TICK_SECONDS // 60) + 1 if in_session else 0
+        seen = session["last_tick"] - session["first_tick"] + 1 if session["first_tick"] is not None else 0
+        demand = session["wanted"] / seen if seen else DEFAULT_DEMAND
+        left = self._remaining_calls(state, now.timestamp())
+        spendable = left - self.reserve
+        needed = demand * remaining_ticks
+        if not in_session or needed <= 0 or spendable >= needed:
+            stride = 1
+        elif spendable < demand:
+            stride = None  # 連一次完整巡檢都不夠：盤中不再呼叫（保留額度給盤後 / 手動）
+        else:
+            stride = math.ceil(needed / spendable)
+        return {
+            "day": state["day"], "tick": tick, "remaining_ticks": remaining_ticks,
+            "demand_per_tick": round(demand, 2), "remaining_calls": left, "spendable": spendable,
+            "stride": stride, "skipped": sum(session["skipped"].values()),
+        }
+
+    def allow(self, kind):
+        """
+        這次巡檢的這個分析能不能呼叫 AI（kind: 提示詞種類，略過次數依此分類）
+        手動巡檢 / 盤後（沒有巡檢週期）只要還有可用模型就放行
+        """
+        verdict = {}
+
+        def apply(state, now):
+            session = state["session"]
+            left = self._remaining_calls(state, now.timestamp())
+            if current_tick() is None:
+                verdict["ok"] = left > 0
+                return
+            plan = self._plan(state, now)
+            tick, stride = plan["tick"], plan["stride"]
+            if session.get("decided_tick") != tick:
+                # 同一次巡檢的各個分析共用一個決定（不會只呼叫一半）；距上次呼叫滿 N 次巡檢才再呼叫
+                last_call = session.get("last_call_tick")
+                session["decided_tick"] = tick
+                session["tick_ok"] = stride is not None and (last_call is None or tick - last_call >= stride)
+                if session["tick_ok"]:
+                    session["last_call_tick"] = tick
+                if (stride == 1) != (session["stride"] == 1) or (stride is None) != (session["stride"] is None):
+                    logging.info(f"🧮 AI 額度配給：剩 {left} 次、尚有 {plan['remaining_ticks']} 次巡檢 → "
+                                 + ("每次巡檢呼叫" if stride == 1 else f"每 {stride} 次巡檢呼叫一次" if stride else "盤中暫停呼叫"))
+                session["stride"] = stride
+            session["wanted"] += 1
+            session["first_tick"] = tick if session["first_tick"] is None else min(session["first_tick"], tick)
+            session["last_tick"] = tick if session["last_tick"] is None else max(session["last_tick"], tick)
+            ok = left > 0 and session["tick_ok"]
+            if not ok:
+                session["skipped"][kind] = session["skipped"].get(kind, 0) + 1
+            verdict["ok"] = ok
+
+        self._update(apply)
+        return verdict["ok"]
+
+    def plan(self):
+        state, now = self._read()
+        return self._plan(state, now)
+
+    def summary(self):
+        """儀表板用：各模型已用 / 上限 / 剩餘，加上目前的配給"""
+        state, now = self._read()
+        models = {}
+        for model, limit in self.limits.items():
+            usage = state["models"].get(model, {})
+            models[model] = {
+                "requests": usage.get("requests", 0), "request_limit": limit.get("requests"),
+                "tokens": usage.get("tokens", 0), "token_limit": limit.get("tokens"),
+                "available": self._usable(model, usage, now.timestamp()),
+            }
+        return {"models": models, "plan": self._plan(state, now)}
+
+def format_budget(summary):
+    """首頁用的一行額度摘要"""
+    parts = []
+    for model, u in summary["models"].items():
+        limit = u["request_limit"]
+        used = f"{u['requests']}/{limit}" if limit is not None else f"{u['requests']}"
+        parts.append(f"{model} {used}{'' if u['available'] else '（暫停）'}")
+    plan = summary["plan"]
+    stride = plan["stride"]
+    ration = "盤中暫停呼叫" if stride is None else ("每次巡檢" if stride == 1 else f"每 {stride} 次巡檢")
+    return f"{' ｜ '.join(parts)} ｜ 配給：{ration}（今日已略過 {plan['skipped']} 次）"
+
+BUDGET = AIBudget()
+
+# === 模擬：額度吃緊時，一整個盤中時段的呼叫分配 ===
+if __name__ == "__main__":
+    import tempfile
+    from tick_context import TickContext, tick_scope
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for daily in (14400, 120, 40):
+        limits = {"gemma-3-27b-it": {"requests": daily, "tokens": None}}
+        with tempfile.TemporaryDirectory() as tmp:
+            budget = AIBudget(limits, state_dir=tmp)
+            sim = clock.SimClock(datetime(2026, 10, 19, 9, 0))
+            calls = ticks_called = 0
+            with clock.use_clock(sim):
+                while _session_minutes(clock.now()) <= _session_length():
+                    with tick_scope(TickContext(label=clock.now().strftime("%H:%M"))):
+                        allowed = [budget.allow(kind) for kind, n in TICK_MIX.items() for _ in range(n)]
+                    for ok in allowed:
+                        if ok:
+                            budget.record("gemma-3-27b-it", tokens=900)
+                    calls += sum(allowed)
+                    ticks_called += any(allowed)
+                    sim.advance(TICK_SECONDS)
+                summary = budget.summary()
+            total_ticks = _session_length() // (TICK_SECONDS // 60) + 1
+            print(f"📊 每日上限 {daily}: {total_ticks} 次巡檢中 {ticks_called} 次呼叫 AI，共 {calls} 次請求，"
+                  f"盤後剩 {summary['plan']['remaining_calls']} 次")
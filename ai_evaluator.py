@@ -0,0 +1,195 @@
+# ai_evaluator.py - AI 決策準確度評估（命中率 / 信心校準 / Brier 分數，全向量化）
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+from report_archive import ARCHIVE, TW_TZ
+
+HORIZONS = (1, 5, 20)
+# 報酬落在 ±FLAT_BAND*sqrt(h) 內視為「震盪 / 觀望」正確
+FLAT_BAND = 0.005
+# 市場層級判斷對應的驗證標的（美股預測台股明日方向 → 加權指數）
+EVAL_TARGET = {"US_MARKET": "^TWII"}
+# 預設只評估模型實際給出的判斷（規則 / 快取 / 備用解析 / 失敗預設值不算 AI 的成績）
+EVAL_ORIGINS = ("ai",)
+# 台股收盤時間（台灣時間），決策之後第一個收盤為 h=1
+CLOSE_HOUR, CLOSE_MINUTE = 13, 30
+
+# === 決策文字 → 預期方向（+1 看漲 / -1 看跌或等回檔 / 0 中性；依序比對關鍵字）===
+_DIRECTION_RULES = (
+    ("回檔", -1), ("觀望", 0), ("震盪", 0), ("中性", 0),
+    ("等待", -1), ("下跌", -1), ("空頭", -1),
+    ("買進", 1), ("積極", 1), ("立即", 1), ("定期定額", 1), ("上漲", 1), ("多頭", 1),
+)
+
+def decision_direction(decisions):
+    """把決策字串陣列轉成方向陣列（依唯一值對應，不逐列比對）"""
+    values = np.asarray(decisions, dtype=str)
+    uniq, inv = np.unique(values, return_inverse=True)
+    mapped = np.full(len(uniq), np.nan)
+    for i, text in enumerate(uniq):
+        for keyword, direction in _DIRECTION_RULES:
+            if keyword in text:
+                mapped[i] = direction
+                break
+    return mapped[inv]
+
+def _close_timestamps(index):
+    """交易日 → 收盤時間 (UTC 毫秒)"""
+    days = pd.DatetimeIndex(index)
+    if days.tz is not None:
+        days = days.tz_localize(None)
+    closes = (days.normalize() + pd.Timedelta(hours=CLOSE_HOUR, minutes=CLOSE_MINUTE)).tz_localize(TW_TZ)
+    return closes.asi8 // 1_000_000
+
+def forward_returns(decisions, closes, horizons=HORIZONS):
+    """
+    一次 gather 算出所有決策在各週期的前瞻報酬
+    decisions: 需含 ts / symbol / price 欄位（price 可為 NaN）
+    closes: 日線收盤價矩陣（index=交易日, columns=標的）
+    回傳 shape = (決策數, 週期數) 的報酬矩陣，資料不足處為 NaN
+    """
+    panel = closes.to_numpy(dtype="f8")
+    n_days = panel.shape[0]
+    close_ts = _close_timestamps(closes.index)
+
+    ts = decisions["ts"]
+    ts_ms = ts.astype("int64").to_numpy() // 1_000_000 if hasattr(ts, "dt") else np.asarray(ts, dtype="i8")
+    symbols = decisions["symbol"].map(lambda s: EVAL_TARGET.get(s, s))
+    col = pd.Index(closes.columns).get_indexer(symbols)
+
+    # 決策之後的第一個收盤
+    anchor = np.searchsorted(close_ts, ts_ms, side="right")
+    valid = (col >= 0) & (anchor >= 1)
+    safe_col = np.where(valid, col, 0)
+
+    # 基準價：決策當下價格，沒有則用決策前最後一個收盤
+    base = decisions["price"].to_numpy(dtype="f8") if "price" in decisions else np.full(len(decisions), np.nan)
+    prev_close = panel[np.clip(anchor - 1, 0, n_days - 1), safe_col]
+    base = np.where(np.isnan(base), prev_close, base)
+
+    h = np.asarray(horizons)
+    fwd_idx = anchor[:, None] + h[None, :] - 1
+    in_range = valid[:, None] & (fwd_idx < n_days)
+    fwd = panel[np.clip(fwd_idx, 0, n_days - 1), safe_col[:, None]]
+    out = fwd / base[:, None] - 1
+    out[~in_range] = np.nan
+    return out
+
+def evaluate(decisions, closes, horizons=HORIZONS, flat_band=FLAT_BAND):
+    """
+    計算各 (來源, 標的, 週期) 的命中率、平均信心、Brier 分數，以及信心校準表
+    decisions 含 origin 欄時另依判斷來源分組
+    回傳 {"summary": DataFrame, "calibration": DataFrame}
+    """
+    direction = decision_direction(decisions["decision"])
+    conf = np.clip(pd.to_numeric(decisions["confidence"], errors="coerce").to_numpy(dtype="f8") / 100, 0, 1)
+    rets = forward_returns(decisions, closes, horizons)
+
+    band = flat_band * np.sqrt(np.asarray(horizons, dtype="f8"))[None, :]
+    d = direction[:, None]
+    hit = np.where(d > 0, rets > 0, np.where(d < 0, rets < 0, np.abs(rets) <= band)).astype("f8")
+    usable = ~np.isnan(rets) & ~np.isnan(d) & ~np.isnan(conf)[:, None]
+    hit[~usable] = np.nan
+
+    # 以群組代碼 + bincount 彙總（不逐群組迴圈）
+    keys = ["source", "symbol"] + (["origin"] if "origin" in decisions else [])
+    groups = pd.MultiIndex.from_arrays([decisions[k].to_numpy() for k in keys], names=keys)
+    codes, uniq = pd.factorize(groups)
+    n_groups = len(uniq)
+    rows = []
+    for j, horizon in enumerate(horizons):
+        ok = usable[:, j]
+        c, hj, pj = codes[ok], hit[ok, j], conf[ok]
+        n = np.bincount(c, minlength=n_groups)
+        hits = np.bincount(c, weights=hj, minlength=n_groups)
+        conf_sum = np.bincount(c, weights=pj, minlength=n_groups)
+        brier = np.bincount(c, weights=(pj - hj) ** 2, minlength=n_groups)
+        ret_sum = np.bincount(c, weights=rets[ok, j], minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for g, group in enumerate(uniq):
+                rows.append({
+                    **dict(zip(keys, group)), "horizon": horizon, "n": int(n[g]),
+                    "hit_rate": hits[g] / n[g], "avg_confidence": conf_sum[g] / n[g],
+                    "brier": brier[g] / n[g], "avg_return": ret_sum[g] / n[g],
+                })
+    summary = pd.DataFrame(rows)
+
+    # 信心校準：每 10 分一格，比較平均信心與實際命中率
+    bins = np.minimum(np.nan_to_num(conf * 10).astype("i8"), 9)
+    calib = []
+    for j, horizon in enumerate(horizons):
+        ok = usable[:, j]
+        b = bins[ok]
+        n = np.bincount(b, minlength=10)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            calib.append(pd.DataFrame({
+                "horizon": horizon,
+                "bin": [f"{i * 10}-{i * 10 + 10}" for i in range(10)],
+                "n": n,
+                "avg_confidence": np.bincount(b, weights=conf[ok], minlength=10) / n,
+                "hit_rate": np.bincount(b, weights=hit[ok, j], minlength=10) / n,
+            }))
+    calibration = pd.concat(calib, ignore_index=True)
+    calibration = calibration[calibration["n"] > 0].reset_index(drop=True)
+    return {"summary": summary, "calibration": calibration}
+
+def load_close_panel(symbols, period="2y"):
+    """一次下載多標的日線收盤價，組成價格矩陣"""
+    import yfinance as yf
+    df = yf.download(list(symbols), period=period, interval="1d", progress=False)["Close"]
+    if isinstance(df, pd.Series):
+        df = df.to_frame(list(symbols)[0])
+    return df.sort_index().ffill()
+
+def evaluate_archive(start, end=None, horizons=HORIZONS, closes=None, origins=EVAL_ORIGINS):
+    """
+    從巡檢歸檔讀出決策並評估（closes 未提供時自動下載）
+    origins: 只評估這些判斷來源；None 為全部並依來源分組（加入 origin 欄之前的舊紀錄來源為空字串）
+    """
+    decisions = ARCHIVE.query(start, end, columns=["source", "symbol", "price", "decision", "confidence", "origin"])
+    decisions = decisions[decisions["decision"] != ""]
+    if origins is not None:
+        decisions = decisions[decisions["origin"].isin(origins)]
+    if decisions.empty:
+        logging.warning("⚠️ 區間內沒有可評估的 AI 決策")
+        return None
+    if closes is None:
+        symbols = sorted({EVAL_TARGET.get(s, s) for s in decisions["symbol"].unique()})
+        closes = load_close_panel(symbols)
+    return evaluate(decisions, closes, horizons)
+
+# === 效能量測：一年份 3 分鐘決策 ===
+if __name__ == "__main__":
+    rng = np.random.default_rng(7)
+    symbols = ["009816.TW", "00929.TW", "2317.TW", "00878.TW", "^TWII"]
+    days = pd.bdate_range("2025-10-01", periods=280)
+    closes = pd.DataFrame(
+        100 * np.exp(np.cumsum(rng.normal(0, 0.01, (len(days), len(symbols))), axis=0)),
+        index=days, columns=symbols,
+    )
+
+    # 每個交易日 09:00~13:30 每 3 分鐘，4 個標的各一筆決策
+    ticks = pd.DatetimeIndex(np.concatenate([
+        (d + pd.Timedelta(hours=9) + pd.to_timedelta(np.arange(0, 271, 3), unit="min")).to_numpy()
+        for d in days[:250]
+    ])).tz_localize(TW_TZ)
+    n = len(ticks) * 4
+    decisions = pd.DataFrame({
+        "ts": np.repeat(ticks, 4),
+        "source": np.tile(["taiwan_stock", "grid", "grid", "grid"], len(ticks)),
+        "symbol": np.tile(symbols[:4], len(ticks)),
+        "price": np.nan,
+        "decision": rng.choice(["積極買進", "定期定額", "觀望等待", "立即買進", "等待回檔", "觀望"], n),
+        "confidence": rng.integers(40, 95, n),
+        "origin": rng.choice(["ai", "cached", "rule"], n, p=[0.6, 0.3, 0.1]),
+    })
+
+    decisions = decisions[decisions["origin"].isin(EVAL_ORIGINS)]
+    t0 = time.perf_counter()
+    result = evaluate(decisions, closes)
+    elapsed = time.perf_counter() - t0
+    print(f"⚡ 評估 {len(decisions):,} 筆 AI 決策 × {len(HORIZONS)} 週期：{elapsed:.2f} 秒")
+    print(result["summary"].round(3).to_string(index=False))
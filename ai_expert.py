@@ -5,13 +5,32 @@ import json
 import time
 import re
 import logging
-from datetime import datetime
+
+from prompt_templates import estimate_tokens, render, shared_us_context
+from ai_budget import BUDGET
+from shared_state import SharedState
+from scoring_config import action_level, load_scoring
+from tick_context import current_tick, degrade, request_timeout
+import market_clock as clock
 
 # === 設定 logging ===
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
 # === AI 冷卻 / Cache ===
-AI_CACHE = {}
+AI_CACHE = {}           # (分析類型, 標的) → (時間 HH:MM, 上次成功的判斷)；時間預算不足時沿用
+AI_MIN_SECONDS = 10     # 巡檢剩餘預算低於此秒數就不再發出新的 API 請求
+
+# === 判斷來源（origin，隨結果寫入歸檔；準確度評估預設只看 "ai"）===
+# ai: 模型回傳完整 JSON / rescued: 備用解析拼湊 / cached: 沿用先前的判斷
+# rule: 規則判斷 / error: API 失敗的預設值 / none: AI 未啟用
+ORIGINS = ("ai", "rescued", "cached", "rule", "error", "none")
+
+# === API 端點設定（可指向本地 stub 做離線量測）===
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+# 串流模式：收到完整 JSON 即中斷，不等整段 maxOutputTokens 生成完
+GEMINI_STREAM = os.environ.get("GEMINI_STREAM", "1") != "0"
+# 共用連線池：同一台主機的 TLS 連線重複使用（開盤前暖機時先建立）
+_SESSION = requests.Session()
 
 # === 全域變數：儲存美股分析結果 ===
 US_MARKET_SENTIMENT = {
@@ -23,15 +42,94 @@ US_MARKET_SENTIMENT = {
     "next_day_prediction": "震盪"
 }
 
-def _call_gemini_api(prompt, debug=False):
+# === 跨行程共享：所有 worker / 子行程讀同一份美股情緒 ===
+try:
+    _US_STATE = SharedState("us_sentiment", default=US_MARKET_SENTIMENT)
+except OSError as e:
+    _US_STATE = None
+    logging.warning(f"⚠️ 無法建立共享美股情緒檔，改用行程內變數: {e}")
+
+def _publish_us_sentiment(sentiment):
+    global US_MARKET_SENTIMENT
+    US_MARKET_SENTIMENT = sentiment
+    if _US_STATE is not None:
+        _US_STATE.publish(sentiment)
+
+class _JsonStreamScanner:
     """
-    統一的 Gemini API 呼叫函式（使用已驗證的配置）
+    增量 JSON 掃描器：逐段餵入文字，第一個完整且可解析的 JSON 物件出現時回傳
+    （會略過 Markdown 標記與物件前後的多餘文字）
     """
-    gemini_key = os.environ.get("GEMINI_API_KEY")
-    if not gemini_key:
-        logging.error("❌ 未設定 GEMINI_API_KEY")
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, piece):
+        self.text += piece
+        text = self.text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            self._pos += 1
+            if self._start < 0:
+                if ch == "{":
+                    self._start, self._depth = self._pos - 1, 1
+                continue
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        return json.loads(text[self._start:self._pos])
+                    except json.JSONDecodeError:
+                        # 不是合法物件，從下一個 '{' 重新找
+                        self._pos, self._start = self._start + 1, -1
         return None
 
+def _stream_gemini(api_url, payload, debug=False):
+    """
+    串流呼叫 streamGenerateContent（SSE），完整 JSON 到齊即關閉連線取消後續生成
+    回傳 (status_code, 累積文字, 解析結果或 None)
+    """
+    scanner = _JsonStreamScanner()
+    with _SESSION.post(api_url, json=payload, timeout=request_timeout(25), stream=True) as res:
+        if res.status_code != 200:
+            return res.status_code, "", None
+        res.encoding = "utf-8"  # SSE 未帶 charset 時 requests 會誤判為 latin-1
+        for line in res.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            chunk = json.loads(line[5:])
+            candidates = chunk.get("candidates") or [{}]
+            parts = candidates[0].get("content", {}).get("parts", [])
+            result = scanner.feed("".join(p.get("text", "") for p in parts))
+            if result is not None:
+                if debug:
+                    logging.info(f"✂️ 已收到完整 JSON，提前結束串流（{len(scanner.text)} 字）")
+                return 200, scanner.text, result
+    return 200, scanner.text, None
+
+def _build_payload(model_name, prompt, system_context=None):
+    """
+    組裝請求內容：共用情境在支援 systemInstruction 的模型走系統指令，
+    gemma 系列不支援系統指令，改併入提示詞開頭
+    """
+    if system_context and model_name.startswith("gemma"):
+        prompt = f"{system_context}\n\n{prompt}"
     payload = {
         "contents": [{"parts": [{"text": prompt}]}],
         "generationConfig": {
@@ -41,6 +139,23 @@ def _call_gemini_api(prompt, debug=False):
             "maxOutputTokens": 2048  # 提高輸出長度以容納深度思考
         }
     }
+    if system_context and not model_name.startswith("gemma"):
+        payload["systemInstruction"] = {"parts": [{"text": system_context}]}
+    return payload
+
+def _call_gemini_api(prompt, debug=False, stream=None, system_context=None):
+    """
+    統一的 Gemini API 呼叫函式（使用已驗證的配置）
+    stream=None 時依 GEMINI_STREAM 設定決定是否走串流端點
+    system_context: 各次呼叫共用的情境段落（美股參考）
+    """
+    gemini_key = os.environ.get("GEMINI_API_KEY")
+    if not gemini_key:
+        logging.error("❌ 未設定 GEMINI_API_KEY")
+        return None
+
+    if stream is None:
+        stream = GEMINI_STREAM
 
     # 使用已驗證可用的模型
     # gemma-3-27b-it: 你驗證過可正常運作（主力）
@@ -50,28 +165,53 @@ def _call_gemini_api(prompt, debug=False):
         "gemini-2.0-flash",      # 備援：Gemini 2.0
         "gemini-2.0-flash-001"   # 備援：Gemini 2.0 穩定版
     ]
+    # 今日額度用盡 / 429 冷卻中的模型直接跳過
+    models_to_try = BUDGET.usable(models_to_try)
+    if not models_to_try:
+        logging.warning("🪫 今日 Gemini 額度已用盡，改用快取 / 規則判斷")
+        return None
+    prompt_tokens = estimate_tokens(prompt) + estimate_tokens(system_context)
 
     for model_name in models_to_try:
+        payload = _build_payload(model_name, prompt, system_context)
         for attempt in range(2):
+            tick = current_tick()
+            if tick is not None and tick.remaining() < AI_MIN_SECONDS:
+                logging.warning(f"⏳ 巡檢時間預算剩 {tick.remaining():.0f}s，停止呼叫 AI")
+                return None
             try:
                 # 使用 v1beta 端點（已驗證）
-                api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={gemini_key}"
+                t0 = time.perf_counter()
                 
                 if debug:
-                    logging.info(f"🔄 嘗試使用 {model_name}...")
+                    logging.info(f"🔄 嘗試使用 {model_name}{'（串流）' if stream else ''}...")
 
-                res = requests.post(api_url, json=payload, timeout=25)
+                if stream:
+                    api_url = f"{GEMINI_API_BASE}/models/{model_name}:streamGenerateContent?alt=sse&key={gemini_key}"
+                    status, text, result = _stream_gemini(api_url, payload, debug)
+                else:
+                    api_url = f"{GEMINI_API_BASE}/models/{model_name}:generateContent?key={gemini_key}"
+                    res = _SESSION.post(api_url, json=payload, timeout=request_timeout(25))
+                    status, result = res.status_code, None
 
-                if res.status_code == 429:
+                if status == 429:
                     logging.warning(f"⚠️ 模型 {model_name} 額度耗盡，嘗試下一個...")
+                    BUDGET.record(model_name, status=429)
                     break
 
-                if res.status_code != 200:
-                    logging.error(f"❌ {model_name} 錯誤 ({res.status_code})")
+                if status != 200:
+                    logging.error(f"❌ {model_name} 錯誤 ({status})")
                     break
 
-                data = res.json()
-                text = data["candidates"][0]["content"]["parts"][0]["text"]
+                elapsed_ms = (time.perf_counter() - t0) * 1000
+                if not stream:
+                    data = res.json()
+                    text = data["candidates"][0]["content"]["parts"][0]["text"]
+                BUDGET.record(model_name, prompt_tokens + estimate_tokens(text))
+
+                if result is not None:
+                    logging.info(f"✅ 成功使用 {model_name} 完成分析（串流 {elapsed_ms:.0f}ms）")
+                    return result
                 
                 if debug:
                     logging.info(f"📥 原始回應（前200字）: {text[:200]}")
@@ -85,7 +225,7 @@ def _call_gemini_api(prompt, debug=False):
                 # 嘗試解析 JSON
                 try:
                     result = json.loads(text)
-                    logging.info(f"✅ 成功使用 {model_name} 完成分析")
+                    logging.info(f"✅ 成功使用 {model_name} 完成分析（{elapsed_ms:.0f}ms）")
                     return result
                 except json.JSONDecodeError as e:
                     logging.warning(f"⚠️ JSON 解析失敗: {str(e)[:100]}")
@@ -101,9 +241,17 @@ def _call_gemini_api(prompt, debug=False):
 
     return None
 
+def warm_connection():
+    """開盤前暖機：列出模型（不耗生成額度）順便把 TLS 連線放進連線池"""
+    gemini_key = os.environ.get("GEMINI_API_KEY")
+    if not gemini_key:
+        return False
+    res = _SESSION.get(f"{GEMINI_API_BASE}/models?pageSize=1&key={gemini_key}", timeout=10)
+    return res.status_code == 200
+
 def _rescue_json(text):
     """備用 JSON 解析器 - 強化版"""
-    result = {"decision": "觀望", "confidence": 50, "reason": "解析錯誤"}
+    result = {"decision": "觀望", "confidence": 50, "reason": "解析錯誤", "origin": "rescued"}
     try:
         # 嘗試多種提取模式
         # 模式 1: 標準 JSON 格式
@@ -141,64 +289,79 @@ def _rescue_json(text):
         return result
     except Exception as e:
         logging.error(f"❌ 備用解析失敗: {e}")
-        return {"decision": "觀望", "confidence": 50, "reason": "資料格式異常"}
+        return {"decision": "觀望", "confidence": 50, "reason": "資料格式異常", "origin": "rescued"}
+
+def _rule_taiwan(extra_data):
+    """規則判斷：依系統評分（與 monitor_009816 系統建議同一套門檻）"""
+    try:
+        score = float(str(extra_data.get("score", "")).split("/")[0])
+    except ValueError:
+        score = 0
+    decision = ("觀望等待", "定期定額", "積極佈局")[int(action_level(score, load_scoring()))]
+    return {"decision": decision, "confidence": 50, "reason": f"規則判斷：系統評分 {score:g}/100", "origin": "rule"}
+
+def _rule_grid(extra_data):
+    """規則判斷：依趨勢矩陣與 RSI"""
+    trend = str(extra_data.get("trend", ""))
+    try:
+        rsi = float(extra_data.get("rsi", 50))
+    except (TypeError, ValueError):
+        rsi = 50.0
+    if "超跌" in trend or rsi < 30:
+        decision = "分批買進"
+    elif "空頭" in trend:
+        decision = "觀望"
+    else:
+        decision = "等待回檔"
+    return {"decision": decision, "confidence": 50, "reason": f"規則判斷：{trend or '趨勢未知'}，RSI {rsi:.1f}",
+            "origin": "rule"}
+
+def _remember(key, result):
+    AI_CACHE[key] = (clock.now().strftime("%H:%M"), result)
+    return result
+
+def _fallback(key, rule):
+    """巡檢時間預算不足 / 額度配給略過：沿用上次的 AI 判斷，沒有就用規則判斷"""
+    cached = AI_CACHE.get(key)
+    if cached is None:
+        return rule
+    at, result = cached
+    return {**result, "reason": f"{result['reason']}（沿用 {at} 的 AI 判斷）", "origin": "cached"}
 
 def analyze_us_market(extra_data, debug=False):
     """
     階段一：美股盤後綜合分析
     產生市場情緒指標供台股參考
     """
-    global US_MARKET_SENTIMENT
-
-    prompt = f"""你是專業美股分析師，請深度分析今日盤後數據並預測台股明日開盤。
-
-美股數據：
-- 標普500: {extra_data.get('spx', 'N/A')}
-- 那斯達克: {extra_data.get('nasdaq', 'N/A')}
-- 台積電ADR: {extra_data.get('tsm', 'N/A')}
-- 技術面: {extra_data.get('tech', 'N/A')}
-
-分析步驟：
-1. 評估美股整體情緒（多頭/空頭/中性）
-2. 分析科技股動能強度（0-100）
-3. 判斷台積電ADR表現對台股的影響
-4. 預測台股明日開盤方向（上漲/下跌/震盪）
-5. 給出投資建議
-
-請輸出 JSON（不要包含 Markdown 標記）：
-{{
-  "sentiment": "多頭/空頭/中性",
-  "strength": 75,
-  "tsm_trend": "強勢/弱勢/持平",
-  "next_day": "上漲/下跌/震盪",
-  "reason": "詳細解釋原因（100字內）"
-}}"""
+    prompt = render("us_market", extra_data)
 
     result = _call_gemini_api(prompt, debug)
     
     if result:
-        # 更新全域市場情緒
-        US_MARKET_SENTIMENT = {
+        # 更新全域市場情緒（同步寫入共享狀態）
+        _publish_us_sentiment({
             "analyzed": True,
             "sentiment": result.get("sentiment", "中性"),
             "strength": result.get("strength", 50),
             "tsm_trend": result.get("tsm_trend", "持平"),
             "tech_outlook": result.get("reason", ""),
             "next_day_prediction": result.get("next_day", "震盪")
-        }
+        })
         
         return {
             "decision": result.get("next_day", "震盪"),
             "confidence": result.get("strength", 50),
-            "reason": result.get("reason", "美股分析完成")
+            "reason": result.get("reason", "美股分析完成"),
+            "origin": result.get("origin", "ai")
         }
     else:
         # API 失敗時的備用值
-        US_MARKET_SENTIMENT["analyzed"] = True
+        _publish_us_sentiment({**get_us_market_sentiment(), "analyzed": True})
         return {
             "decision": "震盪",
             "confidence": 50,
-            "reason": "美股數據分析異常"
+            "reason": "美股數據分析異常",
+            "origin": "error"
         }
 
 def analyze_taiwan_stock(extra_data, target_name="台股標的", debug=False):
@@ -206,49 +369,30 @@ def analyze_taiwan_stock(extra_data, target_name="台股標的", debug=False):
     階段二：台股存股分析
     結合美股情緒進行判斷
     """
-    us_sentiment = US_MARKET_SENTIMENT if US_MARKET_SENTIMENT["analyzed"] else {"next_day_prediction": "未知", "sentiment": "未知"}
+    current = get_us_market_sentiment()
+    us_sentiment = current if current["analyzed"] else {"next_day_prediction": "未知", "sentiment": "未知"}
 
-    prompt = f"""你是專業存股經理人，請深度分析台股標的「{target_name}」。
+    key = ("taiwan_stock", target_name)
+    if degrade("ai_fallback") or not BUDGET.allow("taiwan_stock"):
+        return _fallback(key, _rule_taiwan(extra_data))
 
-技術數據：
-{extra_data.get('tech_summary', 'N/A')}
+    prompt = render("taiwan_stock", extra_data, target_name=target_name)
 
-美股參考（昨日盤後）：
-- 市場情緒: {us_sentiment.get('sentiment', '未知')}
-- 台積電ADR: {us_sentiment.get('tsm_trend', '未知')}
-- 明日預測: {us_sentiment.get('next_day_prediction', '未知')}
-
-存股策略評估：
-1. 系統評分: {extra_data.get('score', 'N/A')}
-2. 價格位階: {extra_data.get('position', 'N/A')}
-3. 長期展望: {extra_data.get('outlook', 'N/A')}
-
-分析步驟：
-1. 考量美股開盤方向（可能高開/低開/平盤）
-2. 評估當前價格位階（低檔適合積極/高檔宜觀望）
-3. 結合技術面與基本面
-4. 給出今日開盤策略
-
-請輸出 JSON（不要包含 Markdown 標記）：
-{{
-  "decision": "積極買進/定期定額/觀望等待",
-  "confidence": 70,
-  "reason": "詳細解釋原因，並告知現在是否該進場（100字內，需說明美股影響）"
-}}"""
-
-    result = _call_gemini_api(prompt, debug)
+    result = _call_gemini_api(prompt, debug, system_context=shared_us_context(us_sentiment))
     
     if result:
-        return {
+        return _remember(key, {
             "decision": result.get("decision", "觀望"),
             "confidence": result.get("confidence", 50),
-            "reason": result.get("reason", "分析完成")
-        }
+            "reason": result.get("reason", "分析完成"),
+            "origin": result.get("origin", "ai")
+        })
     else:
         return {
             "decision": "觀望",
             "confidence": 50,
-            "reason": "AI 分析異常"
+            "reason": "AI 分析異常",
+            "origin": "error"
         }
 
 def analyze_grid_trading(extra_data, target_name="網格標的", debug=False):
@@ -256,53 +400,37 @@ def analyze_grid_trading(extra_data, target_name="網格標的", debug=False):
     階段三：網格交易分析
     結合美股情緒進行判斷
     """
-    us_sentiment = US_MARKET_SENTIMENT if US_MARKET_SENTIMENT["analyzed"] else {"next_day_prediction": "未知"}
-
-    prompt = f"""你是網格交易專家，請深度分析「{target_name}」的網格策略。
-
-技術面：
-- 現價: {extra_data.get('price', 'N/A')}
-- 趨勢: {extra_data.get('trend', 'N/A')}
-- RSI: {extra_data.get('rsi', 'N/A')}
-- 補倉點: {extra_data.get('grid_buy', 'N/A')}
-
-美股參考（昨日盤後）：
-- 明日預測: {us_sentiment.get('next_day_prediction', '未知')}
-- 台積電ADR: {us_sentiment.get('tsm_trend', '未知')}
-
-分析步驟：
-1. 判斷美股對台股開盤的影響
-   - 美股偏多 → 台股可能高開 → 是否等回檔
-   - 美股偏空 → 台股可能低開 → 是否提早佈局
-2. 評估 RSI 超買/超賣狀態
-3. 結合趨勢與補倉點
-4. 給出今日策略
-
-請輸出 JSON（不要包含 Markdown 標記）：
-{{
-  "decision": "立即買進/等待回檔/觀望",
-  "confidence": 65,
-  "reason": "詳細解釋原因，並告知現在是否該進場（100字內，需說明美股影響）"
-}}"""
+    current = get_us_market_sentiment()
+    us_sentiment = current if current["analyzed"] else {"next_day_prediction": "未知"}
 
-    result = _call_gemini_api(prompt, debug)
+    key = ("grid_trading", target_name)
+    if degrade("ai_fallback") or not BUDGET.allow("grid_trading"):
+        return _fallback(key, _rule_grid(extra_data))
+
+    prompt = render("grid_trading", extra_data, target_name=target_name)
+
+    result = _call_gemini_api(prompt, debug, system_context=shared_us_context(us_sentiment))
     
     if result:
-        return {
+        return _remember(key, {
             "decision": result.get("decision", "觀望"),
             "confidence": result.get("confidence", 50),
-            "reason": result.get("reason", "分析完成")
-        }
+            "reason": result.get("reason", "分析完成"),
+            "origin": result.get("origin", "ai")
+        })
     else:
         return {
             "decision": "觀望",
             "confidence": 50,
-            "reason": "AI 分析異常"
+            "reason": "AI 分析異常",
+            "origin": "error"
         }
 
 def get_us_market_sentiment():
-    """取得當前美股市場情緒（供台股模組使用）"""
-    return US_MARKET_SENTIMENT
+    """取得當前美股市場情緒（供台股模組使用；跨行程共享的最新快照）"""
+    if _US_STATE is None:
+        return dict(US_MARKET_SENTIMENT)
+    return _US_STATE.snapshot()[1]
 
 # === 向後相容的舊函式 ===
 def get_ai_point(target_name=None, strategy_type=None, extra_data=None, debug=False, **kwargs):
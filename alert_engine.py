@@ -0,0 +1,147 @@
+# alert_engine.py - 盤中事件觸發引擎（有事才通報，固定時點才發完整報告）
+import time
+
+import numpy as np
+
+import market_clock as clock
+
+RSI_BANDS = (30, 70)                    # 超賣 / 中性 / 超買
+POSITION_BANDS = (0.2, 0.4, 0.6, 0.8)   # 009816 價格位階分檔（0.4 為系統評分門檻）
+CHECKPOINTS = ("09:00", "11:00", "13:30")
+
+class AlertEngine:
+    """
+    每個巡檢週期把所有標的的最新狀態組成陣列，與上一週期一次比對：
+    - 價格穿越補倉點 grid_buy / 月低 month_low
+    - 趨勢矩陣狀態改變
+    - RSI 穿越 30 / 70
+    - 009816 價格位階換檔
+    只有條件成立才產生通報；完整報告只在固定時點（CHECKPOINTS）發送
+    """
+
+    def __init__(self, rsi_bands=RSI_BANDS, position_bands=POSITION_BANDS, checkpoints=CHECKPOINTS):
+        self.rsi_bands = np.asarray(rsi_bands, dtype="f8")
+        self.position_bands = np.asarray(position_bands, dtype="f8")
+        self.checkpoints = tuple(checkpoints)
+        self._symbols = None
+        self._prev = None
+        self._trend_codes = {}
+        self._trend_names = []
+        self._fired = {}  # 日期 → 已發送的時點
+
+    def _trend_code(self, trends):
+        codes = np.empty(len(trends), dtype="i4")
+        for i, t in enumerate(trends):
+            code = self._trend_codes.get(t)
+            if code is None:
+                code = self._trend_codes[t] = len(self._trend_names)
+                self._trend_names.append(t)
+            codes[i] = code
+        return codes
+
+    def evaluate(self, symbols, price, grid_buy=None, month_low=None, rsi=None, trend=None, position=None):
+        """
+        輸入為同長度的序列（缺值用 NaN / None），回傳觸發的通報清單
+        [(symbol, kind, message), ...]；第一次呼叫只建立基準不通報
+        """
+        n = len(symbols)
+        nan = np.full(n, np.nan)
+        cur = {
+            "price": np.asarray(price, dtype="f8"),
+            "grid_buy": nan if grid_buy is None else np.asarray(grid_buy, dtype="f8"),
+            "month_low": nan if month_low is None else np.asarray(month_low, dtype="f8"),
+            "rsi": nan if rsi is None else np.asarray(rsi, dtype="f8"),
+            "position": nan if position is None else np.asarray(position, dtype="f8"),
+            "trend": np.full(n, -1, dtype="i4") if trend is None else self._trend_code(trend),
+        }
+
+        prev = self._align(list(symbols))
+        self._symbols, self._prev = list(symbols), cur
+        if prev is None:
+            return []
+
+        p0, p1 = prev["price"], cur["price"]
+        alerts = []
+
+        for level_key, label in (("grid_buy", "補倉點"), ("month_low", "月低")):
+            level = cur[level_key]
+            crossed = np.sign(p0 - level) * np.sign(p1 - level) < 0
+            for i in np.flatnonzero(crossed):
+                arrow = "跌破" if p1[i] < level[i] else "站回"
+                alerts.append((symbols[i], level_key, f"{arrow}{label} `{level[i]:.2f}`（現價 `{p1[i]:.2f}`）"))
+
+        changed = (prev["trend"] != cur["trend"]) & (prev["trend"] >= 0) & (cur["trend"] >= 0)
+        for i in np.flatnonzero(changed):
+            alerts.append((symbols[i], "trend",
+                           f"趨勢轉換 {self._trend_names[prev['trend'][i]]} → {self._trend_names[cur['trend'][i]]}"))
+
+        for key, bands, label in (("rsi", self.rsi_bands, "RSI"), ("position", self.position_bands, "價格位階")):
+            a, b = prev[key], cur[key]
+            ok = np.isfinite(a) & np.isfinite(b)
+            moved = ok & (np.digitize(a, bands) != np.digitize(b, bands))
+            for i in np.flatnonzero(moved):
+                fmt = f"{b[i]:.1f}" if key == "rsi" else f"{b[i] * 100:.0f}%"
+                alerts.append((symbols[i], key, f"{label}換檔 → `{fmt}`"))
+
+        return alerts
+
+    def _align(self, symbols):
+        """標的順序改變時，把上一週期狀態重排成新順序（新標的補缺值）"""
+        if self._prev is None or symbols == self._symbols:
+            return self._prev
+        index = {s: i for i, s in enumerate(self._symbols)}
+        pos = np.array([index.get(s, -1) for s in symbols])
+        missing = pos < 0
+        out = {}
+        for key, arr in self._prev.items():
+            taken = arr[np.where(missing, 0, pos)].copy()
+            taken[missing] = -1 if arr.dtype.kind == "i" else np.nan
+            out[key] = taken
+        return out
+
+    def due_checkpoint(self, now=None):
+        """到了固定報告時點（且今天還沒發過）就回傳該時點字串，否則 None"""
+        now = now or clock.now()
+        today = now.strftime("%Y-%m-%d")
+        fired = self._fired.setdefault(today, set())
+        if len(self._fired) > 1:
+            self._fired = {today: fired}
+        hhmm = now.strftime("%H:%M")
+        due = [cp for cp in self.checkpoints if cp <= hhmm and cp not in fired]
+        if not due:
+            return None
+        fired.update(due)  # 錯過的時點一併標記，只補發最新一次
+        return due[-1]
+
+def format_alerts(alerts, names=None, label=""):
+    """組成精簡通報訊息"""
+    names = names or {}
+    lines = [f"# ⚡ 盤中事件通報 {label}".rstrip()]
+    for symbol, _, message in alerts:
+        lines.append(f"📍 **{names.get(symbol, symbol)}**：{message}")
+    return "\n".join(lines)
+
+# === 效能量測：數百標的的條件判斷 ===
+if __name__ == "__main__":
+    rng = np.random.default_rng(3)
+    n = 500
+    symbols = [f"S{i:04d}" for i in range(n)]
+    trends = ["🔴 強勢多頭", "🍀 多頭回檔", "🟢 強勢空頭", "🟡 橫盤整理"]
+    engine = AlertEngine()
+    price = 100 + rng.normal(0, 1, n)
+    rsi = 50 + rng.normal(0, 10, n)
+    trend_idx = rng.integers(0, 4, n)
+    samples = []
+    for tick in range(200):
+        price = price * (1 + rng.normal(0, 0.003, n))
+        rsi = np.clip(rsi + rng.normal(0, 1.5, n), 0, 100)
+        flip = rng.random(n) < 0.01
+        trend_idx[flip] = rng.integers(0, 4, flip.sum())
+        t0 = time.perf_counter()
+        fired = engine.evaluate(
+            symbols, price, grid_buy=np.full(n, 99.0), month_low=np.full(n, 97.5),
+            rsi=rsi, trend=[trends[i] for i in trend_idx], position=np.clip(price / 100 - 0.5, 0, 1),
+        )
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    print(f"⚡ {n} 標的條件判斷：中位數 {samples[len(samples) // 2]:.3f} ms，P99 {samples[int(len(samples) * 0.99)]:.3f} ms（最後一輪觸發 {len(fired)} 則）")
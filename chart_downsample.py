@@ -0,0 +1,96 @@
+# chart_downsample.py - 圖表點數縮減（依座標軸像素寬度做 min/max 分桶，保留極值）
+import numpy as np
+
+# 線條：每個點至少佔 3 像素才看得出差異；標記點：不重疊約需 12 像素
+LINE_PX_PER_POINT = 3
+MARKER_PX_PER_POINT = 12
+BAR_PX_PER_BAR = 4
+
+def axes_pixel_width(ax, dpi):
+    """座標軸在輸出圖片上的像素寬度（以 subplot 版面位置估算）"""
+    fig = ax.get_figure()
+    return ax.get_position().width * fig.get_figwidth() * dpi
+
+def point_budget(ax, dpi, px_per_point=LINE_PX_PER_POINT):
+    return max(int(axes_pixel_width(ax, dpi) / px_per_point), 2)
+
+def _bucket_view(y, n_buckets):
+    """把序列切成 n_buckets 個等長桶（尾端以最後一個值補齊），回傳 (2D 視圖, 桶長)"""
+    n = len(y)
+    size = -(-n // n_buckets)
+    pad = n_buckets * size - n
+    if pad:
+        y = np.concatenate([y, np.repeat(y[-1:], pad)])
+    return y.reshape(n_buckets, size), size
+
+def minmax_indices(y, max_points):
+    """
+    min/max 分桶：每桶保留最低與最高點（含頭尾），回傳排序後的索引
+    全域最高 / 最低點必定在所屬桶內被保留
+    """
+    y = np.asarray(y, dtype="f8")
+    n = len(y)
+    if n <= max_points or max_points < 4:
+        return np.arange(n)
+    n_buckets = max((max_points - 2) // 2, 1)
+    filled = np.where(np.isnan(y), np.nanmean(y), y)
+    view, size = _bucket_view(filled, n_buckets)
+    offsets = np.arange(n_buckets) * size
+    lo = view.argmin(axis=1) + offsets
+    hi = view.argmax(axis=1) + offsets
+    idx = np.concatenate(([0, n - 1], lo, hi))
+    return np.unique(np.minimum(idx, n - 1))
+
+def extreme_indices(y, max_points):
+    """長條圖用：每桶只保留絕對值最大的一根（動能峰值不會被平均掉）"""
+    y = np.asarray(y, dtype="f8")
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    view, size = _bucket_view(np.nan_to_num(np.abs(y)), max_points)
+    idx = view.argmax(axis=1) + np.arange(max_points) * size
+    return np.unique(np.minimum(idx, n - 1))
+
+def downsample_series(series, max_points):
+    """pandas Series → 縮減後的 Series（保留原索引）"""
+    if len(series) <= max_points:
+        return series
+    return series.iloc[minmax_indices(series.to_numpy(dtype="f8"), max_points)]
+
+# === 效能量測：縮減前後的繪圖時間與 PNG 大小 ===
+if __name__ == "__main__":
+    import time
+    import warnings
+
+    import pandas as pd
+
+    import chart_renderer
+
+    warnings.filterwarnings("ignore")
+    rng = np.random.default_rng(0)
+
+    def frame(days, scale=1.0):
+        idx = pd.bdate_range(end="2026-10-16", periods=days)
+        return pd.DataFrame({"Close": scale * 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))}, index=idx)
+
+    def measure(fn, rounds=3):
+        fn()
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            size = len(fn().getvalue())
+        return (time.perf_counter() - t0) / rounds * 1000, size
+
+    names = {"^GSPC": "標普500", "^DJI": "道瓊工業", "^IXIC": "那斯達克", "TSM": "台積電ADR"}
+    for days, label in ((250, "1 年"), (1250, "5 年")):
+        tw = frame(days, 0.1)
+        us = {s: frame(days, k + 1) for k, s in enumerate(names)}
+        charts = {
+            "009816 趨勢圖": lambda: chart_renderer.render_taiwan_chart(tw.index, tw["Close"], float(tw["Close"].iloc[-1]), "測試"),
+            "美股儀表板": lambda: chart_renderer.render_us_dashboard(us, names),
+        }
+        for chart, fn in charts.items():
+            chart_renderer.DOWNSAMPLE = False
+            ms0, b0 = measure(fn)
+            chart_renderer.DOWNSAMPLE = True
+            ms1, b1 = measure(fn)
+            print(f"📊 {label} {chart}：{ms0:.0f} → {ms1:.0f} ms，PNG {b0 / 1024:.0f} → {b1 / 1024:.0f} KB")
@@ -0,0 +1,193 @@
+# chart_renderer.py - 執行緒安全的圖表繪製（直接使用 Figure + Agg canvas，不碰 pyplot 全域狀態）
+import io
+import os
+import logging
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.font_manager as fm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from chart_downsample import (
+    BAR_PX_PER_BAR, MARKER_PX_PER_POINT, extreme_indices, minmax_indices, point_budget
+)
+
+# 依座標軸像素寬度縮減點數（保留極值）；關閉即畫出全部資料點
+DOWNSAMPLE = True
+
+# =====================
+# 🛠️ 中文字體（全行程只註冊一次）
+# =====================
+_FONT_READY = False
+
+def setup_chinese_font():
+    global _FONT_READY
+    if _FONT_READY:
+        return
+    font_filename = "NotoSansTC-Regular.ttf"
+    font_path = os.path.join(os.getcwd(), font_filename)
+
+    if os.path.exists(font_path):
+        fm.fontManager.addfont(font_path)
+        font_name = fm.FontProperties(fname=font_path).get_name()
+        matplotlib.rcParams['font.family'] = [font_name, 'DejaVu Sans', 'sans-serif']
+        matplotlib.rcParams['axes.unicode_minus'] = False
+        logging.info(f"✅ 繪圖模組：成功載入字體 {font_name} 及其符號回援機制")
+    else:
+        logging.error(f"❌ 繪圖模組：找不到字體檔 {font_filename}")
+    _FONT_READY = True
+
+setup_chinese_font()
+
+def _new_figure(figsize):
+    """每次繪圖各自建立 Figure 與 canvas，彼此不共用狀態"""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+def _thin(ax, dpi, x, y, px_per_point=None):
+    """把 (x, y) 縮減到座標軸畫得出來的點數"""
+    y = np.asarray(y, dtype="f8")
+    if not DOWNSAMPLE:
+        return x, y
+    budget = point_budget(ax, dpi) if px_per_point is None else point_budget(ax, dpi, px_per_point)
+    keep = minmax_indices(y, budget)
+    return x[keep], y[keep]
+
+def _to_png(fig, dpi):
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+    buf.seek(0)
+    fig.clear()  # 主動拆掉 artist 參照，長時間運行不累積
+    return buf
+
+# =====================
+# 📊 三種報告圖表
+# =====================
+def render_taiwan_chart(index, close, price, name):
+    """009816 策略趨勢圖"""
+    fig = _new_figure((10, 6))
+    ax = fig.add_subplot(1, 1, 1)
+    index, close = _thin(ax, 150, index, close, MARKER_PX_PER_POINT)
+    ax.plot(index, close, marker='o', linestyle='-', color='#1f77b4', linewidth=2, label='每日收盤價')
+    ax.axhline(y=10.0, color='#d62728', linestyle='--', alpha=0.6, label='發行價 (10.0)')
+    ax.axhline(y=price, color='#2ca02c', linestyle=':', alpha=0.6, label=f'目前價格 ({price:.2f})')
+
+    ax.set_title(f"{name} (009816) 策略趨勢分析", fontsize=16, fontweight='bold', pad=15)
+    ax.set_xlabel("交易日期", fontsize=12)
+    ax.set_ylabel("價格 (TWD)", fontsize=12)
+    ax.legend(loc='best')
+    ax.grid(True, linestyle=':', alpha=0.5)
+    return _to_png(fig, 150)
+
+def render_grid_chart(dfs, names):
+    """網格動態分析圖（每個標的一列）"""
+    fig = _new_figure((12, 12))
+
+    for i, (symbol, df) in enumerate(dfs.items()):
+        ax = fig.add_subplot(len(dfs), 1, i + 1)
+        plot_df = df.tail(60)
+
+        ma20 = plot_df['Close'].rolling(20).mean()
+        std20 = plot_df['Close'].rolling(20).std()
+
+        # 繪製價格與布林通道
+        ax.plot(plot_df.index, plot_df['Close'], label='收盤價', lw=2.5, color='#1f77b4')
+        ax.fill_between(plot_df.index, ma20 - 2 * std20, ma20 + 2 * std20, color='gray', alpha=0.1, label='布林通道')
+        ax.plot(plot_df.index, ma20, color='orange', linestyle='--', alpha=0.8, label='月線 (MA20)')
+
+        ax.set_title(f"{names[symbol]} 趨勢掃描", fontsize=15, fontweight='bold', pad=10)
+        ax.legend(loc='upper left', fontsize=10)
+        ax.grid(True, alpha=0.3, linestyle=':')
+
+    fig.tight_layout()
+    return _to_png(fig, 150)
+
+def render_us_dashboard(dfs, names):
+    """美股多維度決策儀表板"""
+    fig = _new_figure((12, 16))
+    ax1, ax2, ax3 = fig.subplots(3, 1, gridspec_kw={'height_ratios': [2, 1, 1]})
+
+    for symbol, df in dfs.items():
+        name = names[symbol]
+        norm_close = df['Close'] / df['Close'].iloc[0] * 100
+        ax1.plot(*_thin(ax1, 180, df.index, norm_close), label=name, linewidth=2.5)
+
+        # RSI 曲線
+        delta = df['Close'].diff()
+        gain = (delta.where(delta > 0, 0)).rolling(14).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+        rsi = 100 - (100 / (1 + (gain / loss.replace(0, 0.001))))
+        ax3.plot(*_thin(ax3, 180, df.index, rsi), label=f"{name}", alpha=0.8)
+
+    ax1.set_title("市場指數相對表現 (基準 100)", fontsize=18, fontweight='bold', pad=20)
+    ax1.legend(loc='upper left', fontsize=12)
+    ax1.grid(True, linestyle='--', alpha=0.5)
+
+    # S&P 500 MACD
+    if "^GSPC" in dfs:
+        gspc_close = dfs["^GSPC"]['Close']
+        exp12 = gspc_close.ewm(span=12, adjust=False).mean()
+        exp26 = gspc_close.ewm(span=26, adjust=False).mean()
+        macd = exp12 - exp26
+        signal = macd.ewm(span=9, adjust=False).mean()
+        hist = (macd - signal).to_numpy()
+        bar_index, width = dfs["^GSPC"].index, 0.8
+        if DOWNSAMPLE:
+            # 每桶保留最強的一根，柱寬按縮減比例放大
+            keep = extreme_indices(hist, point_budget(ax2, 180, BAR_PX_PER_BAR))
+            width = 0.8 * len(hist) / len(keep)
+            bar_index, hist = bar_index[keep], hist[keep]
+        colors = np.where(hist > 0, '#ff4d4d', '#2ecc71')
+        ax2.bar(bar_index, hist, color=colors, alpha=0.8, width=width)
+    ax2.set_title("標普 500 市場動能 (MACD)", fontsize=16, fontweight='bold')
+    ax2.grid(True, axis='y', alpha=0.3)
+
+    # RSI 熱力
+    ax3.axhline(70, color='#ff4d4d', linestyle='--', linewidth=1.5)
+    ax3.axhline(30, color='#2ecc71', linestyle='--', linewidth=1.5)
+    ax3.set_title("RSI 強弱熱度掃描", fontsize=16, fontweight='bold')
+    ax3.set_ylim(0, 100)
+
+    fig.tight_layout()
+    return _to_png(fig, 180)
+
+# === 壓力測試：多執行緒連續繪圖，觀察 RSS 是否持平 ===
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import numpy as np
+    import pandas as pd
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    idx = pd.bdate_range("2025-01-01", periods=250)
+    rng = np.random.default_rng(0)
+    close = pd.Series(10 * np.exp(np.cumsum(rng.normal(0, 0.01, 250))), index=idx)
+    frame = pd.DataFrame({"Close": close})
+    grid_dfs = {"A": frame, "B": frame * 2, "C": frame * 3}
+    grid_names = {"A": "標的 A", "B": "標的 B", "C": "標的 C"}
+
+    def job(i):
+        if i % 2:
+            return len(render_grid_chart(grid_dfs, grid_names).getvalue())
+        return len(render_taiwan_chart(idx, close, float(close.iloc[-1]), "測試").getvalue())
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for start in range(0, total, 100):
+            list(pool.map(job, range(start, min(start + 100, total))))
+            print(f"🧪 {min(start + 100, total):5d} 張：RSS {_rss_mb():.1f} MB", flush=True)
+    elapsed = time.perf_counter() - t0
+    print(f"⏱️ 共 {total} 張，{elapsed:.1f} 秒（{elapsed / total * 1000:.0f} ms/張）")
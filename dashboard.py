@@ -0,0 +1,272 @@
+# dashboard.py - 即時儀表板（排程寫入最新巡檢快照，各 worker 以 SSE / JSON 推給瀏覽器；讀取端只用快取，不重算、不抓資料）
+import os
+import json
+import math
+import time
+import logging
+import threading
+
+import numpy as np
+
+from shared_state import SharedState
+import market_clock as clock
+
+DASHBOARD_CAPACITY = 256 * 1024
+MAX_ALERTS = 30             # 儀表板保留當天最近幾則事件通報
+SSE_POLL = 1.0              # 檢查快照版本的間隔（只讀 mmap 檔頭）
+SSE_HEARTBEAT = 15          # 無更新時送註解行保持連線
+SSE_STREAM_SECONDS = 300    # 單條串流最長時間，到期由瀏覽器自動重連（不長期佔住 gthread 執行緒）
+# gthread worker 每條 SSE 佔一個執行緒：最多用到 threads - 1 條，留一條給其他請求
+SSE_MAX_STREAMS = max(int(os.environ.get("GUNICORN_THREADS", 4)) - 1, 1)
+SSE_RETRY_MS = 3000         # 串流正常結束後的重連間隔
+SSE_BUSY_RETRY_MS = 15000   # 串流名額已滿：送一次目前快照後請瀏覽器晚點再連
+
+def plain(obj):
+    """轉成可 JSON 序列化的純資料（NumPy 純量轉 Python、NaN / inf 轉 null，瀏覽器的 JSON.parse 才讀得了）"""
+    if isinstance(obj, dict):
+        return {str(k): plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [plain(v) for v in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if obj is None or isinstance(obj, (str, int, bool)):
+        return obj
+    return str(obj)
+
+def market_snapshot(tw_symbol, tw_df, grid_dfs, indicators, names, position=None):
+    """
+    巡檢已抓好的日線與指標 → 儀表板的行情列（只取最後兩根，不重算指標）
+    position: 009816 的價格位階（沿用巡檢時算好的值）
+    """
+    rows = {}
+    frames = {tw_symbol: tw_df, **(grid_dfs or {})}
+    for symbol, df in frames.items():
+        if df is None or df.empty:
+            continue
+        close = df["Close"]
+        price = float(close.iat[-1])
+        prev = float(close.iat[-2]) if len(close) > 1 else price
+        row = {"name": names.get(symbol, symbol), "price": price, "change_pct": (price / prev - 1) * 100 if prev else 0.0}
+        data = (indicators or {}).get(symbol)
+        if data is not None:
+            row.update({k: data[k] for k in ("rsi", "trend", "grid_buy", "month_low", "ma20", "ma60") if k in data})
+            row["timeframes"] = {v["label"]: v["trend"] for v in data.get("timeframes", {}).values()}
+        if symbol == tw_symbol and position is not None:
+            row["position"] = position
+        rows[symbol] = row
+    return rows
+
+def ai_snapshot(cache):
+    """ai_expert.AI_CACHE → {分析類型:標的: 最近一次 AI 判斷}"""
+    return {
+        f"{kind}:{target}": {"at": at, **{k: result.get(k) for k in ("decision", "confidence", "reason")}}
+        for (kind, target), (at, result) in list(cache.items())
+    }
+
+class LiveDashboard:
+    """
+    寫入端（排程主控 worker）：每次巡檢後 publish() 更新各區塊
+    讀取端（任一 worker 的任一請求）：依快照版本快取已序列化的 JSON，
+    同一版本不論多少瀏覽器都只解析 / 序列化一次
+    """
+
+    def __init__(self, name="dashboard", capacity=DASHBOARD_CAPACITY, state_dir=None):
+        self._state = SharedState(name, capacity=capacity, default={}, state_dir=state_dir)
+        self._cache = {"version": None, "bodies": {}}
+        self._lock = threading.Lock()
+        self._streams = 0
+
+    # ---------- 寫入端 ----------
+    def publish(self, alerts=None, **sections):
+        """更新區塊（market / ai / pipelines / budget / delivery …）；alerts 累加到當天的事件列表"""
+        now = clock.now(clock.TW_TZ)
+        sections = plain(sections)
+        new_alerts = plain(alerts or [])
+
+        def apply(state):
+            day = f"{now:%Y-%m-%d}"
+            if state.get("day") != day:
+                state = {"day": day, "alerts": []}
+            state.update(sections)
+            if new_alerts:
+                state["alerts"] = (state.get("alerts", []) + new_alerts)[-MAX_ALERTS:]
+            state["updated"] = f"{now:%H:%M:%S}"
+            return state
+
+        try:
+            return self._state.update(apply)[0]
+        except ValueError as e:
+            logging.error(f"❌ 儀表板快照寫入失敗: {e}")
+            return None
+
+    # ---------- 讀取端 ----------
+    def version(self):
+        return self._state.version()
+
+    def body(self, section=None):
+        """(版本, 序列化後的 JSON 字串)；section=None 為整份快照"""
+        version = self._state.version()
+        cache = self._cache
+        if cache["version"] == version and section in cache["bodies"]:
+            return version, cache["bodies"][section]
+        with self._lock:
+            version, data = self._state.snapshot()
+            if self._cache["version"] != version:
+                self._cache = {"version": version, "bodies": {}}
+            bodies = self._cache["bodies"]
+            if section not in bodies:
+                bodies[section] = json.dumps(data if section is None else data.get(section, {}), ensure_ascii=False)
+            return version, bodies[section]
+
+    def _acquire_stream(self):
+        with self._lock:
+            if self._streams >= SSE_MAX_STREAMS:
+                return False
+            self._streams += 1
+            return True
+
+    def _release_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    def stream(self, last_id=None):
+        """
+        SSE 產生器：連上先送一次目前快照（Last-Event-ID 相同則略過），之後版本變了才送
+        名額已滿時只送一次快照並請瀏覽器延後重連（退化為低頻輪詢，仍然只讀快取）
+        """
+        if not self._acquire_stream():
+            version, body = self.body()
+            yield f"retry: {SSE_BUSY_RETRY_MS}\nid: {version}\ndata: {body}\n\n"
+            return
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            sent = str(last_id) if last_id is not None else None
+            started = last_beat = time.monotonic()
+            while time.monotonic() - started < SSE_STREAM_SECONDS:
+                if str(self.version()) != sent:
+                    version, body = self.body()
+                    sent = str(version)
+                    last_beat = time.monotonic()
+                    yield f"id: {version}\ndata: {body}\n\n"
+                elif time.monotonic() - last_beat >= SSE_HEARTBEAT:
+                    last_beat = time.monotonic()
+                    yield ": keep-alive\n\n"
+                time.sleep(SSE_POLL)
+        finally:
+            self._release_stream()
+
+DASHBOARD = LiveDashboard()
+
+def render_index(**values):
+    """首頁外框只代入少數伺服器端欄位（頁面含 CSS / JS 大括號，不用 str.format）"""
+    html = INDEX_HTML
+    for key, value in values.items():
+        html = html.replace("{%s}" % key, str(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;"))
+    return html
+
+# 首頁：靜態外框 + EventSource，資料全部來自 /events
+INDEX_HTML = """<!doctype html>
+<html lang="zh-Hant"><head><meta charset="utf-8"><title>AI Manager 管理後台</title>
+<style>
+body { font-family: sans-serif; max-width: 1100px; margin: 30px auto; padding: 0 16px; color: #222; }
+h1 { color: #5865F2; text-align: center; }
+.meta { color: #666; font-size: 0.9em; text-align: center; }
+table { border-collapse: collapse; width: 100%; margin: 12px 0 24px; font-size: 0.92em; }
+th, td { border-bottom: 1px solid #e3e3e3; padding: 6px 8px; text-align: left; }
+th { background: #f5f6ff; }
+td.num { text-align: right; font-variant-numeric: tabular-nums; }
+.up { color: #d33; } .down { color: #090; }
+.run { background: #5865F2; color: white; padding: 12px 32px; text-decoration: none; border-radius: 8px; font-weight: bold; display: inline-block; }
+.bar { background: #5865F2; height: 10px; display: inline-block; vertical-align: middle; }
+</style></head><body>
+<h1>🦅 AI Manager 管理後台</h1>
+<p class="meta">當前系統時間: <code>{now_str}</code> ｜ 排程主控 worker: <code>{leader}</code> ｜ 本頁由 worker <code>{pid}</code> 回應</p>
+<p class="meta">狀態: 🟢 背景自動巡檢運行中 (台股時段每 3 分鐘) ｜ 最新快照 <code id="updated">—</code> <span id="conn">⚪ 連線中</span></p>
+<p class="meta">🪙 今日 AI 額度: <span id="budget">{budget}</span> (<a href="/budget">明細</a>)</p>
+<h2>📊 行情與指標</h2>
+<table><thead><tr><th>標的</th><th>現價</th><th>漲跌</th><th>RSI</th><th>日線趨勢</th><th>週 / 月線</th><th>補倉點</th><th>位階</th></tr></thead><tbody id="market"></tbody></table>
+<h2>🤖 AI 判斷</h2>
+<table><thead><tr><th>分析</th><th>時間</th><th>判斷</th><th>信心</th><th>理由</th></tr></thead><tbody id="ai"></tbody></table>
+<h2>⚡ 今日事件</h2>
+<ul id="alerts"></ul>
+<h2>🧭 管線階段耗時 (<a href="/api/timings">JSON</a>)</h2>
+<div id="pipelines"></div>
+<p style="text-align: center; margin-top: 30px;"><a class="run" href="/run">🚀 啟動全套手動巡檢 (美+台+網格)</a></p>
+<p class="meta">點擊後將在 Discord 發送完整分析報告</p>
+<script>
+const esc = s => String(s ?? "—").replace(/[&<>"]/g, c => ({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"}[c]));
+const num = (v, d = 2) => v === null || v === undefined ? "—" : Number(v).toFixed(d);
+function render(s) {
+  document.getElementById("updated").textContent = s.updated || "—";
+  document.getElementById("market").innerHTML = Object.entries(s.market || {}).map(([sym, r]) => {
+    const cls = r.change_pct > 0 ? "up" : r.change_pct < 0 ? "down" : "";
+    const tf = Object.entries(r.timeframes || {}).map(([k, v]) => `${k} ${v}`).join(" ／ ");
+    return `<tr><td>${esc(r.name)}</td><td class="num">${num(r.price)}</td><td class="num ${cls}">${num(r.change_pct)}%</td>
+      <td class="num">${num(r.rsi, 1)}</td><td>${esc(r.trend)}</td><td>${esc(tf || null)}</td>
+      <td class="num">${num(r.grid_buy)}</td><td class="num">${r.position === undefined ? "—" : num(r.position * 100, 0) + "%"}</td></tr>`;
+  }).join("");
+  document.getElementById("ai").innerHTML = Object.entries(s.ai || {}).map(([k, r]) =>
+    `<tr><td>${esc(k)}</td><td>${esc(r.at)}</td><td><b>${esc(r.decision)}</b></td><td class="num">${esc(r.confidence)}%</td><td>${esc(r.reason)}</td></tr>`).join("");
+  document.getElementById("alerts").innerHTML = (s.alerts || []).slice().reverse().map(a =>
+    `<li><code>${esc(a.at)}</code> <b>${esc(a.name)}</b>：${esc(a.message)}</li>`).join("") || "<li>尚無事件</li>";
+  document.getElementById("pipelines").innerHTML = Object.entries(s.pipelines || {}).map(([name, p]) => {
+    const scale = 300 / Math.max(p.elapsed_ms, 1);
+    const rows = Object.entries(p.stages).sort((a, b) => a[1].start_ms - b[1].start_ms).map(([st, t]) =>
+      `<tr><td>${esc(st)}</td><td class="num">${num(t.ms, 0)}ms</td><td><span style="display:inline-block;width:${t.start_ms * scale}px"></span><span class="bar" style="width:${Math.max(t.ms * scale, 1)}px"></span></td></tr>`).join("");
+    return `<h3>${esc(name)}：${num(p.elapsed_ms, 0)}ms（關鍵路徑 ${esc(p.critical_path.join(" → "))}）</h3><table>${rows}</table>`;
+  }).join("");
+  if (s.budget_text) document.getElementById("budget").textContent = s.budget_text;
+}
+const es = new EventSource("/events");
+es.onmessage = e => { render(JSON.parse(e.data)); document.getElementById("conn").textContent = "🟢 即時"; };
+es.onerror = () => { document.getElementById("conn").textContent = "🟠 重新連線中"; };
+</script></body></html>"""
+
+# === 量測：多位觀看者同時讀取（每次重新序列化 vs 依版本快取）===
+if __name__ == "__main__":
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    idx = pd.bdate_range(end="2026-10-16", periods=250)
+    names = {"009816.TW": "009816 凱基台灣 TOP 50", "00929.TW": "00929 科技優息", "2317.TW": "2317 鴻海", "00878.TW": "00878 永續高股息"}
+    dfs = {s: pd.DataFrame({"Close": 20 * np.exp(np.cumsum(rng.normal(0, 0.01, 250)))}, index=idx) for s in names}
+    indicators = {s: {"rsi": np.float64(55.5), "trend": "🟡 橫盤整理", "grid_buy": np.float64(19.2), "month_low": 18.9,
+                      "ma20": 20.1, "ma60": float("nan"), "timeframes": {"W": {"label": "週線", "trend": "🍀 多頭回檔"}}}
+                  for s in list(names)[1:]}
+    pipelines = {"market_scan": {"elapsed_ms": 64.0, "busy_ms": 90.0, "critical_path": ["fetch_grid", "indicators_grid"],
+                                 "errors": [], "stages": {f"stage{i}": {"start_ms": i * 5.0, "ms": 20.0} for i in range(8)}}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        board = LiveDashboard(state_dir=tmp)
+        market = market_snapshot("009816.TW", dfs["009816.TW"], {s: dfs[s] for s in list(names)[1:]}, indicators, names, 0.42)
+        board.publish(market=market, pipelines=pipelines,
+                      alerts=[{"at": "09:03", "symbol": "2317.TW", "name": "2317 鴻海", "message": "跌破補倉點"}])
+        _, body = board.body()
+        print(f"🗂️ 快照 {len(body.encode()) / 1024:.1f}KB：{', '.join(json.loads(body))}")
+
+        viewers, reads = 200, 20
+        def uncached(_):
+            for _ in range(reads):
+                json.dumps(board._state.snapshot()[1], ensure_ascii=False)
+        def cached(_):
+            for _ in range(reads):
+                board.body()
+        for label, fn in (("每次重新序列化", uncached), ("依版本快取", cached)):
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(8) as pool:
+                list(pool.map(fn, range(viewers)))
+            elapsed = time.perf_counter() - t0
+            print(f"   {viewers} 位觀看者 × {reads} 次讀取，{label}：{elapsed * 1000:.0f}ms（{viewers * reads / elapsed:,.0f} 次/秒）")
+
+        # SSE：版本沒變只送心跳，變了才推
+        SSE_POLL, SSE_HEARTBEAT, SSE_STREAM_SECONDS = 0.01, 0.05, 0.3
+        gen = board.stream()
+        events = [next(gen), next(gen)]
+        board.publish(market=market)
+        events.append(next(gen))
+        print(f"📡 SSE：{[e.split(chr(10))[0] for e in events]}")
@@ -0,0 +1,316 @@
+# delivery.py - 報告投遞路由（文字與圖片只編碼一次，平行送到多個 Discord 頻道 / 本地封存檔）
+import os
+import io
+import json
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from image_encoder import encode_chart, record_upload
+import market_clock as clock
+
+DISCORD_TEXT_LIMIT = 1950   # Discord 單則上限 2000 字，保留截斷符號的空間
+DISCORD_RATE = (5, 2.0)     # 每個 webhook 每 2 秒最多 5 個請求
+DISCORD_IMAGE_GAP = 2.0     # 文字與圖表之間的間隔（讓圖表固定出現在對應報告之後）
+DISCORD_RETRIES = 3         # 429 依 retry_after 重試的次數
+MAX_PENDING = 50            # 單一出口積壓超過此數就丟棄新訊息（不拖累其他出口，也不吃光記憶體）
+
+class Message:
+    """一則報告：文字截斷與圖片編碼都在送出前做完一次，各出口共用同一份位元組"""
+    __slots__ = ("text", "chart_type", "images", "created")
+
+    def __init__(self, text, chart_type=None, images=None):
+        self.text = text
+        self.chart_type = chart_type
+        self.images = images or {}  # 頻道設定 → (位元組, 副檔名, MIME)
+        self.created = clock.now(clock.TW_TZ)
+
+    def image(self, channel):
+        return self.images.get(channel) or next(iter(self.images.values()), None)
+
+def build_message(text, file_buf=None, filename="chart.png", channels=("discord",), encode=True):
+    """截斷文字、依每個用到的頻道設定各壓縮一次圖表（encode=False 時直接用原始 PNG）"""
+    text = str(text)
+    if len(text) > DISCORD_TEXT_LIMIT:
+        text = text[:DISCORD_TEXT_LIMIT] + "..."
+    chart_type = os.path.splitext(filename)[0]
+    images = {}
+    if file_buf is not None:
+        for channel in dict.fromkeys(channels):
+            try:
+                if not encode:
+                    raise ValueError("未啟用壓縮")
+                data, ext, mime, desc = encode_chart(file_buf, chart_type, channel)
+                logging.info(f"🗜️ {chart_type} 編碼為 {desc}")
+            except Exception as e:
+                if encode:
+                    logging.error(f"⚠️ 圖片壓縮失敗，改傳原始 PNG: {e}")
+                file_buf.seek(0)
+                data, ext, mime = io.BytesIO(file_buf.read()), "png", "image/png"
+            images[channel] = (data.getvalue(), ext, mime)
+    return Message(text, chart_type if images else None, images)
+
+class RateLimiter:
+    """滑動視窗限流：per 秒內最多 count 次，超過就在出口自己的執行緒裡等"""
+
+    def __init__(self, count, per):
+        self.count, self.per = count, per
+        self._sent = deque()
+
+    def wait(self):
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= self.per:
+            self._sent.popleft()
+        if len(self._sent) >= self.count:
+            time.sleep(self.per - (now - self._sent[0]))
+            self._sent.popleft()
+        self._sent.append(time.monotonic())
+
+class DiscordSink:
+    """單一 Discord webhook；每個出口各自一條連線池與限流"""
+    channel = "discord"
+
+    def __init__(self, url, name=None, rate=DISCORD_RATE, image_gap=DISCORD_IMAGE_GAP):
+        self.url = url
+        self.name = name or f"discord:…{url.rstrip('/')[-6:]}"
+        self.image_gap = image_gap
+        self._http = requests.Session()  # 只在此出口的執行緒使用
+        self._limiter = RateLimiter(*rate)
+
+    def _post(self, timeout, **kwargs):
+        for _ in range(DISCORD_RETRIES):
+            self._limiter.wait()
+            res = self._http.post(self.url, timeout=timeout, **kwargs)
+            if res.status_code != 429:
+                res.raise_for_status()
+                return res
+            try:
+                retry = float(res.json().get("retry_after", 1.0))
+            except ValueError:
+                retry = 1.0
+            logging.warning(f"⏳ {self.name} 被限流，{retry:.1f}s 後重試")
+            time.sleep(retry)
+        res.raise_for_status()
+
+    def deliver(self, msg):
+        self._post(15, json={"content": msg.text})
+        image = msg.image(self.channel)
+        if image is None:
+            return
+        data, ext, mime = image
+        time.sleep(self.image_gap)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            res = self._post(20, files={"file": (f"{msg.chart_type}.{ext}", io.BytesIO(data), mime)})
+            ok = res.status_code < 300
+        finally:
+            record_upload(msg.chart_type, len(data), (time.perf_counter() - t0) * 1000, ok)
+
+    def warm(self):
+        """查詢 webhook 資訊（不發訊息），順便把 TLS 連線放進連線池"""
+        self._http.get(self.url, timeout=10)
+
+class FileSink:
+    """本地封存：每則一行 JSON，圖表另存成檔案（路徑記在該行）"""
+    channel = "discord"  # 封存與 Discord 收到的是同一份圖
+
+    def __init__(self, path, name=None):
+        self.path = path
+        self.name = name or f"file:{os.path.basename(path)}"
+        self.image_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "images")
+
+    def deliver(self, msg):
+        record = {"ts": msg.created.isoformat(timespec="seconds"), "text": msg.text}
+        image = msg.image(self.channel)
+        if image is not None:
+            data, ext, _ = image
+            os.makedirs(self.image_dir, exist_ok=True)
+            image_path = os.path.join(self.image_dir, f"{msg.created:%Y%m%d-%H%M%S}-{msg.chart_type}.{ext}")
+            with open(image_path, "wb") as fh:
+                fh.write(data)
+            record["image"] = image_path
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def warm(self):
+        pass
+
+class _Lane:
+    """一個出口的專屬執行緒：出口之間互不等待，單一出口內維持訊息順序"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sink-{sink.name}")
+        self.pending = 0
+        self.stats = {"sent": 0, "failed": 0, "dropped": 0, "ms": 0.0, "last_error": None}
+        self._lock = threading.Lock()
+
+    def submit(self, msg):
+        with self._lock:
+            if self.pending >= MAX_PENDING:
+                self.stats["dropped"] += 1
+                logging.error(f"🚧 {self.sink.name} 積壓 {self.pending} 則，丟棄本則")
+                return None
+            self.pending += 1
+        return self.pool.submit(self._run, msg)
+
+    def _run(self, msg):
+        t0 = time.perf_counter()
+        try:
+            self.sink.deliver(msg)
+            ok, error = True, None
+        except Exception as e:
+            ok, error = False, str(e)[:200]
+            logging.error(f"❌ {self.sink.name} 發送失敗: {e}")
+        with self._lock:
+            self.pending -= 1
+            self.stats["sent" if ok else "failed"] += 1
+            self.stats["ms"] += (time.perf_counter() - t0) * 1000
+            if error:
+                self.stats["last_error"] = error
+
+class DeliveryRouter:
+    """
+    dc_log 的後端：
+    - 編碼在單一執行緒依序進行（每則訊息只截斷 / 壓縮一次，呼叫端不等）
+    - 編好的訊息分送到每個出口各自的執行緒；慢的或壞掉的出口只影響自己
+    """
+
+    def __init__(self, sinks, encode=True):
+        self.sinks = list(sinks)
+        self.encode = encode
+        self._lanes = [_Lane(sink) for sink in self.sinks]
+        self._encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="delivery-encode")
+
+    def send(self, text, file_buf=None, filename="chart.png"):
+        if not self._lanes:
+            logging.warning("⚠️ 未設定任何投遞出口（Webhook URL / 封存檔）")
+            return None
+        return self._encoder.submit(self._fan_out, text, file_buf, filename)
+
+    def _fan_out(self, text, file_buf, filename):
+        try:
+            msg = build_message(text, file_buf, filename, [sink.channel for sink in self.sinks], self.encode)
+        except Exception as e:
+            logging.error(f"❌ 訊息組裝失敗: {e}")
+            return []
+        return [lane.submit(msg) for lane in self._lanes]
+
+    def flush(self, timeout=None):
+        """等所有已送出的訊息在每個出口都處理完（回放 / 結束前使用）"""
+        self._encoder.submit(lambda: None).result(timeout)
+        for lane in self._lanes:
+            lane.pool.submit(lambda: None).result(timeout)
+
+    def warm(self):
+        """各出口平行暖機；回傳失敗的出口名稱"""
+        futures = {lane.sink.name: lane.pool.submit(lane.sink.warm) for lane in self._lanes}
+        failed = []
+        for name, future in futures.items():
+            try:
+                future.result(timeout=15)
+            except Exception as e:
+                logging.warning(f"⚠️ {name} 暖機失敗: {e}")
+                failed.append(name)
+        return failed
+
+    def stats(self):
+        out = {}
+        for lane in self._lanes:
+            st = dict(lane.stats)
+            done = st["sent"] + st["failed"]
+            st["avg_ms"] = st.pop("ms") / done if done else 0.0
+            st["pending"] = lane.pending
+            out[lane.sink.name] = st
+        return out
+
+def sinks_from_env(environ=os.environ):
+    """
+    DISCORD_WEBHOOK_URL：主頻道（沿用原設定）
+    DISCORD_WEBHOOK_URLS：其他頻道，逗號分隔
+    REPORT_SINK_FILE：本地封存檔（JSON Lines）
+    """
+    urls = [environ.get("DISCORD_WEBHOOK_URL", "").strip()]
+    urls += [u.strip() for u in environ.get("DISCORD_WEBHOOK_URLS", "").split(",")]
+    sinks = [DiscordSink(url) for url in dict.fromkeys(u for u in urls if u)]
+    if environ.get("REPORT_SINK_FILE", "").strip():
+        sinks.append(FileSink(environ["REPORT_SINK_FILE"].strip()))
+    return sinks
+
+# === 量測：逐一出口依序發送 vs 編碼一次平行分送（含一個很慢與一個故障的出口）===
+if __name__ == "__main__":
+    import tempfile
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    class FakeDiscord:
+        channel = "discord"
+
+        def __init__(self, name, latency, fail=False):
+            self.name, self.latency, self.fail = name, latency, fail
+            self.received = 0
+
+        def deliver(self, msg):
+            time.sleep(self.latency)
+            if self.fail:
+                raise ConnectionError("webhook 無回應")
+            self.received += 1
+
+        def warm(self):
+            pass
+
+    fig, ax = plt.subplots(figsize=(10, 5), dpi=100)
+    ax.plot(np.cumsum(np.random.default_rng(0).normal(size=2000)))
+    chart = io.BytesIO()
+    fig.savefig(chart, format="png")
+    plt.close(fig)
+
+    n_msgs = 6
+    def make_sinks(tmp):
+        return [FakeDiscord("main", 0.05), FakeDiscord("team", 0.05), FakeDiscord("slow", 0.5),
+                FakeDiscord("broken", 0.1, fail=True), FileSink(os.path.join(tmp, "reports.jsonl"))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 對照：原本的做法，每個出口各自編碼、依序發送
+        sinks = make_sinks(tmp)
+        t0 = time.perf_counter()
+        for i in range(n_msgs):
+            for sink in sinks:
+                msg = build_message(f"報告 {i}", chart, "grid.png")
+                try:
+                    sink.deliver(msg)
+                except ConnectionError:
+                    pass
+        serial = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sinks = make_sinks(tmp)
+        router = DeliveryRouter(sinks)
+        t0 = time.perf_counter()
+        for i in range(n_msgs):
+            router.send(f"報告 {i}", chart, "grid.png")
+        router._encoder.submit(lambda: None).result()
+        router._lanes[0].pool.submit(lambda: None).result()
+        main_done = time.perf_counter() - t0
+        router.flush()
+        fanout = time.perf_counter() - t0
+        with open(sinks[-1].path, encoding="utf-8") as fh:
+            archived = sum(1 for _ in fh)
+        stats = router.stats()
+
+    print(f"📤 {n_msgs} 則 × {len(sinks)} 個出口（含 0.5s 慢出口與故障出口）")
+    print(f"   依序發送：全部 {serial:.2f}s（編碼 {n_msgs * len(sinks)} 次）")
+    print(f"   編碼一次平行分送：主頻道 {main_done:.2f}s 送完、全部 {fanout:.2f}s（編碼 {n_msgs} 次），封存 {archived} 則")
+    for name, st in stats.items():
+        print(f"   {name}: 成功 {st['sent']} / 失敗 {st['failed']} / 平均 {st['avg_ms']:.0f}ms")
@@ -0,0 +1,207 @@
+# flight_recorder.py - 慢巡檢飛行記錄器（常駐取樣 profiler，超過門檻才保留堆疊與階段時間軸）
+import os
+import sys
+import json
+import time
+import glob
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from shared_state import STATE_DIR
+import market_clock as clock
+
+SAMPLE_INTERVAL = 0.05                                          # 取樣間隔（秒）；慢巡檢 ≥60s 仍有上千筆取樣
+SLOW_TICK_SECONDS = float(os.environ.get("SLOW_TICK_SECONDS", 60))
+KEEP_PROFILES = 20                                               # 只保留最近 N 次慢巡檢
+PROFILE_DIR = os.path.join(STATE_DIR, "flight_recorder")        # 寫檔讓任一 gunicorn worker 都能提供下載
+
+# 閒置中的執行緒（等待工作 / 等鎖）不列入火焰圖
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+}
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class FlightRecorder:
+    """
+    record() 期間背景執行緒固定間隔抓所有執行緒的堆疊，只累計 code 物件的 tuple（便宜）；
+    結束時耗時未達門檻就整包丟掉，超過門檻才轉成 folded 文字寫進環狀緩衝
+    """
+
+    def __init__(self, threshold=SLOW_TICK_SECONDS, keep=KEEP_PROFILES, interval=SAMPLE_INTERVAL,
+                 profile_dir=PROFILE_DIR):
+        self.threshold = threshold
+        self.keep = keep
+        self.interval = interval
+        self.profile_dir = profile_dir
+        self._stacks = Counter()
+        self._samples = 0
+        self._active = threading.Event()
+        self._lock = threading.Lock()
+        self._record_lock = threading.Lock()
+        self._thread = None
+        self._names = {}
+        self._leaf_idle = {}
+
+    # ---------- 取樣 ----------
+    def _ensure_sampler(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_loop, name="flight-recorder", daemon=True)
+            self._thread.start()
+
+    def _is_idle(self, code):
+        idle = self._leaf_idle.get(code)
+        if idle is None:
+            idle = self._leaf_idle[code] = (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+        return idle
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while True:
+            self._active.wait()
+            frames = sys._current_frames()
+            if self._samples % 50 == 0 or not frames.keys() <= self._names.keys():
+                self._names = {t.ident: t.name for t in threading.enumerate()}
+            batch = []
+            for ident, frame in frames.items():
+                if ident == me or self._is_idle(frame.f_code):
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                batch.append((self._names.get(ident, str(ident)), tuple(codes)))
+            del frames
+            with self._lock:
+                self._samples += 1
+                self._stacks.update(batch)
+            time.sleep(self.interval)
+
+    # ---------- 記錄 ----------
+    @contextmanager
+    def record(self, label, tick=None):
+        """包住一次巡檢；tick 為 TickContext（取其階段時間軸與降級紀錄）"""
+        if not self._record_lock.acquire(blocking=False):
+            yield  # 已有巡檢在記錄（手動與排程重疊）就不重複取樣
+            return
+        started = clock.now()
+        t0 = time.perf_counter()
+        try:
+            with self._lock:
+                self._stacks, self._samples = Counter(), 0
+            self._ensure_sampler()
+            self._active.set()
+            yield
+        finally:
+            self._active.clear()
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                stacks, samples = self._stacks, self._samples
+                self._stacks, self._samples = Counter(), 0
+            self._record_lock.release()
+            if elapsed >= self.threshold:
+                self._save(label, started, elapsed, stacks, samples, tick)
+
+    def _save(self, label, started, elapsed, stacks, samples, tick):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            stem = os.path.join(self.profile_dir, f"{started:%Y%m%d-%H%M%S}-{os.getpid()}")
+            with open(stem + ".folded", "w", encoding="utf-8") as fh:
+                fh.write(folded(stacks))
+            meta = {
+                "id": os.path.basename(stem),
+                "label": label,
+                "started": f"{started:%Y-%m-%d %H:%M:%S}",
+                "elapsed_ms": elapsed * 1000,
+                "samples": samples,
+                "spans": list(tick.spans) if tick is not None else [],
+                "degradations": tick.applied if tick is not None else [],
+            }
+            with open(stem + ".json", "w", encoding="utf-8") as fh:
+                json.dump(meta, fh, ensure_ascii=False)
+            for old in sorted(glob.glob(os.path.join(self.profile_dir, "*.json")))[:-self.keep]:
+                for path in (old, old[:-5] + ".folded"):
+                    if os.path.exists(path):
+                        os.remove(path)
+            logging.warning(f"🛩️ 慢巡檢 {label} 耗時 {elapsed:.1f}s，已保存 {samples} 次取樣（{meta['id']}）")
+        except OSError as e:
+            logging.error(f"❌ 飛行記錄寫入失敗: {e}")
+
+    # ---------- 讀取 ----------
+    def profiles(self):
+        """最近保存的慢巡檢（新的在前）"""
+        out = []
+        for path in sorted(glob.glob(os.path.join(self.profile_dir, "*.json")), reverse=True):
+            try:
+                with open(path, encoding="utf-8") as fh:
+                    out.append(json.load(fh))
+            except (OSError, ValueError):
+                continue
+        return out
+
+    def folded_text(self, profile_id):
+        """火焰圖 folded 格式（flamegraph.pl / speedscope 可直接讀）；找不到回傳 None"""
+        path = os.path.join(self.profile_dir, os.path.basename(profile_id) + ".folded")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as fh:
+            return fh.read()
+
+def folded(stacks):
+    """{(執行緒, (葉 code, ..., 根 code)): 次數} → 每行 `執行緒;根;...;葉 次數`"""
+    labels = {}
+    lines = []
+    for (thread, codes), count in stacks.most_common():
+        names = []
+        for code in reversed(codes):
+            name = labels.get(code)
+            if name is None:
+                name = labels[code] = _frame_label(code)
+            names.append(name)
+        lines.append(f"{thread};{';'.join(names)} {count}")
+    return "\n".join(lines) + "\n"
+
+FLIGHT_RECORDER = FlightRecorder()
+
+# === 量測：取樣開啟 / 關閉時的額外負擔 ===
+if __name__ == "__main__":
+    import tempfile
+
+    import numpy as np
+    import pandas as pd
+
+    from new_ten_thousand_grid import compute_advanced_grid
+
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 250)))
+    df = pd.DataFrame({"Close": close, "High": close * 1.01, "Low": close * 0.99})
+
+    def workload():
+        t0 = time.perf_counter()
+        for _ in range(300):
+            compute_advanced_grid(df)
+        return time.perf_counter() - t0
+
+    recorder = FlightRecorder(threshold=float("inf"), profile_dir=tempfile.mkdtemp())
+    workload()
+    base, sampled = [], []
+    for _ in range(7):  # 交替量測取中位數，降低機器雜訊
+        base.append(workload())
+        with recorder.record("bench"):
+            sampled.append(workload())
+    b, s = float(np.median(base)), float(np.median(sampled))
+    print(f"🛩️ 取樣間隔 {SAMPLE_INTERVAL * 1000:.0f}ms：{b * 1000:.0f} → {s * 1000:.0f} ms，額外負擔 {(s / b - 1) * 100:+.2f}%")
+
+    recorder.threshold = 0
+    with recorder.record("demo"):
+        workload()
+    meta = recorder.profiles()[0]
+    print(f"📄 {meta['id']}：{meta['samples']} 次取樣，folded 前幾行：")
+    print("\n".join(recorder.folded_text(meta["id"]).splitlines()[:3]))
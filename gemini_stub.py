@@ -0,0 +1,188 @@
+# gemini_stub.py - 本地 Gemini API 模擬伺服器（離線量測用，不消耗額度）
+import json
+import time
+import random
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+# === 模擬回應設定（可於量測時直接修改）===
+STUB_CONFIG = {
+    "response": {"decision": "定期定額", "confidence": 70, "reason": "美股偏多，台股可望高開，位階中性宜分批佈局"},
+    # 美股盤後提示詞（要求 next_day 欄位）的回應
+    "us_response": {"sentiment": "多頭", "strength": 72, "tsm_trend": "強勢", "next_day": "上漲", "reason": "科技股領漲，費半走強"},
+    "chunk_chars": 12,         # 每個串流片段的字數
+    "chunk_delay": 0.03,       # 每個片段的生成時間（秒），模擬 token 輸出速度
+    "trailing_chunks": 40,     # JSON 之後模型繼續輸出的多餘片段（思考過程 / 補充說明）
+    # --- 故障注入（每個請求依比例抽一種；其餘為正常回應）---
+    "latency": 0.0,            # 開始輸出前的固定延遲（秒）
+    "latency_jitter": 0.0,     # 額外延遲的平均值（指數分佈，製造長尾）
+    "rate_limit": 0.0,         # 回 429 的比例
+    "malformed": 0.0,          # JSON 寫壞（結尾多逗號、缺右括號），欄位仍在：靠備用解析救回
+    "garbage": 0.0,            # 完全沒有 JSON 的自由文字
+    "timeout": 0.0,            # 卡住 hang_seconds 秒不回應（用戶端應逾時放棄）
+    "hang_seconds": 10.0,
+    "seed": None,              # 固定亂數種子讓多次量測可比較
+    # 指定模型固定發生某種故障（例如 {"gemma-3-27b-it": "garbage"}），不被換模型重試蓋掉
+    "model_faults": {},
+}
+FAULTS = ("rate_limit", "malformed", "garbage", "timeout")
+
+# 各種結果的次數與各模型收到的請求數（量測程式讀取；reset_stats() 歸零）
+STUB_STATS = {}
+MODEL_STATS = {}
+_rng = random.Random()
+_stats_lock = threading.Lock()
+
+def reset_stats(seed=None):
+    with _stats_lock:
+        STUB_STATS.clear()
+        MODEL_STATS.clear()
+        _rng.seed(STUB_CONFIG["seed"] if seed is None else seed)
+
+def _pick_fault(model=""):
+    """依設定比例抽出本次請求的故障種類（'ok' 為正常；model_faults 指定的模型固定該故障）"""
+    with _stats_lock:
+        roll, delay = _rng.random(), STUB_CONFIG["latency"]
+        if STUB_CONFIG["latency_jitter"]:
+            delay += _rng.expovariate(1 / STUB_CONFIG["latency_jitter"])
+        fault, edge = STUB_CONFIG["model_faults"].get(model, "ok"), 0.0
+        for name in FAULTS if fault == "ok" else ():
+            edge += STUB_CONFIG[name]
+            if roll < edge:
+                fault = name
+                break
+        STUB_STATS[fault] = STUB_STATS.get(fault, 0) + 1
+        MODEL_STATS[model] = MODEL_STATS.get(model, 0) + 1
+    return fault, delay
+
+def _response_text(prompt, fault):
+    response = STUB_CONFIG["us_response"] if "next_day" in prompt else STUB_CONFIG["response"]
+    body = json.dumps(response, ensure_ascii=False)
+    if fault == "malformed":
+        body = body[:-1] + ",\n"  # 多一個逗號、少右括號
+    elif fault == "garbage":
+        return "抱歉，我目前無法提供明確的投資建議，請參考市場資訊自行判斷。"
+    return "```json\n" + body + "\n```"
+
+def _stub_chunks(prompt="", fault="ok"):
+    """把模擬回應切成片段：JSON 本體 + 後續多餘輸出"""
+    text = _response_text(prompt, fault)
+    size = STUB_CONFIG["chunk_chars"]
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+    chunks += ["\n補充說明：以上判斷僅供參考。" for _ in range(STUB_CONFIG["trailing_chunks"])]
+    return chunks
+
+def _candidate(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            prompt = "".join(p.get("text", "") for c in payload.get("contents", []) for p in c.get("parts", []))
+        except ValueError:
+            prompt = ""
+        # 路徑為 /v1beta/models/<模型>:generateContent 或 :streamGenerateContent
+        model = self.path.split("/models/", 1)[-1].split(":", 1)[0]
+        fault, delay = _pick_fault(model)
+        if fault == "rate_limit":
+            self._send_json(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Quota exceeded"}})
+            return
+        time.sleep(STUB_CONFIG["hang_seconds"] if fault == "timeout" else delay)
+        chunks = _stub_chunks(prompt, fault)
+
+        if ":streamGenerateContent" in self.path:
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for piece in chunks:
+                    time.sleep(STUB_CONFIG["chunk_delay"])
+                    line = "data: " + json.dumps(_candidate(piece), ensure_ascii=False) + "\r\n\r\n"
+                    self.wfile.write(line.encode("utf-8"))
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 用戶端提前中斷 = 預期行為
+            self.close_connection = True
+            return
+
+        # 阻塞模式：整段生成完才回應
+        time.sleep(STUB_CONFIG["chunk_delay"] * len(chunks))
+        try:
+            self._send_json(200, _candidate("".join(chunks)))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 用戶端已逾時放棄
+
+def start_stub(port=0):
+    """在背景執行緒啟動 stub，回傳 (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+def measure_time_to_decision(rounds=5):
+    """
+    比較阻塞與串流兩種路徑取得決策的時間（毫秒）
+    與 ai_bench 相同：額度帳寫到暫存目錄、每條路徑一本新的額度帳，結束後還原，不碰正式狀態
+    """
+    import os
+    import shutil
+    import tempfile
+
+    scratch = tempfile.mkdtemp(prefix="gemini-stub-")
+    saved_dir = os.environ.get("SHARED_STATE_DIR")
+    os.environ["SHARED_STATE_DIR"] = scratch
+    os.environ.setdefault("GEMINI_API_KEY", "stub-key")
+
+    import ai_expert
+    from ai_budget import AIBudget
+
+    server, base = start_stub()
+    saved = (ai_expert.GEMINI_API_BASE, ai_expert.BUDGET)
+    ai_expert.GEMINI_API_BASE = base
+
+    results = {}
+    try:
+        for label, stream in (("阻塞", False), ("串流", True)):
+            ai_expert.BUDGET = AIBudget(name=f"stub_budget_{'stream' if stream else 'blocking'}", state_dir=scratch)
+            samples = []
+            for _ in range(rounds):
+                t0 = time.perf_counter()
+                decision = ai_expert._call_gemini_api("stub", stream=stream)
+                samples.append((time.perf_counter() - t0) * 1000)
+                assert decision and decision.get("decision") == STUB_CONFIG["response"]["decision"]
+            samples.sort()
+            results[label] = samples[len(samples) // 2]
+    finally:
+        ai_expert.GEMINI_API_BASE, ai_expert.BUDGET = saved
+        server.shutdown()
+        if saved_dir is None:
+            os.environ.pop("SHARED_STATE_DIR", None)
+        else:
+            os.environ["SHARED_STATE_DIR"] = saved_dir
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+if __name__ == "__main__":
+    res = measure_time_to_decision()
+    print(f"⏱️ 阻塞取得決策（中位數）: {res['阻塞']:.0f} ms")
+    print(f"⚡ 串流取得決策（中位數）: {res['串流']:.0f} ms")
+    print(f"📉 節省: {(1 - res['串流'] / res['阻塞']) * 100:.0f}%")
@@ -0,0 +1,214 @@
+# grid_ledger.py - 萬元網格虛擬帳本（只追加的事件日誌，每次巡檢以 O(檔位數) 更新損益）
+import os
+import json
+import logging
+import threading
+
+from shared_state import STATE_DIR, _file_lock
+import market_clock as clock
+
+LEDGER_PATH = os.path.join(STATE_DIR, "grid_ledger.jsonl")
+GRID_LEVELS = 5          # 每標的最多同時持有的網格檔位（與 run_grid 的每格配置一致）
+LEVEL_GAP = 0.02         # 新掛單至少低於最低持有檔位 2%，避免同一價位重複買進
+REPRICE_TOL = 0.005      # 補倉價變動不到 0.5% 就沿用原掛單（盤中現價跳動不必每次改單）
+FEE_RATE = 0.001425      # 手續費（買賣各一次）
+TAX_RATE = {"etf": 0.001, "stock": 0.003}  # 證交稅（賣出）
+
+def _tax_rate(symbol):
+    return TAX_RATE["etf"] if symbol.startswith("00") else TAX_RATE["stock"]
+
+class _Book:
+    """單一標的的帳：掛單一筆、持有檔位數筆，持股與成本為累計值（損益不必重掃）"""
+    __slots__ = ("pending", "lots", "shares", "cost", "realized", "fills")
+
+    def __init__(self):
+        self.pending = None   # {"px", "qty", "tp", "day"}
+        self.lots = {}        # 買進事件編號 → {"qty", "px", "cost", "tp", "day"}
+        self.shares = 0
+        self.cost = 0.0       # 持有檔位的總成本（含手續費）
+        self.realized = 0.0
+        self.fills = 0
+
+class GridLedger:
+    """
+    事件（每行一筆 JSON）：order 掛單 / cancel 撤單 / buy 成交買進 / sell 停利賣出
+    - 檔案只追加不改寫；啟動時重播一次，之後只讀別的行程新追加的部分
+    - update() 每次巡檢對每個標的只看掛單與持有檔位，與歷史長度無關
+    - 掛單當天以巡檢時的現價判斷成交，之後的 K 棒（例如停機錯過的日子）以最高 / 最低價判斷
+    """
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._books = {}
+        self._seq = 0
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def _book(self, symbol):
+        book = self._books.get(symbol)
+        if book is None:
+            book = self._books[symbol] = _Book()
+        return book
+
+    # ---------- 事件 ----------
+    def _apply(self, ev):
+        book = self._book(ev["sym"])
+        kind = ev["ev"]
+        self._seq = max(self._seq, ev["id"])
+        if kind == "order":
+            book.pending = {"px": ev["px"], "qty": ev["qty"], "tp": ev["tp"], "day": ev["day"]}
+        elif kind == "cancel":
+            book.pending = None
+        elif kind == "buy":
+            cost = ev["qty"] * ev["px"] * (1 + FEE_RATE)
+            book.lots[ev["id"]] = {"qty": ev["qty"], "px": ev["px"], "cost": cost, "tp": ev["tp"], "day": ev["day"]}
+            book.pending = None
+            book.shares += ev["qty"]
+            book.cost += cost
+            book.fills += 1
+        elif kind == "sell":
+            lot = book.lots.pop(ev["lot"])
+            book.shares -= lot["qty"]
+            book.cost -= lot["cost"]
+            book.realized += lot["qty"] * ev["px"] * (1 - FEE_RATE - _tax_rate(ev["sym"])) - lot["cost"]
+            book.fills += 1
+
+    def _sync(self):
+        """讀入其他行程（例如手動巡檢的 worker）新追加的事件；呼叫端需持有檔案鎖"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == self._offset:
+            return
+        with open(self.path, "rb") as fh:
+            fh.seek(self._offset)
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break  # 寫到一半的行留到下次
+                self._offset += len(line)
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    logging.error(f"⚠️ 網格帳本事件無法解析，略過: {e}")
+
+    def _emit(self, events, ev, **fields):
+        self._seq += 1
+        event = {"id": self._seq, "ev": ev, "t": f"{clock.now():%Y-%m-%d %H:%M}", **fields}
+        self._apply(event)
+        events.append(event)
+        return event
+
+    # ---------- 每次巡檢 ----------
+    def update(self, symbol, bar_day, low, high, price, grid_buy, budget):
+        """
+        bar_day: 最新 K 棒日期（YYYY-MM-DD）；low/high/price: 該 K 棒最低 / 最高 / 現價
+        grid_buy: 本次補倉價；budget: 此標的可用資金
+        回傳本次新增的事件
+        """
+        with self._lock, _file_lock(self.path + ".lock"):
+            self._sync()
+            book = self._book(symbol)
+            events = []
+
+            # 1. 停利：持有檔位觸及目標價就賣出
+            for lot_id, lot in list(book.lots.items()):
+                touch = high if lot["day"] < bar_day else price
+                if touch >= lot["tp"]:
+                    self._emit(events, "sell", sym=symbol, lot=lot_id, px=lot["tp"], qty=lot["qty"], day=bar_day)
+
+            # 2. 掛單成交
+            order = book.pending
+            if order is not None:
+                touch = low if order["day"] < bar_day else price
+                if touch <= order["px"]:
+                    self._emit(events, "buy", sym=symbol, px=order["px"], qty=order["qty"], tp=order["tp"], day=bar_day)
+
+            # 3. 依本次補倉價重新掛單（變動不大就不寫事件）
+            px = grid_buy
+            if book.lots:
+                px = min(px, min(lot["px"] for lot in book.lots.values()) * (1 - LEVEL_GAP))
+            px = round(px, 2)
+            qty = int(budget / GRID_LEVELS // px) if px > 0 else 0
+            can_place = (
+                0 < px < price and qty > 0 and len(book.lots) < GRID_LEVELS
+                and book.cost + qty * px * (1 + FEE_RATE) <= budget
+            )
+            if not can_place:
+                if book.pending is not None:
+                    self._emit(events, "cancel", sym=symbol)
+            elif book.pending is None or abs(book.pending["px"] / px - 1) > REPRICE_TOL:
+                self._emit(events, "order", sym=symbol, px=px, qty=qty, tp=round(price, 2), day=bar_day)
+
+            if events:
+                self._append(events)
+            return events
+
+    def _append(self, events):
+        data = "".join(json.dumps(ev, ensure_ascii=False) + "\n" for ev in events).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as fh:
+                fh.write(data)
+            self._offset += len(data)
+        except OSError as e:
+            logging.error(f"❌ 網格帳本寫入失敗: {e}")
+
+    # ---------- 讀取 ----------
+    def summary(self, symbol, price):
+        """帳本摘要（只讀累計值，不重算歷史）"""
+        with self._lock:
+            book = self._book(symbol)
+            value = book.shares * price
+            return {
+                "shares": book.shares,
+                "levels": len(book.lots),
+                "cost": book.cost,
+                "avg_cost": book.cost / book.shares if book.shares else 0.0,
+                "unrealized": value * (1 - FEE_RATE - _tax_rate(symbol)) - book.cost if book.shares else 0.0,
+                "realized": book.realized,
+                "fills": book.fills,
+                "pending": dict(book.pending) if book.pending else None,
+            }
+
+    def load(self):
+        """啟動時重播整個日誌"""
+        with self._lock, _file_lock(self.path + ".lock"):
+            self._sync()
+        return self
+
+def format_ledger(s):
+    """報告用的單標的帳本摘要（兩行）"""
+    pending = f"掛單 `{s['pending']['px']:.2f} × {s['pending']['qty']}` → 停利 `{s['pending']['tp']:.2f}`" if s["pending"] else "無掛單"
+    return (
+        f"📒 **虛擬帳本**： 持有 `{s['shares']} 股`（{s['levels']} 檔，均價 `{s['avg_cost']:.2f}`），{pending}\n"
+        f"💹 **損益**： 未實現 `{s['unrealized']:+,.0f}` ／ 已實現 `{s['realized']:+,.0f}` TWD（成交 {s['fills']} 筆）"
+    )
+
+GRID_LEDGER = GridLedger().load()
+
+# === 量測：每次更新的成本與日誌長度無關 ===
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    path = os.path.join(tempfile.mkdtemp(), "grid_ledger.jsonl")
+    ledger = GridLedger(path)
+    price = 20.0
+    per_tick = []
+    for day in range(250):
+        bar_day = f"2026-{1 + day // 21:02d}-{1 + day % 21:02d}"
+        low = high = price
+        grid_buy = price * 0.97  # 補倉價主要由日線（布林下軌 / ATR）決定，盤中變動不大
+        for _ in range(90):  # 一天 90 次巡檢
+            price *= np.exp(rng.normal(0, 0.002))
+            low, high = min(low, price), max(high, price)
+            t0 = time.perf_counter()
+            ledger.update("00929.TW", bar_day, low, high, price, grid_buy, 3300)
+            per_tick.append(time.perf_counter() - t0)
+    s = ledger.summary("00929.TW", price)
+    first, last = np.median(per_tick[:900]) * 1e6, np.median(per_tick[-900:]) * 1e6
+    print(f"📒 {len(per_tick)} 次更新，日誌 {os.path.getsize(path) / 1024:.0f}KB；每次更新中位數 前 10 天 {first:.0f}µs / 後 10 天 {last:.0f}µs")
+    print(format_ledger(s))
+    t0 = time.perf_counter()
+    reloaded = GridLedger(path).load().summary("00929.TW", price)
+    print(f"🔁 重播日誌 {(time.perf_counter() - t0) * 1000:.1f}ms，結果一致：{reloaded == s}")
@@ -0,0 +1,17 @@
+# gunicorn.conf.py - 正式環境 WSGI 設定（多 worker + 排程主控選舉）
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+# gthread：長連線（手動巡檢、後續即時頁面）不會卡住整個 worker
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = 120
+graceful_timeout = 30
+accesslog = "-"
+loglevel = "info"
+
+def post_worker_init(worker):
+    """每個 worker 啟動後都參與選舉，只有一個會真正跑排程"""
+    from main import start_background_scheduler
+    start_background_scheduler()
@@ -0,0 +1,125 @@
+# history_cache.py - 日線快取（昨天以前的 K 棒每天只抓一次，盤中只補最近幾天）
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+import market_clock as clock
+from tick_context import request_timeout
+
+FULL_PERIOD = "1y"
+RECENT_PERIOD = "5d"
+FETCH_TIMEOUT = 15      # 單次日線請求的逾時上限（巡檢內再受剩餘預算限制，見 fetch_timeout）
+
+def _bar_dates(index):
+    """K 棒日期（有時區的索引先換成台北時間）"""
+    if getattr(index, "tz", None) is not None:
+        index = index.tz_convert(clock.TW_TZ)
+    return np.array(index.date)
+
+def fetch_timeout():
+    """日線請求逾時：不超過 FETCH_TIMEOUT，巡檢中也不超過剩餘時間預算"""
+    return request_timeout(FETCH_TIMEOUT)
+
+class HistoryCache:
+    """
+    download(period) 為實際抓資料的函式（yfinance）
+    - 當天第一次：抓一整年，保存今天以前已收盤的 K 棒
+    - 之後：只抓最近幾天，接在快取尾端（重疊的日期以新資料為準）
+    省下的是每次巡檢的下載量（約 250 根 → 5 根）；指標與繪圖仍吃 DataFrame，
+    快取直接保存 float64 的 DataFrame，每次巡檢只有接上最近幾天的那一次複製
+    """
+
+    def __init__(self, recent_period=RECENT_PERIOD):
+        self.recent_period = recent_period
+        self._frames = {}  # symbol → (建立日期, 今天以前的日線 DataFrame)
+        self._lock = threading.Lock()
+
+    def get(self, symbol, download):
+        today = clock.now(clock.TW_TZ).date()
+        with self._lock:
+            entry = self._frames.get(symbol)
+        if entry is None or entry[0] != today:
+            df = download(FULL_PERIOD)
+            if not df.empty:
+                with self._lock:
+                    self._frames[symbol] = (today, df[_bar_dates(df.index) < today])
+            return df
+
+        base = entry[1]
+        recent = download(self.recent_period)
+        if recent.empty:
+            return base.copy(deep=False)
+        cut = int(base.index.searchsorted(recent.index[0], side="left"))
+        return pd.concat([base.iloc[:cut], recent])
+
+    def preload(self, symbol, download):
+        """開盤前暖機：建立當天的快取"""
+        df = self.get(symbol, download)
+        logging.info(f"📚 {symbol} 日線快取 {len(df)} 根")
+        return df
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+HISTORY = HistoryCache()
+
+# === 量測：盤中每次巡檢 HISTORY.get 與原本每次 yf.download 一整年的比較 ===
+if __name__ == "__main__":
+    """
+    python history_cache.py              # 替代行情（只比本地 CPU 與下載根數，不含網路）
+    python history_cache.py 2330.TW ...  # 實際 yfinance（含網路，需連線）
+    """
+    import sys
+    import time
+
+    live = sys.argv[1:]
+    downloaded = {"rows": 0}
+    if live:
+        import yfinance as yf
+
+        symbols = live
+        ticks = 5
+
+        def download(symbol, period):
+            df = yf.download(symbol, period=period, interval="1d", progress=False, timeout=FETCH_TIMEOUT)
+            if isinstance(df.columns, pd.MultiIndex):
+                df.columns = df.columns.get_level_values(0)
+            downloaded["rows"] += len(df)
+            return df
+    else:
+        rng = np.random.default_rng(0)
+        today = pd.Timestamp(clock.now(clock.TW_TZ)).normalize()
+        idx = pd.bdate_range(end=today, periods=250, tz=clock.TW_TZ)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(idx))))
+        full = pd.DataFrame({"Open": close * 0.999, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                             "Volume": rng.integers(1_000, 50_000, len(idx)).astype("f8")}, index=idx)
+        symbols = [f"S{i}" for i in range(6)]
+        ticks = 90  # 一天約 90 次盤中巡檢
+
+        def download(symbol, period):
+            """模擬 yfinance 回傳的新 DataFrame（不含網路與 JSON 解析）"""
+            part = full.tail(len(full) if period == FULL_PERIOD else 5)
+            downloaded["rows"] += len(part)
+            return pd.DataFrame({c: part[c].to_numpy().copy() for c in part.columns}, index=part.index.copy())
+
+    def measure(fetch):
+        downloaded["rows"] = 0
+        t0 = time.perf_counter()
+        for _ in range(ticks):
+            for s in symbols:
+                fetch(s)
+        return (time.perf_counter() - t0) * 1000 / ticks, downloaded["rows"] / ticks
+
+    cache = HistoryCache()
+    for s in symbols:
+        cache.get(s, lambda period, s=s: download(s, period))  # 當天第一次（建立快取）不計入盤中平均
+    old = measure(lambda s: download(s, FULL_PERIOD))
+    new = measure(lambda s: cache.get(s, lambda period: download(s, period)))
+    same = all(cache.get(s, lambda period, s=s: download(s, period)).equals(download(s, FULL_PERIOD)) for s in symbols)
+    retained = sum(df.memory_usage(deep=True).sum() for _, df in cache._frames.values())
+    print(f"📥 每次巡檢（{len(symbols)} 標的，{'yfinance' if live else '替代行情、不含網路'}）："
+          f"原本 yf.download 一整年 {old[1]:.0f} 根 / {old[0]:.1f}ms → HISTORY.get {new[1]:.0f} 根 / {new[0]:.1f}ms")
+    print(f"💾 快取常駐 {retained / 1024:.0f}KB ｜ 結果與整年下載相同：{same}")
@@ -0,0 +1,121 @@
+# image_encoder.py - Discord 附件壓縮編碼（調色盤 PNG / WebP、自動縮放、位元組預算）
+import io
+import time
+import logging
+import threading
+from collections import deque
+
+from PIL import Image
+
+# === 各頻道的編碼設定：位元組預算與可用格式 ===
+CHANNEL_PROFILES = {
+    "discord": {"budget": 350 * 1024, "formats": ("png8", "webp")},
+}
+# 嘗試順序：先保持原尺寸換格式，不夠再降解析度（相當於動態 DPI）
+SCALES = (1.0, 0.8, 0.65, 0.5)
+PALETTE_COLORS = 128
+WEBP_QUALITY = 80
+
+_MIME = {"png8": ("png", "image/png"), "webp": ("webp", "image/webp"), "png": ("png", "image/png")}
+
+# 每種圖表上次成功的 (格式, 縮放)；下次先試同格式的上一級尺寸、再試它本身，免去重新搜尋
+_chosen = {}
+_chosen_lock = threading.Lock()
+
+# 最近的上傳紀錄（位元組 / 延遲）
+UPLOAD_LOG = deque(maxlen=500)
+
+def _encode(img, fmt, scale):
+    if scale != 1.0:
+        img = img.resize((max(int(img.width * scale), 1), max(int(img.height * scale), 1)), Image.LANCZOS)
+    out = io.BytesIO()
+    if fmt == "png8":
+        img.quantize(colors=PALETTE_COLORS, method=Image.Quantize.FASTOCTREE).save(out, format="PNG", optimize=True)
+    elif fmt == "webp":
+        img.save(out, format="WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        img.save(out, format="PNG")
+    out.seek(0)
+    return out
+
+def encode_chart(buf, chart_type, channel="discord"):
+    """
+    依頻道預算挑選格式與尺寸，回傳 (buffer, 副檔名, MIME, 設定描述)
+    同一種圖表沿用上次選定的格式：先試上一級尺寸（預算夠就升回去，縮小過的圖不會一直停在小尺寸），
+    再試上次的尺寸，都超出預算才重新搜尋
+    """
+    profile = CHANNEL_PROFILES.get(channel, CHANNEL_PROFILES["discord"])
+    buf.seek(0)
+    img = Image.open(buf).convert("RGB")
+
+    candidates = [(fmt, scale) for scale in SCALES for fmt in profile["formats"]]
+    key = (chart_type, channel)
+    with _chosen_lock:
+        cached = _chosen.get(key)
+    if cached in candidates:
+        fmt, scale = cached
+        i = SCALES.index(scale)
+        preferred = [(fmt, s) for s in SCALES[max(i - 1, 0):i + 1]]
+        candidates = preferred + [c for c in candidates if c not in preferred]
+
+    best = None
+    for fmt, scale in candidates:
+        out = _encode(img, fmt, scale)
+        size = out.getbuffer().nbytes
+        if best is None or size < best[0]:
+            best = (size, out, fmt, scale)
+        if size <= profile["budget"]:
+            break
+    size, out, fmt, scale = best
+    with _chosen_lock:
+        _chosen[key] = (fmt, scale)
+
+    ext, mime = _MIME[fmt]
+    return out, ext, mime, f"{fmt}@{scale:g}x {size / 1024:.0f}KB"
+
+def record_upload(chart_type, nbytes, elapsed_ms, ok=True):
+    UPLOAD_LOG.append({"chart": chart_type, "bytes": nbytes, "ms": elapsed_ms, "ok": ok, "ts": time.time()})
+    logging.info(f"📤 上傳 {chart_type}：{nbytes / 1024:.0f}KB / {elapsed_ms:.0f}ms{'' if ok else '（失敗）'}")
+
+def upload_stats():
+    """各圖表的平均上傳大小與延遲"""
+    stats = {}
+    for rec in list(UPLOAD_LOG):
+        st = stats.setdefault(rec["chart"], {"count": 0, "bytes": 0, "ms": 0.0})
+        st["count"] += 1
+        st["bytes"] += rec["bytes"]
+        st["ms"] += rec["ms"]
+    return {k: {"count": v["count"], "avg_kb": v["bytes"] / v["count"] / 1024, "avg_ms": v["ms"] / v["count"]}
+            for k, v in stats.items()}
+
+# === 量測：原始 PNG 與壓縮後的大小 ===
+if __name__ == "__main__":
+    import warnings
+
+    import numpy as np
+    import pandas as pd
+
+    import chart_renderer
+
+    warnings.filterwarnings("ignore")
+    rng = np.random.default_rng(0)
+    idx = pd.bdate_range(end="2026-10-16", periods=250)
+    names = {"^GSPC": "標普500", "^DJI": "道瓊工業", "^IXIC": "那斯達克", "TSM": "台積電ADR"}
+    us = {s: pd.DataFrame({"Close": 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 250)))}, index=idx) for s in names}
+    tw = us["TSM"]["Close"] / 10
+
+    raw = {
+        "tw_realtime": chart_renderer.render_taiwan_chart(idx, tw, float(tw.iloc[-1]), "測試"),
+        "us_close": chart_renderer.render_us_dashboard(us, names),
+    }
+    for chart, buf in raw.items():
+        before = buf.getbuffer().nbytes
+        for label in ("首次", "快取"):
+            t0 = time.perf_counter()
+            _, ext, _, desc = encode_chart(buf, chart)
+            ms = (time.perf_counter() - t0) * 1000
+            print(f"🖼️ {chart}（{label}）：{before / 1024:.0f}KB → {desc}，編碼 {ms:.0f}ms")
+        # 某天被迫縮到最小之後，預算夠時應逐次升回原尺寸
+        _chosen[(chart, "discord")] = (_chosen[(chart, "discord")][0], SCALES[-1])
+        steps = [encode_chart(buf, chart)[3].split()[0] for _ in SCALES]
+        print(f"   ↗️ 從 {SCALES[-1]:g}x 恢復：{' → '.join(steps)}")
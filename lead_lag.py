@@ -0,0 +1,285 @@
+# lead_lag.py - 美股 → 台股連動引擎（滾動相關 / 迴歸增量維護，FFT 交叉相關找領先落後，推估開盤跳空）
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import market_clock as clock
+
+US_DRIVERS = {"^GSPC": "標普500", "^IXIC": "那斯達克", "TSM": "台積電ADR"}
+CORR_WINDOW = 60     # 滾動相關 / 迴歸視窗（交易日）
+XCORR_WINDOW = 120   # 交叉相關視窗
+MAX_LAG = 5          # 交叉相關檢查 ±5 個交易日
+MIN_PAIRS = 20       # 樣本少於此數不做推估
+
+def _days(df):
+    """日線索引 → 當地日期（datetime64[D]）"""
+    index = df.index if isinstance(df.index, pd.DatetimeIndex) else pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.values.astype("datetime64[D]")
+
+def _log_ret(values):
+    out = np.full(len(values), np.nan)
+    out[1:] = np.diff(np.log(values))
+    return out
+
+def cross_correlation(x, y, max_lag=MAX_LAG):
+    """
+    x, y: shape=(配對數, N) 的報酬矩陣（同一列為一組配對，NaN 視為 0）
+    回傳 shape=(配對數, 2*max_lag+1)，第 k 欄為 corr(x[t], y[t + k - max_lag])
+    所有配對一次做 rFFT（補零到 2 的次方，避免循環相關混入）
+    """
+    x = np.nan_to_num(np.asarray(x, dtype="f8"))
+    y = np.nan_to_num(np.asarray(y, dtype="f8"))
+    n = x.shape[1]
+    x = (x - x.mean(axis=1, keepdims=True)) / (x.std(axis=1, keepdims=True) + 1e-12)
+    y = (y - y.mean(axis=1, keepdims=True)) / (y.std(axis=1, keepdims=True) + 1e-12)
+    size = 1 << int(np.ceil(np.log2(2 * n - 1)))
+    spec = np.conj(np.fft.rfft(x, size, axis=1)) * np.fft.rfft(y, size, axis=1)
+    full = np.fft.irfft(spec, size, axis=1)
+    # full[:, k] = Σ x[t] y[t+k]；負的 lag 在尾端
+    lags = np.concatenate([full[:, size - max_lag:], full[:, :max_lag + 1]], axis=1)
+    return lags / (n - np.abs(np.arange(-max_lag, max_lag + 1)))
+
+class _Rolling:
+    """(x, y) 滾動視窗的累計和：每天進一筆出一筆，相關係數 / β 為 O(1)"""
+    __slots__ = ("window", "pairs", "sx", "sy", "sxx", "syy", "sxy", "last_day")
+
+    def __init__(self, window):
+        self.window = window
+        self.pairs = deque()
+        self.sx = self.sy = self.sxx = self.syy = self.sxy = 0.0
+        self.last_day = None
+
+    def push(self, day, x, y):
+        self.last_day = day
+        if not (np.isfinite(x) and np.isfinite(y)):
+            return
+        self.pairs.append((x, y))
+        self.sx += x; self.sy += y; self.sxx += x * x; self.syy += y * y; self.sxy += x * y
+        if len(self.pairs) > self.window:
+            ox, oy = self.pairs.popleft()
+            self.sx -= ox; self.sy -= oy; self.sxx -= ox * ox; self.syy -= oy * oy; self.sxy -= ox * oy
+
+    def stats(self):
+        """(相關係數, β, α)；樣本不足回傳 None"""
+        n = len(self.pairs)
+        if n < MIN_PAIRS:
+            return None
+        cov = self.sxy - self.sx * self.sy / n
+        vx = self.sxx - self.sx ** 2 / n
+        vy = self.syy - self.sy ** 2 / n
+        if vx <= 0 or vy <= 0:
+            return None
+        beta = cov / vx
+        return cov / np.sqrt(vx * vy), beta, (self.sy - beta * self.sx) / n
+
+class LeadLagEngine:
+    """
+    台股每個交易日 d 對應「d 之前最後一個美股交易日」的報酬（台北時間清晨收盤）：
+    - 隔夜跳空 log(開盤 / 前收) 對該美股報酬做滾動相關與迴歸（_Rolling，每天增量推進）
+    - 收盤報酬的 FFT 交叉相關找出領先幾個交易日（每天一次、所有配對一起算）
+    - 當天的開盤推估 = α + β × 最近一個美股交易日報酬（取相關最高的美股標的）
+    盤中每次巡檢只回傳當天已算好的結果
+    """
+
+    def __init__(self, drivers=US_DRIVERS, window=CORR_WINDOW):
+        self.drivers = dict(drivers)
+        self.window = window
+        self._rolling = {}      # (美股, 台股) → _Rolling
+        self._features = {}
+        self._day = None
+        self._lock = threading.Lock()
+
+    def stale(self):
+        return self._day != clock.now(clock.TW_TZ).date()
+
+    @property
+    def features(self):
+        return self._features
+
+    def update(self, us_dfs, tw_dfs):
+        """us_dfs / tw_dfs: {代號: 日線}；回傳 {台股代號: 特徵}"""
+        with self._lock:
+            today = clock.now(clock.TW_TZ).date()
+            if self._day == today:
+                return self._features
+            us = {s: (_days(df), df["Close"].to_numpy(dtype="f8")) for s, df in us_dfs.items()
+                  if s in self.drivers and df is not None and len(df) > 1}
+            features, xs, ys, pairs = {}, [], [], []
+            for tw, df in tw_dfs.items():
+                if df is None or len(df) < 2:
+                    continue
+                days = _days(df)
+                close = df["Close"].to_numpy(dtype="f8")
+                gap = np.full(len(df), np.nan)
+                gap[1:] = np.log(df["Open"].to_numpy(dtype="f8")[1:] / close[:-1])
+                tw_ret = _log_ret(close)
+                best = None
+                for driver, (us_days, us_close) in us.items():
+                    us_ret = _log_ret(us_close)
+                    # d 之前最後一個美股交易日（同一日期的美股在台股收盤後才開盤）
+                    prior = np.searchsorted(us_days, days, side="left") - 1
+                    x = np.where(prior >= 0, us_ret[np.maximum(prior, 0)], np.nan)
+                    stats = self._advance((driver, tw), days, x, gap)
+                    latest = np.searchsorted(us_days, np.datetime64(today, "D"), side="left") - 1
+                    if stats is None or latest < 1:
+                        continue
+                    corr, beta, alpha = stats
+                    if best is None or abs(corr) > abs(best["corr"]):
+                        est = alpha + beta * us_ret[latest]
+                        best = {"driver": driver, "corr": corr, "beta": beta,
+                                "us_ret": (np.exp(us_ret[latest]) - 1) * 100,
+                                "gap_est": (np.exp(est) - 1) * 100}
+                    # 交叉相關用同日期對齊的收盤報酬（同一日期的美股晚於台股）
+                    same = np.searchsorted(us_days, days, side="right") - 1
+                    xs.append(np.where(same >= 0, us_ret[np.maximum(same, 0)], np.nan)[-XCORR_WINDOW:])
+                    ys.append(tw_ret[-XCORR_WINDOW:])
+                    pairs.append((driver, tw))
+                if best is not None:
+                    best["actual_gap"] = (np.exp(gap[-1]) - 1) * 100 if days[-1] == np.datetime64(today, "D") else None
+                    features[tw] = best
+
+            if pairs:
+                n = min(len(v) for v in xs)
+                xc = cross_correlation(np.stack([v[-n:] for v in xs]), np.stack([v[-n:] for v in ys]))
+                lags = np.arange(-MAX_LAG, MAX_LAG + 1)
+                for (driver, tw), row in zip(pairs, xc):
+                    if tw in features and features[tw]["driver"] == driver:
+                        k = int(np.argmax(np.abs(row)))
+                        features[tw]["lead"] = int(lags[k])
+                        features[tw]["lead_corr"] = float(row[k])
+
+            self._features = features
+            used_tw = [tw for tw, df in tw_dfs.items() if df is not None and len(df) >= 2]
+            if not us or not used_tw:
+                # 美股或台股日線抓取失敗：不算完成，下次巡檢重算（否則整天都沒有連動特徵）
+                logging.warning(f"⚠️ 美股連動資料不足（美股 {len(us)} 檔、台股 {len(used_tw)} 檔），下次巡檢重試")
+                return features
+            self._day = today
+            logging.info(f"🌉 美股連動更新：{len(features)} 檔台股、{len(pairs)} 組配對")
+            return features
+
+    def refresh_actual(self, tw_dfs):
+        """
+        當天特徵已算好、但還沒有實際跳空的台股（開盤前暖機時當天 K 棒尚未出現）：
+        當天第一根出現後只補上 actual_gap，不重做滾動迴歸與 FFT
+        """
+        with self._lock:
+            today = np.datetime64(clock.now(clock.TW_TZ).date(), "D")
+            features = self._features
+            for tw, f in features.items():
+                df = tw_dfs.get(tw)
+                if f.get("actual_gap") is not None or df is None or len(df) < 2 or _days(df)[-1] != today:
+                    continue
+                gap = np.log(float(df["Open"].iloc[-1]) / float(df["Close"].iloc[-2]))
+                features = {**features, tw: {**f, "actual_gap": (np.exp(gap) - 1) * 100}}
+            self._features = features
+            return features
+
+    def _advance(self, key, days, x, y):
+        """只把上次之後的新交易日推進滾動視窗（第一次則載入最後 window 天）"""
+        roll = self._rolling.get(key)
+        if roll is None or (roll.last_day is not None and days[-1] < roll.last_day):
+            roll = self._rolling[key] = _Rolling(self.window)
+        start = 0 if roll.last_day is None else int(np.searchsorted(days, roll.last_day, side="right"))
+        start = max(start, len(days) - self.window - 1)
+        for i in range(start, len(days)):
+            roll.push(days[i], x[i], y[i])
+        return roll.stats()
+
+def format_lead_lag(f):
+    """報告用的一行連動摘要"""
+    if not f:
+        return ""
+    lead = f.get("lead")
+    lead_text = f"，美股領先 {lead} 日" if lead and lead > 0 else (f"，台股領先 {-lead} 日" if lead else "")
+    actual = f"（實際 `{f['actual_gap']:+.2f}%`）" if f.get("actual_gap") is not None else ""
+    return (f"🌉 **美股連動**： {US_DRIVERS.get(f['driver'], f['driver'])} `{f['us_ret']:+.2f}%`"
+            f"（ρ {f['corr']:.2f}，β {f['beta']:.2f}{lead_text}）→ 推估開盤 `{f['gap_est']:+.2f}%`{actual}")
+
+def gap_feature(f):
+    """給 AI 提示詞的精簡數值特徵"""
+    if not f:
+        return "N/A"
+    return f"{f['gap_est']:+.2f}%（{US_DRIVERS.get(f['driver'], f['driver'])} ρ {f['corr']:.2f}）"
+
+LEAD_LAG = LeadLagEngine()
+
+# === 量測：FFT 交叉相關 vs 逐 lag 計算；每日增量更新 vs 整段重算 ===
+if __name__ == "__main__":
+    import time
+    import datetime as dt
+
+    rng = np.random.default_rng(0)
+    n = 250
+    us_idx = pd.bdate_range(end="2026-10-15", periods=n)
+    tw_idx = pd.bdate_range(end="2026-10-16", periods=n, tz="Asia/Taipei")
+    us_dfs, us_rets = {}, {}
+    common = rng.normal(0, 0.01, n)
+    for s in US_DRIVERS:
+        r = common + rng.normal(0, 0.005, n)
+        us_rets[s] = r
+        us_dfs[s] = pd.DataFrame({"Close": 100 * np.exp(np.cumsum(r))}, index=us_idx)
+    tw_dfs = {}
+    for i, s in enumerate(["009816.TW", "00929.TW", "2317.TW", "00878.TW"]):
+        # 台股第 i 根（tw_idx[i]）開盤反應前一個美股交易日 us_idx[i]（β 0.6 左右）
+        gap = 0.6 * common + rng.normal(0, 0.003, n)
+        intraday = rng.normal(0, 0.006, n)
+        close = 20 * np.exp(np.cumsum(gap + intraday))
+        open_ = np.r_[20, close[:-1]] * np.exp(gap)
+        tw_dfs[s] = pd.DataFrame({"Open": open_, "Close": close}, index=tw_idx)
+
+    sim = clock.SimClock(dt.datetime(2026, 10, 16, 9, 0))
+    with clock.use_clock(sim):
+        t0 = time.perf_counter()
+        features = LeadLagEngine().update(us_dfs, tw_dfs)
+        t_first = time.perf_counter() - t0
+    for s, f in features.items():
+        print(f"   {s}: {format_lead_lag(f)}")
+
+    # 開盤前暖機（當天 K 棒還沒出現）：特徵當天算好，開盤後巡檢只補上實際跳空
+    engine = LeadLagEngine()
+    with clock.use_clock(clock.SimClock(dt.datetime(2026, 10, 16, 8, 45))):
+        engine.update(us_dfs, {s: df.iloc[:-1] for s, df in tw_dfs.items()})
+    with clock.use_clock(clock.SimClock(dt.datetime(2026, 10, 16, 9, 0))):
+        filled = engine.refresh_actual(tw_dfs) if not engine.stale() else {}
+    actual = {s: f.get("actual_gap") for s, f in filled.items()}
+    expect = {s: features[s]["actual_gap"] for s in actual}
+    print(f"🌅 08:45 暖機後 09:00 補上實際跳空：{all(v is not None for v in actual.values())}，"
+          f"與整段計算一致：{all(np.isclose(actual[s], expect[s]) for s in actual)}")
+
+    # 交叉相關：FFT（所有配對一次）vs 逐配對逐 lag
+    pairs = 12
+    x = rng.normal(size=(pairs, XCORR_WINDOW))
+    y = np.roll(x, 1, axis=1) + rng.normal(0, 0.5, size=x.shape)
+    t0 = time.perf_counter()
+    for _ in range(200):
+        fft = cross_correlation(x, y)
+    t_fft = (time.perf_counter() - t0) / 200
+    t0 = time.perf_counter()
+    for _ in range(200):
+        ref = np.array([[np.corrcoef(a[max(0, -k):len(a) - max(0, k)], b[max(0, k):len(b) - max(0, -k)])[0, 1]
+                         for k in range(-MAX_LAG, MAX_LAG + 1)] for a, b in zip(x, y)])
+    t_loop = (time.perf_counter() - t0) / 200
+    print(f"🔀 {pairs} 組配對 × {2 * MAX_LAG + 1} 個 lag：逐一 corrcoef {t_loop * 1000:.2f}ms → FFT {t_fft * 1000:.3f}ms（{t_loop / t_fft:.0f}×），"
+          f"峰值 lag 一致：{bool((np.argmax(fft, 1) == np.argmax(ref, 1)).all())}")
+
+    # 每日更新：增量推進 vs 每天整段重建
+    engine = LeadLagEngine()
+    inc, full = [], []
+    for day in range(n - 60, n):
+        d = tw_idx[day].date()
+        with clock.use_clock(clock.SimClock(dt.datetime.combine(d, dt.time(9)))):
+            sub_us = {s: df[df.index.date < d] for s, df in us_dfs.items()}
+            sub_tw = {s: df.iloc[:day + 1] for s, df in tw_dfs.items()}
+            t0 = time.perf_counter()
+            engine.update(sub_us, sub_tw)
+            inc.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            LeadLagEngine().update(sub_us, sub_tw)
+            full.append(time.perf_counter() - t0)
+    print(f"📅 每日更新 60 天：增量 {np.median(inc) * 1000:.1f}ms / 整段重建 {np.median(full) * 1000:.1f}ms；首次載入 {t_first * 1000:.1f}ms")
@@ -1,6 +1,5 @@
-import os, sys, time, logging, threading, requests
-from flask import Flask
-from datetime import datetime
+import os, time, logging, threading
+from flask import Flask, Response, abort, jsonify, request
 
 # --- 基礎設定 ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -8,98 +7,261 @@ app = Flask(__name__)
 
 # 延遲導入子模組
 try:
-    from monitor_009816 import run_taiwan_stock
-    from new_ten_thousand_grid import run_grid
-    from us_post_market_robot import run_us_ai
+    from monitor_009816 import run_taiwan_stock, fetch_history, compute_position, generate_taiwan_chart, SYMBOL as TW_SYMBOL
+    from new_ten_thousand_grid import run_grid, fetch_grid_history, compute_grid_indicators, generate_grid_chart, update_grid_ledger, TARGETS as GRID_TARGETS
+    from us_post_market_robot import run_us_ai, fetch_us_history, compute_us_indicators, generate_us_dashboard
 except ImportError as e:
     logging.error(f"❌ 模組導入失敗: {e}")
 
-# 從環境變數讀取 Webhook
-WEBHOOK = os.environ.get("DISCORD_WEBHOOK_URL", "").strip()
+from shared_state import STATE_DIR, SharedState, try_file_lock
+from alert_engine import AlertEngine, format_alerts
+from delivery import DeliveryRouter, sinks_from_env
+from pipeline import LAST_RUNS, Pipeline, Stage
+from flight_recorder import FLIGHT_RECORDER
+from warmup import WARMUP_TIME, first_tick_report, run_warmup
+from lead_lag import LEAD_LAG
+from ai_budget import BUDGET, format_budget
+from ai_expert import AI_CACHE
+from dashboard import DASHBOARD, ai_snapshot, market_snapshot, render_index
+from tick_context import TICK_BUDGET, TICK_SECONDS, TickContext, current_tick, degrade, tick_scope
+import market_clock as clock
 
-# --- Discord 發送邏輯 (保持你的究極修正版) ---
+# 投遞出口：DISCORD_WEBHOOK_URL（主頻道）、DISCORD_WEBHOOK_URLS（其他頻道）、REPORT_SINK_FILE（本地封存）
+ROUTER = DeliveryRouter(sinks_from_env())
+
+# --- 多 worker 協調（gunicorn 下每個 worker 都會載入本模組）---
+SCHEDULER_LOCK = os.path.join(STATE_DIR, "scheduler.leader.lock")
+MANUAL_RUN_LOCK = os.path.join(STATE_DIR, "manual_run.lock")
+LEADER_POLL_SECONDS = 30
+SCHEDULER_STATUS = SharedState("scheduler_status", default={"leader_pid": None, "since": ""})
+
+# --- 盤中事件模式：每週期只比對條件，有事才通報，固定時點才發完整報告 ---
+ALERT_MODE = os.environ.get("ALERT_MODE", "1") != "0"
+ALERT_ENGINE = AlertEngine()
+
+# --- 報告發送：編碼一次，平行送到每個出口（單一出口內維持訊息順序，慢或壞的出口不影響其他）---
 def dc_log(text, file_buf=None, filename="chart.png"):
-    if not WEBHOOK:
-        logging.warning("⚠️ Webhook URL 未設定")
-        return
-    try:
-        clean_text = str(text)
-        if len(clean_text) > 1950:
-            clean_text = clean_text[:1950] + "..."
-        
-        if file_buf is not None:
-            requests.post(WEBHOOK, json={"content": clean_text}, timeout=15)
-            time.sleep(2)
-            file_buf.seek(0)
-            files = {"file": (filename, file_buf, "image/png")}
-            res = requests.post(WEBHOOK, files=files, timeout=20)
-        else:
-            res = requests.post(WEBHOOK, json={"content": clean_text}, timeout=15)
-    except Exception as e:
-        logging.error(f"❌ 網路連線異常: {e}")
+    return ROUTER.send(text, file_buf, filename)
 
 # =========================
 # 核心任務邏輯 (模組化)
 # =========================
 
+# --- 報告流程 DAG：每個階段宣告相依，可平行的階段同時跑 ---
+def _deliver_stage(report_key, chart_key, filename, header=""):
+    """組合分析文字與圖表後送進 Discord 佇列（發送順序由 deliver 階段之間的相依決定）"""
+    def deliver(inputs):
+        res = inputs.get(report_key)
+        if res is None:
+            dc_log(f"{header}⚠️ {report_key} 階段失敗，本次無報告")
+            return
+        text = res[0] if isinstance(res, tuple) else res
+        file_buf = None if degrade("text_only") else inputs.get(chart_key)
+        prefix = header
+        tick = current_tick()
+        if tick is not None and tick.applied:
+            # 放在報告開頭，避免被 Discord 長度上限截掉
+            prefix += f"⚙️ **降級處理**：{tick.describe()}\n"
+        dc_log(f"{prefix}{text}", file_buf=file_buf, filename=filename)
+    return deliver
+
+def _render_stage(render):
+    """繪圖屬於可捨棄的工作：巡檢時間預算不足時直接略過"""
+    def stage(inputs):
+        if degrade("skip_chart"):
+            return None
+        return render(inputs)
+    return stage
+
+def _us_stages():
+    return [
+        Stage("fetch_us", lambda i: fetch_us_history()),
+        Stage("indicators_us", lambda i: compute_us_indicators(i["fetch_us"]), deps=("fetch_us",)),
+        Stage("us_sentiment", lambda i: run_us_ai(i["fetch_us"], i["indicators_us"], render=False),
+              deps=("fetch_us", "indicators_us")),
+        Stage("render_us", _render_stage(lambda i: generate_us_dashboard(i["fetch_us"]) if i["fetch_us"] else None),
+              deps=("fetch_us",)),
+        Stage("deliver_us", _deliver_stage("us_sentiment", "render_us", "us_close.png"),
+              deps=("us_sentiment", "render_us")),
+    ]
+
+def _market_stages():
+    """盤中掃描與完整報告共用的抓取 / 指標階段"""
+    return [
+        Stage("fetch_tw", lambda i: fetch_history()),
+        Stage("fetch_grid", lambda i: fetch_grid_history()),
+        Stage("indicators_grid", lambda i: compute_grid_indicators(i["fetch_grid"]), deps=("fetch_grid",)),
+        Stage("ledger", lambda i: update_grid_ledger(i["fetch_grid"], i["indicators_grid"]), deps=("fetch_grid", "indicators_grid")),
+    ]
+
+def _taiwan_stages(label, now_str, after_us=False):
+    # 台股與網格的 AI 判斷要讀美股情緒，必須排在 us_sentiment 之後
+    us = ("us_sentiment",) if after_us else ()
+    return _market_stages() + [
+        Stage("lead_lag", _lead_lag_stage, deps=("fetch_tw", "fetch_grid")),
+        Stage("tw_analysis", lambda i: run_taiwan_stock(i["fetch_tw"], render=False, lead_lag=i["lead_lag"]),
+              deps=("fetch_tw", "lead_lag") + us),
+        Stage("render_tw", _render_stage(lambda i: generate_taiwan_chart(i["fetch_tw"])), deps=("fetch_tw",)),
+        Stage("grid_analysis", lambda i: run_grid(i["fetch_grid"], i["indicators_grid"], render=False, lead_lag=i["lead_lag"]),
+              deps=("fetch_grid", "indicators_grid", "ledger", "lead_lag") + us),
+        Stage("render_grid", _render_stage(lambda i: generate_grid_chart({s: df for s, df in (i["fetch_grid"] or {}).items() if not df.empty})),
+              deps=("fetch_grid",)),
+        Stage("deliver_tw", _deliver_stage("tw_analysis", "render_tw", "tw_realtime.png", f"🕒 台股即時快報 ({label} {now_str})\n"),
+              deps=("tw_analysis", "render_tw") + (("deliver_us",) if after_us else ())),
+        Stage("deliver_grid", _deliver_stage("grid_analysis", "render_grid", "grid_live.png"),
+              deps=("grid_analysis", "render_grid", "deliver_tw")),
+    ]
+
+def _lead_lag_stage(inputs):
+    """美股連動特徵一天只算一次（美股日線走日線快取），盤中直接沿用；暖機時還沒有的實際跳空在開盤後補上"""
+    tw_dfs = {TW_SYMBOL: inputs["fetch_tw"], **(inputs["fetch_grid"] or {})}
+    if not LEAD_LAG.stale():
+        return LEAD_LAG.refresh_actual(tw_dfs)
+    return LEAD_LAG.update(fetch_us_history(), tw_dfs)
+
+def _scan_alerts(inputs):
+    tw_df, grid_dfs, indicators = inputs["fetch_tw"], inputs["fetch_grid"], inputs["indicators_grid"]
+
+    symbols, price, grid_buy, month_low, rsi, trend, position = [], [], [], [], [], [], []
+    for symbol in grid_dfs:
+        data = indicators.get(symbol)
+        if data is None:
+            continue
+        symbols.append(symbol)
+        price.append(data["price"])
+        grid_buy.append(data["grid_buy"])
+        month_low.append(data["month_low"])
+        rsi.append(data["rsi"])
+        trend.append(data["trend"])
+        position.append(float("nan"))
+    if not tw_df.empty:
+        symbols.append(TW_SYMBOL)
+        price.append(float(tw_df["Close"].iloc[-1]))
+        grid_buy.append(float("nan"))
+        month_low.append(float("nan"))
+        rsi.append(float("nan"))
+        trend.append("")  # 009816 沒有趨勢矩陣，固定值即不會觸發趨勢轉換
+        position.append(compute_position(tw_df["Close"]))
+
+    return ALERT_ENGINE.evaluate(symbols, price, grid_buy, month_low, rsi, trend, position)
+
+def _symbol_names():
+    names = {s: cfg["name"] for s, cfg in GRID_TARGETS.items()}
+    names[TW_SYMBOL] = "009816 凱基台灣 TOP 50"
+    return names
+
+def _publish_dashboard(results=None, alerts=None):
+    """巡檢結果寫入即時儀表板快照（只整理本次已抓好 / 算好的資料，不另外抓取或重算）"""
+    try:
+        names = _symbol_names()
+        sections = {
+            "pipelines": dict(LAST_RUNS),
+            "ai": ai_snapshot(AI_CACHE),
+            "budget_text": format_budget(BUDGET.summary()),
+            "delivery": ROUTER.stats(),
+        }
+        tw_df = (results or {}).get("fetch_tw")
+        if tw_df is not None:
+            position = compute_position(tw_df["Close"]) if not tw_df.empty else None
+            sections["market"] = market_snapshot(TW_SYMBOL, tw_df, results.get("fetch_grid"),
+                                                 results.get("indicators_grid"), names, position)
+        at = clock.now().strftime("%H:%M")
+        DASHBOARD.publish(alerts=[{"at": at, "symbol": s, "name": names.get(s, s), "message": m} for s, _, m in alerts or []],
+                          **sections)
+    except Exception as e:
+        logging.error(f"⚠️ 儀表板快照更新失敗: {e}")
+
 def task_us_summary():
     """美股收盤總結"""
-    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    now_str = clock.now().strftime("%Y-%m-%d %H:%M:%S")
     dc_log(f"# 🌙 美股盤後總結報告\n時間: `{now_str}`")
-    try:
-        result = run_us_ai()
-        if isinstance(result, tuple):
-            dc_log(result[0], file_buf=result[1], filename="us_close.png")
-        else:
-            dc_log(result)
-        return True
-    except Exception as e:
-        dc_log(f"⚠️ 美股分析失敗: {str(e)}")
-        return False
+    run = Pipeline("us_summary", _us_stages()).run()
+    _publish_dashboard()
+    return not run.errors
+
+def scan_market_events():
+    """
+    盤中快照：只抓數據、算指標交給事件引擎比對（不呼叫 AI、不畫圖）
+    回傳 (已完成的抓取 / 指標階段結果, 通報清單)，定時報告直接沿用
+    """
+    run = Pipeline("market_scan", _market_stages() + [
+        Stage("alerts", _scan_alerts, deps=("fetch_tw", "fetch_grid", "indicators_grid")),
+    ]).run()
+    if run.errors:
+        raise next(iter(run.errors.values()))
+    seed = {k: run.results[k] for k in ("fetch_tw", "fetch_grid", "indicators_grid", "ledger")}
+    return seed, run.results["alerts"]
 
 def task_taiwan_realtime_monitor(is_manual=False):
-    """台股盤中巡檢（含網格）"""
-    now_str = datetime.now().strftime("%H:%M:%S")
+    """台股盤中巡檢（含網格）：自動巡檢走事件模式，手動點擊一律發完整報告"""
+    now_str = clock.now().strftime("%H:%M:%S")
     label = "手動點擊" if is_manual else "自動巡檢"
     logging.info(f"🚀 執行台股 3 分鐘即時監控 ({label})... {now_str}")
-    
-    # 1. 執行存股監控
-    try:
-        res_tw = run_taiwan_stock()
-        if isinstance(res_tw, tuple):
-            dc_log(f"🕒 台股即時快報 ({label} {now_str})\n{res_tw[0]}", file_buf=res_tw[1], filename="tw_realtime.png")
-        else:
-            dc_log(f"🕒 台股即時快報 ({label} {now_str})\n{res_tw}")
-    except Exception as e:
-        logging.error(f"台股監控異常: {e}")
 
-    # 2. 執行網格監控
+    if is_manual or not ALERT_MODE:
+        send_full_reports(label, now_str)
+        return "full"
+
     try:
-        res_grid = run_grid()
-        if isinstance(res_grid, tuple):
-            dc_log(res_grid[0], file_buf=res_grid[1], filename="grid_live.png")
-        else:
-            dc_log(res_grid)
+        seed, alerts = scan_market_events()
+    except TimeoutError as e:
+        # 時間預算已用完：不再補發完整報告（下一輪巡檢重新抓取）
+        logging.error(f"⏰ 盤中事件掃描逾時，本週期略過: {e}")
+        return "timeout"
     except Exception as e:
-        logging.error(f"網格監格異常: {e}")
+        logging.error(f"盤中事件掃描異常，改發完整報告: {e}")
+        send_full_reports(label, now_str)
+        return "full"
+
+    _publish_dashboard(seed, alerts)
+    if alerts:
+        dc_log(format_alerts(alerts, _symbol_names(), f"({now_str})"))
+
+    checkpoint = ALERT_ENGINE.due_checkpoint(clock.now())
+    if checkpoint:
+        send_full_reports(f"{label}・{checkpoint} 定時報告", now_str, seed)
+        return "full"
+    if not alerts:
+        logging.info("😴 本週期無事件觸發，略過通報")
+    return "scan"
 
-def run_full_inspection():
-    """執行全套流程（美股+台股+網格）用於手動觸發"""
-    dc_log("# 🛰️ 啟動全套手動巡檢任務...")
-    task_us_summary()
-    time.sleep(5)
-    task_taiwan_realtime_monitor(is_manual=True)
-    dc_log("✅ 手動全套巡檢完成")
+def task_premarket_warmup():
+    """開盤前暖機（日線快取、美股連動特徵、連線池，另熱起指標 / 圖表程式碼路徑）；Discord 連線只查詢 webhook 資訊，不發訊息"""
+    extra = {"delivery": ROUTER.warm} if ROUTER.sinks else {}
+    return run_warmup(extra)
+
+def send_full_reports(label, now_str, seed=None):
+    """完整報告（存股 + 網格，含 AI 與圖表）；seed 為盤中掃描已完成的階段結果"""
+    run = Pipeline("taiwan_reports", _taiwan_stages(label, now_str)).run(initial=seed)
+    _publish_dashboard(run.results)
+
+def run_full_inspection(lock_fh=None):
+    """執行全套流程（美股+台股+網格）用於手動觸發；lock_fh 為跨 worker 互斥鎖，完成後釋放"""
+    try:
+        dc_log("# 🛰️ 啟動全套手動巡檢任務...")
+        now_str = clock.now().strftime("%H:%M:%S")
+        dc_log(f"# 🌙 美股盤後總結報告\n時間: `{clock.now():%Y-%m-%d %H:%M:%S}`")
+        run = Pipeline("full_inspection", _us_stages() + _taiwan_stages("手動點擊", now_str, after_us=True)).run()
+        _publish_dashboard(run.results)
+        dc_log("✅ 手動全套巡檢完成")
+    finally:
+        if lock_fh is not None:
+            lock_fh.close()
 
 # =========================
 # 自動化調度中心
 # =========================
-def scheduler_engine():
+def scheduler_engine(until=None):
+    """until: 模擬時鐘回放用的結束時間（正式環境為 None，永不結束）"""
     last_us_date = ""
+    last_warmup_date = ""
+    session_date, session_ticks = "", []  # 當天各次巡檢 (種類, 毫秒)，用來比較首次與平常的耗時
     logging.info("⚙️ 自動化調度引擎已啟動")
     
     while True:
-        now = datetime.now()
+        now = clock.now()
+        if until is not None and now >= until:
+            return
         current_date = now.strftime("%Y-%m-%d")
         
         # A. 美股時段 (早上 5:30 後執行一次)
@@ -107,42 +269,138 @@ def scheduler_engine():
             if last_us_date != current_date:
                 task_us_summary()
                 last_us_date = current_date
+            # 開盤前暖機（08:45 後一次）
+            if now.strftime("%H:%M") >= WARMUP_TIME and last_warmup_date != current_date:
+                task_premarket_warmup()
+                last_warmup_date = current_date
         
         # B. 台股時段 (09:00 - 13:35) 每 3 分鐘一次
         elif (now.hour == 9) or (10 <= now.hour <= 12) or (now.hour == 13 and now.minute <= 35):
-            task_taiwan_realtime_monitor(is_manual=False)
-            time.sleep(180) 
+            tick = TickContext(TICK_BUDGET, now.strftime("%H:%M"))
+            t0 = time.perf_counter()
+            with tick_scope(tick), FLIGHT_RECORDER.record(f"tw_tick {tick.label}", tick):
+                kind = task_taiwan_realtime_monitor(is_manual=False)
+            if session_date != current_date:
+                session_date, session_ticks = current_date, []
+            if session_ticks is not None:
+                session_ticks.append((kind, (time.perf_counter() - t0) * 1000))
+                report = first_tick_report(session_ticks)
+                if report:
+                    logging.info(report)
+                    session_ticks = None  # 當天已回報過
+            if tick.applied:
+                logging.warning(f"⚙️ {tick.label} 巡檢超出時間預算，已降級：{tick.describe()}")
+            # 固定節奏：超時就跳過錯過的時段，下一輪對齊到下一個整數週期，不會連續補跑
+            elapsed = (clock.now() - now).total_seconds()
+            if elapsed >= TICK_SECONDS:
+                logging.warning(f"⏭️ 巡檢耗時 {elapsed:.0f}s，跳過 {int(elapsed // TICK_SECONDS)} 個時段")
+            clock.sleep(TICK_SECONDS - elapsed % TICK_SECONDS)
             continue 
             
-        time.sleep(60)
+        clock.sleep(60)
+
+def run_scheduler_with_leader_election():
+    """
+    每個 worker 都會執行；只有搶到檔案鎖的 worker 真正跑排程，
+    其餘定期重試，主控 worker 結束（鎖隨行程釋放）後由下一個接手
+    """
+    while True:
+        lock_fh = try_file_lock(SCHEDULER_LOCK)
+        if lock_fh is not None:
+            logging.info(f"👑 worker {os.getpid()} 取得排程主控權")
+            SCHEDULER_STATUS.publish({
+                "leader_pid": os.getpid(),
+                "since": clock.now(clock.TW_TZ).strftime("%Y-%m-%d %H:%M:%S")
+            })
+            try:
+                scheduler_engine()
+            except Exception as e:
+                logging.error(f"❌ 排程引擎異常，釋放主控權: {e}")
+            finally:
+                lock_fh.close()
+        time.sleep(LEADER_POLL_SECONDS)
+
+def start_background_scheduler():
+    """啟動背景排程（dev server 與 gunicorn worker 共用入口）"""
+    threading.Thread(target=run_scheduler_with_leader_election, daemon=True).start()
 
 # =========================
 # Flask 路由 (保留手動功能)
 # =========================
 @app.route("/")
 def index():
-    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    return f"""
-    <div style="font-family: sans-serif; text-align: center; padding: 50px;">
-        <h1 style="color: #5865F2;">🦅 AI Manager 管理後台</h1>
-        <p>當前系統時間: <code>{now_str}</code></p>
-        <p>狀態: 🟢 背景自動巡檢運行中 (台股時段每 3 分鐘)</p>
-        <hr style="margin: 30px 0;">
-        <a href="/run" style="background: #5865F2; color: white; padding: 15px 40px; text-decoration: none; border-radius: 8px; font-weight: bold; display: inline-block;">🚀 啟動全套手動巡檢 (美+台+網格)</a>
-        <p style="color: #666; font-size: 0.9em; margin-top: 10px;">點擊後將在 Discord 發送完整分析報告</p>
-    </div>
-    """
+    """即時儀表板：外框由此回應，行情 / 指標 / AI 判斷 / 階段耗時由 /events 推送"""
+    return render_index(
+        now_str=clock.now(clock.TW_TZ).strftime("%Y-%m-%d %H:%M:%S"),
+        leader=SCHEDULER_STATUS.snapshot()[1].get("leader_pid") or "選舉中",
+        pid=os.getpid(),
+        budget=format_budget(BUDGET.summary()),
+    )
+
+@app.route("/events")
+def dashboard_events():
+    """SSE：最新巡檢快照（各 worker 讀共享快照，不觸發任何抓取或計算）"""
+    return Response(DASHBOARD.stream(request.headers.get("Last-Event-ID")), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _cached_json(section=None):
+    version, body = DASHBOARD.body(section)
+    etag = f'"{version}"'
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status=304, headers={"ETag": etag})
+    return Response(body, mimetype="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.route("/api/snapshot")
+def dashboard_snapshot():
+    return _cached_json()
+
+@app.route("/api/indicators")
+def dashboard_indicators():
+    """各標的現價、漲跌、RSI、趨勢、補倉點、週 / 月線趨勢（最新一次巡檢）"""
+    return _cached_json("market")
+
+@app.route("/api/timings")
+def dashboard_timings():
+    """各管線最近一次的階段耗時與關鍵路徑（pipeline.LAST_RUNS）"""
+    return _cached_json("pipelines")
 
 @app.route("/run")
 def manual_trigger():
-    if not WEBHOOK: return "❌ 錯誤：未設定 Webhook URL"
+    if not ROUTER.sinks: return "❌ 錯誤：未設定 Webhook URL"
+    # 跨 worker 互斥：同一時間只允許一輪手動巡檢
+    lock_fh = try_file_lock(MANUAL_RUN_LOCK)
+    if lock_fh is None:
+        return "<h3>⏳ 已有手動巡檢進行中</h3><p>請稍後再試。</p><br><a href='/'>返回首頁</a>"
     # 使用 Thread 避免網頁卡住轉圈圈
-    threading.Thread(target=run_full_inspection).start()
+    threading.Thread(target=run_full_inspection, args=(lock_fh,)).start()
     return "<h3>✅ 手動全套巡檢已啟動！</h3><p>請檢查 Discord 頻道。</p><br><a href='/'>返回首頁</a>"
 
+@app.route("/budget")
+def ai_budget():
+    """今日 Gemini 額度：各模型已用 / 上限、剩餘巡檢次數與目前的配給"""
+    return jsonify(BUDGET.summary())
+
+@app.route("/delivery")
+def delivery_stats():
+    """各投遞出口的成功 / 失敗 / 丟棄次數、平均耗時與積壓"""
+    return jsonify(ROUTER.stats())
+
+@app.route("/profiles")
+def slow_tick_profiles():
+    """最近的慢巡檢記錄（耗時、取樣數、各管線階段時間軸、降級）"""
+    return jsonify(FLIGHT_RECORDER.profiles())
+
+@app.route("/profiles/<profile_id>.folded")
+def slow_tick_flamegraph(profile_id):
+    """火焰圖 folded 堆疊（flamegraph.pl / speedscope 可直接讀）"""
+    text = FLIGHT_RECORDER.folded_text(profile_id)
+    if text is None:
+        abort(404)
+    return Response(text, mimetype="text/plain", headers={"Content-Disposition": f"attachment; filename={profile_id}.folded"})
+
 if __name__ == "__main__":
-    # 啟動自動化背景引擎
-    threading.Thread(target=scheduler_engine, daemon=True).start()
+    # 啟動自動化背景引擎（本機 dev server；正式環境請用 start.sh → gunicorn）
+    start_background_scheduler()
     
     port = int(os.environ.get("PORT", 10000))
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,82 @@
+# market_clock.py - 可注入的時鐘（正式環境走系統時間，回放 / 壓測時換成模擬時間）
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+
+TW_TZ = timezone(timedelta(hours=8))
+
+class SystemClock:
+    """系統時間（預設）"""
+
+    def now(self, tz=None):
+        return datetime.now(tz)
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class SimClock:
+    """
+    模擬時鐘：sleep() 直接把時間往前撥，不真的等待
+    - 不帶時區的 now() 回傳台北時間（排程以台北盤別判斷，與部署環境 TZ 設定一致）
+    - speed 有值時按比例真實等待（speed=100 → 180 秒只等 1.8 秒），用來固定回放倍速
+    """
+
+    def __init__(self, start, speed=None):
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=TW_TZ)
+        self._t = start.timestamp()
+        self.speed = speed
+        self._lock = threading.Lock()
+
+    def now(self, tz=None):
+        with self._lock:
+            t = self._t
+        if tz is None:
+            return datetime.fromtimestamp(t, TW_TZ).replace(tzinfo=None)
+        return datetime.fromtimestamp(t, tz)
+
+    def time(self):
+        with self._lock:
+            return self._t
+
+    def advance(self, seconds):
+        with self._lock:
+            self._t += seconds
+
+    def sleep(self, seconds):
+        if self.speed:
+            time.sleep(seconds / self.speed)
+        self.advance(seconds)
+
+# === 全域時鐘（各模組透過 now() / sleep() 取用，不直接呼叫 datetime.now()）===
+_CLOCK = SystemClock()
+
+def get_clock():
+    return _CLOCK
+
+def set_clock(clock):
+    """替換全域時鐘，回傳原本的時鐘"""
+    global _CLOCK
+    previous, _CLOCK = _CLOCK, clock
+    return previous
+
+@contextmanager
+def use_clock(clock):
+    previous = set_clock(clock)
+    try:
+        yield clock
+    finally:
+        set_clock(previous)
+
+def now(tz=None):
+    return _CLOCK.now(tz)
+
+def timestamp():
+    return _CLOCK.time()
+
+def sleep(seconds):
+    _CLOCK.sleep(seconds)
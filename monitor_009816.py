@@ -1,17 +1,10 @@
 import yfinance as yf
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import io
-import os
+import time
 from datetime import datetime, timezone, timedelta
 import logging
 
-# 強制 Agg 後端
-import matplotlib
-matplotlib.use('Agg')
-
 # 導入 AI 判斷模組
 try:
     from ai_expert import analyze_taiwan_stock, get_us_market_sentiment
@@ -20,79 +13,98 @@ except ImportError:
     AI_AVAILABLE = False
     logging.warning("⚠️ ai_expert 模組未找到，將跳過 AI 判斷")
 
-# =====================
-# 🛠️ 終極中文字體與符號解決方案
-# =====================
-def setup_chinese_font():
-    font_filename = "NotoSansTC-Regular.ttf"
-    font_path = os.path.join(os.getcwd(), font_filename)
-    
-    if os.path.exists(font_path):
-        fm.fontManager.addfont(font_path)
-        font_name = fm.FontProperties(fname=font_path).get_name()
-        plt.rcParams['font.family'] = [font_name, 'DejaVu Sans', 'sans-serif']
-        plt.rcParams['axes.unicode_minus'] = False 
-        logging.info(f"✅ 009816 模組：成功載入字體 {font_name} 及其符號回援機制")
-    else:
-        logging.error(f"❌ 009816 模組：找不到字體檔 {font_filename}")
-
-# 初始化字體
-setup_chinese_font()
-
-def run_taiwan_stock():
+from report_archive import record_snapshot
+from outlook_engine import outlook
+from chart_renderer import render_taiwan_chart
+from history_cache import HISTORY, fetch_timeout
+from multi_timeframe import format_timeframes, timeframe_views
+from lead_lag import format_lead_lag, gap_feature
+from scoring_config import SYSTEM_ACTIONS, action_level, load_scoring, score as system_score
+import market_clock as clock
+
+SYMBOL = "009816.TW"
+NAME = "凱基台灣 TOP 50"
+
+def _download(period):
+    df = yf.Ticker(SYMBOL).history(period=period, timeout=fetch_timeout())
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    return df
+
+def fetch_history():
+    """抓取 009816 一年日線（盤中事件掃描與完整報告共用；昨天以前走日線快取）"""
+    return HISTORY.get(SYMBOL, _download)
+
+def compute_position(close):
+    """價格位階：現價在全年度高低點之間的位置（低點至少計入發行價 10.0）"""
+    price = float(close.iloc[-1])
+    high_all = close.max()
+    low_all = min(close.min(), 10.00)
+    return (price - low_all) / (high_all - low_all) if high_all != low_all else 0.5
+
+def generate_taiwan_chart(df):
+    """繪製 009816 策略趨勢圖（DAG 的 render 階段直接呼叫）"""
+    if df is None or df.empty:
+        return None
+    close = df["Close"]
+    return render_taiwan_chart(df.index, close, float(close.iloc[-1]), NAME)
+
+def run_taiwan_stock(df=None, render=True, lead_lag=None):
     """
     009816 凱基台灣 TOP 50 存股分析模組（整合美股情緒）
+    df: 已抓好的日線（盤中事件掃描時傳入，避免重複下載）
+    render: False 時不畫圖（由 DAG 的 render 階段另外平行繪製）
+    lead_lag: 美股連動引擎的 {代號: 特徵}（推估開盤跳空）
     """
-    symbol = "009816.TW"
-    name = "凱基台灣 TOP 50"
+    symbol = SYMBOL
+    name = NAME
+
+    t_start = time.perf_counter()
+    ai_ms = 0.0
 
     try:
         # 1. 抓取數據
-        ticker = yf.Ticker(symbol)
-        df = ticker.history(period="1y", timeout=15)
+        if df is None:
+            df = fetch_history()
+        fetch_ms = (time.perf_counter() - t_start) * 1000
 
         if df.empty or len(df) < 1:
             return f"# ❌ {name}\n數據尚未入庫，請待收盤後重試。", None
 
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
-
         close = df["Close"]
         price = float(close.iloc[-1])
         
         # 2. 數據分析
-        high_all = close.max()
-        low_all = min(close.min(), 10.00)
         dist_from_launch = (price / 10.0 - 1) * 100
         days_active = len(df)
         
-        # 3. 複利展望
-        daily_ret = (price / 10.0) ** (1 / max(days_active, 1)) - 1
-        annual_return = ((1 + daily_ret) ** 252 - 1) * 100
-        projected_1y = price * ((1 + daily_ret) ** 252)
+        # 3. 一年展望：歷史日報酬蒙地卡羅模擬（資料不足時沿用發行價複利推估）
+        sim = outlook(price, close.to_numpy(), horizon=252, percentiles=(10, 50, 90))
+        if sim:
+            annual_return = sim["annual_return"]
+            projected_1y = sim["median"]
+        else:
+            daily_ret = (price / 10.0) ** (1 / max(days_active, 1)) - 1
+            annual_return = ((1 + daily_ret) ** 252 - 1) * 100
+            projected_1y = price * ((1 + daily_ret) ** 252)
         
         # 4. 價格位階
-        price_position = (price - low_all) / (high_all - low_all) if high_all != low_all else 0.5
+        price_position = compute_position(close)
         position_pct = price_position * 100
+        views = timeframe_views(symbol, df)
+        gap = (lead_lag or {}).get(symbol)
 
-        # 5. 系統評分
-        score = 65 
-        if price <= 10.05: score += 10
-        if dist_from_launch < 2.0: score += 5
-        if price_position < 0.4: score += 10  # 低檔加分
+        # 5. 系統評分（門檻與加分讀自評分設定檔，可由 score_optimizer 產生）
+        scoring = load_scoring()
+        score = float(system_score(price, price_position, scoring))  # 加分 / 門檻可為小數，不截斷
         
         # 系統建議（僅供參考，最終以 AI 為準）
-        if score >= 75:
-            system_action = "🟢 積極佈局"
-        elif score >= 60:
-            system_action = "🟡 定期定額"
-        else:
-            system_action = "🔴 觀望等待"
+        system_action = SYSTEM_ACTIONS[int(action_level(score, scoring))]
 
         # =====================
         # 🤖 AI 專業判斷（結合美股情緒）
         # =====================
-        ai_result = {"decision": "觀望", "confidence": 0, "reason": "AI 未啟用"}
+        ai_result = {"decision": "觀望", "confidence": 0, "reason": "AI 未啟用", "origin": "none"}
         us_sentiment = {}
         
         if AI_AVAILABLE:
@@ -102,41 +114,29 @@ def run_taiwan_stock():
                 
                 # 提供完整數據給 AI
                 extra_data = {
-                    "tech_summary": f"現價 {price:.2f}, 距發行價 {dist_from_launch:+.1f}%, 價格位階 {position_pct:.0f}%, 年化報酬 {annual_return:.1f}%",
-                    "score": f"{score}/100",
+                    "tech_summary": f"現價 {price:.2f}, 距發行價 {dist_from_launch:+.1f}%, 價格位階 {position_pct:.0f}%, 年化報酬 {annual_return:.1f}%, 美股推估開盤 {gap_feature(gap)}",
+                    "score": f"{score:g}/100",
                     "position": f"{position_pct:.0f}%（{price_position:.2f}）",
                     "outlook": f"2027目標 {projected_1y:.2f}, 複利年化 {annual_return:.1f}%"
                 }
                 
+                t_ai = time.perf_counter()
                 ai_result = analyze_taiwan_stock(extra_data, name, debug=False)
+                ai_ms = (time.perf_counter() - t_ai) * 1000
                 
             except Exception as e:
                 logging.error(f"AI 判斷異常: {e}")
-                ai_result = {"decision": "觀望", "confidence": 50, "reason": "AI 分析異常"}
+                ai_result = {"decision": "觀望", "confidence": 50, "reason": "AI 分析異常", "origin": "error"}
 
         # =====================
         # 📊 繪圖邏輯
         # =====================
-        plt.figure(figsize=(10, 6))
-        plt.plot(df.index, close, marker='o', linestyle='-', color='#1f77b4', linewidth=2, label='每日收盤價')
-        plt.axhline(y=10.0, color='#d62728', linestyle='--', alpha=0.6, label='發行價 (10.0)')
-        plt.axhline(y=price, color='#2ca02c', linestyle=':', alpha=0.6, label=f'目前價格 ({price:.2f})')
-        
-        plt.title(f"{name} (009816) 策略趨勢分析", fontsize=16, fontweight='bold', pad=15)
-        plt.xlabel("交易日期", fontsize=12)
-        plt.ylabel("價格 (TWD)", fontsize=12)
-        plt.legend(loc='best')
-        plt.grid(True, linestyle=':', alpha=0.5)
-
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-        buf.seek(0)
-        plt.close()
+        buf = render_taiwan_chart(df.index, close, price, name) if render else None
 
         # =====================
         # 📖 報告組裝
         # =====================
-        today = datetime.now(timezone(timedelta(hours=8)))
+        today = clock.now(timezone(timedelta(hours=8)))
         
         report = [
             f"# 🦅 經理人 AI 存股決策",
@@ -147,8 +147,14 @@ def run_taiwan_stock():
             f"📈 **累計報酬**： `{dist_from_launch:+.2f}%`",
             f"📊 **價格位階**： `{position_pct:.0f}%` (全年度)",
             f"🚀 **2027 展望**： `{projected_1y:.2f}` (年化 `{annual_return:+.1f}%`)",
-            "---",
         ]
+        if sim:
+            report.append(f"🎲 **模擬區間**： `{sim['p10']:.2f}` ~ `{sim['p90']:.2f}` (P10~P90，上漲機率 `{sim['prob_up']:.0f}%`)")
+        if views:
+            report.append(format_timeframes(views))
+        if gap:
+            report.append(format_lead_lag(gap))
+        report.append("---")
         
         # 美股情緒提示（如果有）
         if us_sentiment.get("analyzed"):
@@ -166,11 +172,18 @@ def run_taiwan_stock():
             f"💯 **信心指數**： `{ai_result['confidence']}%`",
             f"💡 **決策理由**： {ai_result['reason']}",
             "",
-            f"_系統評分: {score}/100 | 系統建議: {system_action}_",
+            f"_系統評分: {score:g}/100 | 系統建議: {system_action}_",
             "---",
             f"📈 **{name} 策略趨勢圖已生成，請參閱下方附件**"
         ])
 
+        record_snapshot(
+            "taiwan_stock", symbol,
+            price=price, position=price_position, score=score,
+            decision=ai_result["decision"], confidence=ai_result["confidence"], origin=ai_result.get("origin", ""),
+            fetch_ms=fetch_ms, ai_ms=ai_ms, total_ms=(time.perf_counter() - t_start) * 1000
+        )
+
         return "\n".join(report).strip(), buf
 
     except Exception as e:
@@ -0,0 +1,234 @@
+# multi_timeframe.py - 週線 / 月線趨勢（由日線增量維護，每次巡檢只重算進行中的那根 K 棒）
+import threading
+
+import numpy as np
+import pandas as pd
+
+# 週期參數：一年日線約 52 根週線、12 根月線，均線與 RSI 長度依此縮短
+TIMEFRAMES = {
+    "W": {"label": "週線", "short": 4, "long": 13, "rsi": 14},
+    "M": {"label": "月線", "short": 3, "long": 6, "rsi": 6},
+}
+
+def classify_trend(price, ma_short, ma_long, lower):
+    """六維度趨勢矩陣（日 / 週 / 月線共用同一套判定）"""
+    if price > ma_short > ma_long:
+        return "🔴 強勢多頭"
+    if ma_short > price > ma_long:
+        return "🍀 多頭回檔"
+    if price < ma_short < ma_long and price < lower:
+        return "🔥 極度超跌"
+    if price < ma_short < ma_long:
+        return "🟢 強勢空頭"
+    return "🟡 橫盤整理"
+
+def _bucket_keys(days, freq):
+    """days: datetime64[D] 陣列 → 週（週一起算）或月的整數編號"""
+    if freq == "W":
+        return (days.astype("i8") + 3) // 7  # 1970-01-01 為週四，+3 對齊到週一
+    return days.astype("datetime64[M]").astype("i8")
+
+def _local_days(index):
+    """日線索引 → 當地日期（datetime64[D]）；有時區的索引以自身時區的日期為準"""
+    if not isinstance(index, pd.DatetimeIndex):
+        index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.values.astype("datetime64[D]")
+
+class _Frame:
+    """單一週期：已收完的 K 棒只保留計算指標需要的尾段收盤，進行中的那根另外累計"""
+    __slots__ = ("freq", "cfg", "keep", "closed", "count", "open_key", "open_high", "open_low")
+
+    def __init__(self, freq):
+        self.freq = freq
+        self.cfg = TIMEFRAMES[freq]
+        self.keep = max(self.cfg["long"], self.cfg["short"], self.cfg["rsi"] + 1)
+        self.closed = np.empty(0)   # 已收完 K 棒的收盤（最多 keep 根）
+        self.count = 0              # 已收完 K 棒總數
+        self.open_key = None
+        self.open_high = -np.inf    # 進行中 K 棒內、已收盤日線的最高 / 最低
+        self.open_low = np.inf
+
+    def load(self, days, close, high, low):
+        """整段日線一次分桶（當天第一次或資料重置時）"""
+        keys = _bucket_keys(days, self.freq)
+        last = np.flatnonzero(np.diff(keys)) if len(keys) else np.empty(0, dtype="i8")
+        self.closed = close[last][-self.keep:].astype("f8")
+        self.count = len(last)
+        self.open_key = keys[-1] if len(keys) else None
+        start = last[-1] + 1 if len(last) else 0
+        self.open_high = float(high[start:].max()) if start < len(keys) else -np.inf
+        self.open_low = float(low[start:].min()) if start < len(keys) else np.inf
+
+    def push_day(self, day, close, high, low, prev_close):
+        """一根日線收完：換桶時把上一桶收盤推進尾段"""
+        key = _bucket_keys(np.array([day]), self.freq)[0]
+        if self.open_key is not None and key != self.open_key:
+            self.closed = np.append(self.closed, prev_close)[-self.keep:]
+            self.count += 1
+            self.open_high, self.open_low = -np.inf, np.inf
+        self.open_key = key
+        self.open_high = max(self.open_high, high)
+        self.open_low = min(self.open_low, low)
+
+    def view(self, price, high, low):
+        """進行中 K 棒以最新日線更新後的指標（只用尾段 keep+1 根收盤）"""
+        series = np.append(self.closed, price)
+        cfg = self.cfg
+        bars = self.count + 1
+        ma_short = series[-cfg["short"]:].mean() if len(series) >= cfg["short"] else np.nan
+        ma_long = series[-cfg["long"]:].mean() if len(series) >= cfg["long"] else np.nan
+        std = series[-cfg["short"]:].std(ddof=1) if len(series) >= cfg["short"] else np.nan
+        rsi = np.nan
+        if len(series) > cfg["rsi"]:
+            delta = np.diff(series[-(cfg["rsi"] + 1):])
+            gain, loss = delta[delta > 0].sum() / cfg["rsi"], -delta[delta < 0].sum() / cfg["rsi"]
+            rsi = 100 - 100 / (1 + gain / (loss if loss != 0 else 0.001))
+        return {
+            "label": cfg["label"],
+            "bars": bars,
+            "price": price,
+            "high": max(self.open_high, high),
+            "low": min(self.open_low, low),
+            "ma_short": ma_short,
+            "ma_long": ma_long,
+            "rsi": rsi,
+            "trend": classify_trend(price, ma_short, ma_long, ma_short - 2 * std) if np.isfinite(ma_long) else "⚪ 資料不足",
+        }
+
+class MultiTimeframe:
+    """
+    單一標的的週 / 月線：
+    - 第一次（或日線被整段換掉）時分桶一次
+    - 之後每次巡檢只處理新收完的日線（通常 0 根，換日時 1 根）與最新一根，
+      成本與歷史長度無關，不再對整年做 resample
+    """
+
+    def __init__(self, freqs=tuple(TIMEFRAMES)):
+        self.frames = {freq: _Frame(freq) for freq in freqs}
+        self._last_day = None     # 最後一根已收完日線的日期
+        self._last_close = np.nan
+        self._lock = threading.Lock()
+
+    def update(self, df):
+        if df is None or len(df) < 2:
+            return {}
+        with self._lock:
+            days = _local_days(df.index[-2:])
+            if self._last_day is None or days[0] < self._last_day:
+                self._reload(df)
+            elif days[0] > self._last_day:
+                # 只處理上次之後新收完的日線（索引二分搜尋，不掃整段）
+                all_days = _local_days(df.index)
+                start = int(np.searchsorted(all_days, self._last_day, side="right"))
+                for i in range(start, len(df) - 1):
+                    self._push(all_days[i], df.iloc[i])
+            price, high, low = (float(df[col].iat[-1]) for col in ("Close", "High", "Low"))
+            views = {}
+            for freq, frame in self.frames.items():
+                key = _bucket_keys(days[-1:], freq)[0]
+                if frame.open_key is not None and key != frame.open_key:
+                    # 最新日線是新的一週 / 月：上一桶此刻已收
+                    frame.closed = np.append(frame.closed, self._last_close)[-frame.keep:]
+                    frame.count += 1
+                    frame.open_key, frame.open_high, frame.open_low = key, -np.inf, np.inf
+                views[freq] = frame.view(price, high, low)
+            return views
+
+    def _reload(self, df):
+        days = _local_days(df.index[:-1])
+        close = df["Close"].to_numpy(dtype="f8")[:-1]
+        high = df["High"].to_numpy(dtype="f8")[:-1]
+        low = df["Low"].to_numpy(dtype="f8")[:-1]
+        for frame in self.frames.values():
+            frame.load(days, close, high, low)
+        self._last_day = days[-1]
+        self._last_close = float(close[-1])
+
+    def _push(self, day, bar):
+        for frame in self.frames.values():
+            frame.push_day(day, float(bar["Close"]), float(bar["High"]), float(bar["Low"]), self._last_close)
+        self._last_day = day
+        self._last_close = float(bar["Close"])
+
+_VIEWS = {}
+_VIEWS_LOCK = threading.Lock()
+
+def timeframe_views(symbol, df):
+    """{週期: 指標}；每個標的各自保留增量狀態"""
+    with _VIEWS_LOCK:
+        mtf = _VIEWS.get(symbol)
+        if mtf is None:
+            mtf = _VIEWS[symbol] = MultiTimeframe()
+    return mtf.update(df)
+
+def format_timeframes(views):
+    """報告用的一行多週期趨勢"""
+    parts = []
+    for v in views.values():
+        rsi = f"RSI {v['rsi']:.0f}" if np.isfinite(v["rsi"]) else "RSI -"
+        parts.append(f"{v['label']} {v['trend']}（{rsi}）")
+    return f"🧭 **多週期趨勢**： {' ／ '.join(parts)}" if parts else ""
+
+# === 量測：每次巡檢整年 resample vs 增量更新 ===
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    days = 250
+    idx = pd.bdate_range(end="2026-10-16", periods=days, tz="Asia/Taipei")
+    close = 20 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))
+    df = pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close}, index=idx)
+
+    def full_resample(frame):
+        out = {}
+        for freq, rule in (("W", "W-SUN"), ("M", "ME")):
+            cfg = TIMEFRAMES[freq]
+            c = frame["Close"].resample(rule).last().dropna()
+            ma_s, ma_l = c.rolling(cfg["short"]).mean(), c.rolling(cfg["long"]).mean()
+            std = c.rolling(cfg["short"]).std()
+            delta = c.diff()
+            gain = delta.where(delta > 0, 0).rolling(cfg["rsi"]).mean()
+            loss = (-delta.where(delta < 0, 0)).rolling(cfg["rsi"]).mean()
+            rsi = 100 - 100 / (1 + gain / loss.replace(0, 0.001))
+            p = float(c.iloc[-1])
+            out[freq] = (ma_s.iloc[-1], ma_l.iloc[-1], rsi.iloc[-1],
+                         classify_trend(p, ma_s.iloc[-1], ma_l.iloc[-1], ma_s.iloc[-1] - 2 * std.iloc[-1]))
+        return out
+
+    # 模擬一天 90 次巡檢：只有最後一根日線在變
+    ticks = []
+    for _ in range(90):
+        live = df.copy()
+        live.iloc[-1, live.columns.get_loc("Close")] *= np.exp(rng.normal(0, 0.003))
+        ticks.append(live)
+
+    t0 = time.perf_counter()
+    for live in ticks:
+        ref = full_resample(live)
+    t_full = (time.perf_counter() - t0) / len(ticks)
+
+    mtf = MultiTimeframe()
+    mtf.update(ticks[0])
+    t0 = time.perf_counter()
+    for live in ticks:
+        views = mtf.update(live)
+    t_inc = (time.perf_counter() - t0) / len(ticks)
+
+    same = all(
+        np.allclose([views[f]["ma_short"], views[f]["ma_long"], views[f]["rsi"]], ref[f][:3]) and views[f]["trend"] == ref[f][3]
+        for f in TIMEFRAMES
+    )
+    print(f"🧭 每次巡檢：整年 resample {t_full * 1000:.2f}ms → 增量 {t_inc * 1000:.3f}ms（{t_full / t_inc:.0f}×），結果一致：{same}")
+
+    # 跨週 / 跨月：逐日餵入，與 resample 結果逐日比對
+    mtf, mismatched = MultiTimeframe(), 0
+    for n in range(60, days + 1):
+        views = mtf.update(df.iloc[:n])
+        ref = full_resample(df.iloc[:n])
+        mismatched += any(
+            not np.allclose([views[f]["ma_short"], views[f]["ma_long"]], ref[f][:2], equal_nan=True) for f in TIMEFRAMES
+        )
+    print(f"📅 逐日推進 {days - 59} 天（含換週 / 換月），與 resample 不一致 {mismatched} 天")
+    print(format_timeframes(views))
@@ -1,17 +1,10 @@
 import yfinance as yf
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import io
-import os
+import time
 from datetime import datetime, timezone, timedelta
 import logging
 
-# 強制 Agg 後端
-import matplotlib
-matplotlib.use('Agg')
-
 # 導入 AI 判斷模組
 try:
     from ai_expert import analyze_grid_trading, get_us_market_sentiment
@@ -20,24 +13,13 @@ except ImportError:
     AI_AVAILABLE = False
     logging.warning("⚠️ ai_expert 模組未找到，將跳過 AI 判斷")
 
-# =====================
-# 🛠️ 終極中文字體與符號解決方案
-# =====================
-def setup_chinese_font():
-    font_filename = "NotoSansTC-Regular.ttf"
-    font_path = os.path.join(os.getcwd(), font_filename)
-    
-    if os.path.exists(font_path):
-        fm.fontManager.addfont(font_path)
-        font_name = fm.FontProperties(fname=font_path).get_name()
-        plt.rcParams['font.family'] = [font_name, 'DejaVu Sans', 'sans-serif']
-        plt.rcParams['axes.unicode_minus'] = False 
-        logging.info(f"✅ 網格模組：成功載入字體 {font_name} 及其符號回援機制")
-    else:
-        logging.error(f"❌ 網格模組：找不到字體檔 {font_filename}")
-
-# 初始化字體設定
-setup_chinese_font()
+from report_archive import record_snapshot
+from chart_renderer import render_grid_chart
+from history_cache import HISTORY, fetch_timeout
+from grid_ledger import GRID_LEDGER, GRID_LEVELS, format_ledger
+from multi_timeframe import classify_trend, format_timeframes, timeframe_views
+from lead_lag import format_lead_lag, gap_feature
+import market_clock as clock
 
 # ================= 實驗參數 =================
 TEST_CAPITAL = 10000  # 一萬元實驗資金
@@ -69,16 +51,7 @@ def compute_advanced_grid(df):
     rsi = 100 - (100 / (1 + (gain / loss.replace(0, 0.001)))).iloc[-1]
     
     # 3. 六維度趨勢引擎
-    if price > last_ma20 > last_ma60:
-        trend = "🔴 強勢多頭"
-    elif last_ma20 > price > last_ma60:
-        trend = "🍀 多頭回檔"
-    elif price < last_ma20 < last_ma60 and price < last_lower:
-        trend = "🔥 極度超跌"
-    elif price < last_ma20 < last_ma60:
-        trend = "🟢 強勢空頭"
-    else:
-        trend = "🟡 橫盤整理"
+    trend = classify_trend(price, last_ma20, last_ma60, last_lower)
     
     # 4. ATR 動態間距
     tr = pd.concat([(df['High']-df['Low']), (df['High']-close.shift()).abs(), (df['Low']-close.shift()).abs()], axis=1).max(axis=1)
@@ -100,35 +73,59 @@ def compute_advanced_grid(df):
 
 def generate_grid_chart(dfs):
     """繪製網格動態分析圖"""
-    fig = plt.figure(figsize=(12, 12))
-    
-    for i, (symbol, df) in enumerate(dfs.items()):
-        ax = plt.subplot(len(dfs), 1, i+1)
-        name = TARGETS[symbol]['name']
-        plot_df = df.tail(60)
-        
-        ma20 = plot_df['Close'].rolling(20).mean()
-        std20 = plot_df['Close'].rolling(20).std()
-        
-        # 繪製價格與布林通道
-        ax.plot(plot_df.index, plot_df['Close'], label='收盤價', lw=2.5, color='#1f77b4')
-        ax.fill_between(plot_df.index, ma20-2*std20, ma20+2*std20, color='gray', alpha=0.1, label='布林通道')
-        ax.plot(plot_df.index, ma20, color='orange', linestyle='--', alpha=0.8, label='月線 (MA20)')
-        
-        ax.set_title(f"{name} 趨勢掃描", fontsize=15, fontweight='bold', pad=10)
-        ax.legend(loc='upper left', fontsize=10)
-        ax.grid(True, alpha=0.3, linestyle=':')
-
-    plt.tight_layout()
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=150)
-    buf.seek(0)
-    plt.close()
-    return buf
-
-def run_grid():
+    return render_grid_chart(dfs, {symbol: TARGETS[symbol]['name'] for symbol in dfs})
+
+def _download(symbol, period):
+    df = yf.download(symbol, period=period, interval="1d", progress=False, timeout=fetch_timeout())
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    return df
+
+def fetch_grid_history():
+    """抓取所有網格標的一年日線（盤中事件掃描與完整報告共用；昨天以前走日線快取）"""
+    dfs = {}
+    for symbol in TARGETS:
+        try:
+            df = HISTORY.get(symbol, lambda period, s=symbol: _download(s, period))
+            if df.empty: continue
+            dfs[symbol] = df
+        except Exception as e:
+            logging.error(f"網格數據抓取失敗 {symbol}: {e}")
+    return dfs
+
+def compute_grid_indicators(dfs):
+    """各標的的趨勢矩陣指標（DAG 的 indicators 階段，盤中掃描與完整報告共用；含增量維護的週 / 月線）"""
+    out = {}
+    for symbol, df in dfs.items():
+        if df.empty:
+            continue
+        out[symbol] = compute_advanced_grid(df)
+        out[symbol]["timeframes"] = timeframe_views(symbol, df)
+    return out
+
+def update_grid_ledger(dfs, indicators):
+    """虛擬帳本依最新 K 棒撮合（DAG 的 ledger 階段，盤中每次巡檢都執行）；回傳本次新增的事件數"""
+    added = 0
+    for symbol, data in indicators.items():
+        df = dfs.get(symbol)
+        if df is None or df.empty:
+            continue
+        bar = df.iloc[-1]
+        bar_day = f"{df.index[-1]:%Y-%m-%d}"
+        budget = TEST_CAPITAL * TARGETS[symbol]['weight']
+        added += len(GRID_LEDGER.update(symbol, bar_day, float(bar['Low']), float(bar['High']),
+                                        data['price'], data['grid_buy'], budget))
+    return added
+
+def run_grid(dfs=None, indicators=None, render=True, lead_lag=None):
+    """
+    dfs: 已抓好的各標的日線（盤中事件掃描時傳入，避免重複下載）
+    indicators: 已算好的 compute_advanced_grid 結果（同上）
+    lead_lag: 美股連動引擎的 {代號: 特徵}（推估開盤跳空）
+    render: False 時不畫圖（由 DAG 的 render 階段另外平行繪製）
+    """
     tw_tz = timezone(timedelta(hours=8))
-    now = datetime.now(tw_tz)
+    now = clock.now(tw_tz)
     
     # 取得美股情緒
     us_sentiment = {}
@@ -154,25 +151,35 @@ def run_grid():
     
     dfs_all = {}
     ai_results = {}
+    ledgers = {}
+
+    # 單獨執行時也走日線快取（與管線同一個資料來源，週 / 月線與美股連動特徵才一致）
+    fetch_share = 0.0
+    if dfs is None:
+        t_fetch = time.perf_counter()
+        dfs = fetch_grid_history()
+        fetch_share = (time.perf_counter() - t_fetch) * 1000 / max(len(TARGETS), 1)
     
     for symbol, cfg in TARGETS.items():
         try:
-            # 抓取一年數據
-            df = yf.download(symbol, period="1y", interval="1d", progress=False)
+            # 取出一年日線（已由快取抓好）
+            t_start = time.perf_counter()
+            ai_ms = 0.0
+            df = dfs.get(symbol)
+            if df is None: continue
+            fetch_ms = fetch_share
             if df.empty: continue
-            if isinstance(df.columns, pd.MultiIndex): 
-                df.columns = df.columns.get_level_values(0)
             
-            data = compute_advanced_grid(df)
+            data = (indicators or {}).get(symbol) or compute_advanced_grid(df)
             dfs_all[symbol] = df
             
-            alloc_per_grid = (TEST_CAPITAL * cfg['weight']) / 5
+            alloc_per_grid = (TEST_CAPITAL * cfg['weight']) / GRID_LEVELS
             suggested_shares = int(alloc_per_grid // data['grid_buy']) if data['grid_buy'] > 0 else 0
             
             # =====================
             # 🤖 AI 判斷整合（結合美股情緒）
             # =====================
-            ai_result = {"decision": "觀望", "confidence": 0, "reason": "AI 未啟用"}
+            ai_result = {"decision": "觀望", "confidence": 0, "reason": "AI 未啟用", "origin": "none"}
             
             if AI_AVAILABLE:
                 try:
@@ -180,13 +187,16 @@ def run_grid():
                         "price": data['price'],
                         "trend": data['trend'],
                         "rsi": f"{data['rsi']:.1f}",
-                        "grid_buy": f"{data['grid_buy']:.2f}"
+                        "grid_buy": f"{data['grid_buy']:.2f}",
+                        "gap_est": gap_feature((lead_lag or {}).get(symbol)),
                     }
+                    t_ai = time.perf_counter()
                     ai_result = analyze_grid_trading(extra_data, cfg['name'], debug=False)
+                    ai_ms = (time.perf_counter() - t_ai) * 1000
                     ai_results[symbol] = ai_result
                 except Exception as e:
                     logging.error(f"AI 判斷異常 {symbol}: {e}")
-                    ai_result = {"decision": "觀望", "confidence": 50, "reason": "AI 分析異常"}
+                    ai_result = {"decision": "觀望", "confidence": 50, "reason": "AI 分析異常", "origin": "error"}
             
             # =====================
             # 📝 個股報告
@@ -194,13 +204,29 @@ def run_grid():
             report.append(f"## {cfg['name']} 📍")
             report.append(f"💵 **目前現價**： `{data['price']:.2f}`")
             report.append(f"🔍 **趨勢矩陣**： {data['trend']}")
+            views = data.get("timeframes") or timeframe_views(symbol, df)
+            if views:
+                report.append(format_timeframes(views))
             report.append(f"📈 **RSI 指標**： `{data['rsi']:.1f}`")
             report.append(f"🛡️ **補倉預計**： `{data['grid_buy']:.2f}`")
+            if (lead_lag or {}).get(symbol):
+                report.append(format_lead_lag(lead_lag[symbol]))
             report.append(f"⚡ **下單指令**： `買入 {suggested_shares} 股`")
+            ledger = GRID_LEDGER.summary(symbol, data['price'])
+            ledgers[symbol] = ledger
+            report.append(format_ledger(ledger))
             report.append(f"### 🤖 AI 策略判斷")
             report.append(f"📍 **決策**： **{ai_result['decision']}** (信心度: {ai_result['confidence']}%)")
             report.append(f"💡 **理由**： {ai_result['reason']}")
             report.append("-" * 20)
+
+            record_snapshot(
+                "grid", symbol,
+                price=data['price'], rsi=data['rsi'], ma20=data['ma20'], ma60=data['ma60'],
+                grid_buy=data['grid_buy'], month_low=data['month_low'], trend=data['trend'],
+                decision=ai_result['decision'], confidence=ai_result['confidence'], origin=ai_result.get('origin', ''),
+                fetch_ms=fetch_ms, ai_ms=ai_ms, total_ms=fetch_ms + (time.perf_counter() - t_start) * 1000
+            )
             
         except Exception as e:
             logging.error(f"網格執行錯誤 {symbol}: {e}")
@@ -221,7 +247,16 @@ def run_grid():
             report.append(f"⚠️ **建議觀望**： 等待更明確訊號或持續定期定額")
         report.append("-" * 20)
 
+    if ledgers:
+        unrealized = sum(s['unrealized'] for s in ledgers.values())
+        realized = sum(s['realized'] for s in ledgers.values())
+        invested = sum(s['cost'] for s in ledgers.values())
+        report.append(f"## 📒 虛擬帳本總覽")
+        report.append(f"💰 **已投入**： `{invested:,.0f} / {TEST_CAPITAL:,} TWD`")
+        report.append(f"💹 **總損益**： `{unrealized + realized:+,.0f} TWD`（未實現 `{unrealized:+,.0f}` ／ 已實現 `{realized:+,.0f}`）")
+        report.append("-" * 20)
+
     report.append(f"📊 **萬元網格實驗動態分析圖已生成，請參閱下方附件**")
     
-    img_buf = generate_grid_chart(dfs_all)
+    img_buf = generate_grid_chart(dfs_all) if render else None
     return "\n".join(report).strip(), img_buf
@@ -0,0 +1,129 @@
+# outlook_engine.py - 蒙地卡羅價格展望（NumPy 批次模擬 + 百分位區間）
+import time
+import logging
+
+import numpy as np
+
+SIM_PATHS = 100_000
+FAST_BLOCK = 10         # 快速模式：每條路徑以 10 日和為單位抽樣，抽樣次數減為 1/10
+FAST_POOL = 1 << 16     # 快速模式預先重抽的 10 日和個數（2 的次方：索引直接取 16 位元亂數；池子太小會低估尾部）
+FAST_TOLERANCE = 0.01   # 快速 / 完整模式的對數報酬百分位容許差（約 1% 價格）
+FAST_TARGET_MS = 100    # 快速模式 10 萬路徑 × 252 日的耗時目標
+MIN_HISTORY = 20        # 歷史日報酬少於此數不做模擬
+CHUNK_PATHS = 25_000    # 完整模式分批，避免 10 萬 × 252 的矩陣一次吃滿記憶體
+
+def log_returns(closes):
+    """收盤價序列 → 日對數報酬（float64 陣列，去除 NaN）"""
+    arr = np.asarray(closes, dtype="f8")
+    rets = np.diff(np.log(arr))
+    return rets[np.isfinite(rets)]
+
+def _draw(rng, size, shape):
+    """抽樣索引：池子夠小就用 int16，減少亂數產生與 gather 的記憶體流量"""
+    dtype = np.int16 if size < np.iinfo(np.int16).max else np.int32
+    return rng.integers(0, size, size=shape, dtype=dtype)
+
+def _fast_draw(rng, size, shape):
+    """
+    快速模式的抽樣索引：直接切 64 位元原始亂數，省掉 rng.integers 的拒絕取樣
+    - size == FAST_POOL（2^16）：每 16 位元就是一個索引，完全均勻
+    - 其他 size：32 位元亂數 × size 取高 32 位（乘法映射，偏差 < size / 2^32）
+    """
+    count = int(np.prod(shape))
+    if size == FAST_POOL:
+        return rng.bit_generator.random_raw(-(-count // 4)).view(np.uint16)[:count].reshape(shape)
+    raw = rng.bit_generator.random_raw(-(-count // 2)).view(np.uint32)[:count]
+    return ((raw.astype(np.uint64) * size) >> 32).reshape(shape)
+
+def simulate_log_growth(rets, horizon, n_paths=SIM_PATHS, method="bootstrap", fast=True, seed=None):
+    """
+    模擬 horizon 個交易日的累積對數報酬（回傳 shape=(n_paths,) 的 float64 陣列）
+    method:
+      - "bootstrap": 從歷史日報酬逐日獨立重抽樣；fast=True 時改為兩段式抽樣（分佈與逐日重抽樣一致）
+      - "normal":    以歷史平均 / 標準差擬合常態，h 日總和直接一次抽出
+    """
+    rng = np.random.default_rng(seed)
+    rets = np.asarray(rets, dtype="f8")
+
+    if method == "normal":
+        mu, sigma = rets.mean(), rets.std(ddof=1)
+        return rng.normal(mu * horizon, sigma * np.sqrt(horizon), n_paths)
+
+    if fast and horizon >= FAST_BLOCK * 2:
+        # 兩段式重抽樣：先以日報酬獨立重抽出 FAST_POOL 個「10 日和」，每條路徑再從中抽 horizon // 10 個
+        # 池中每個元素本身就是 10 次獨立日抽樣的和，加總後的平均 / 變異數與逐日重抽樣一致，抽樣次數約減為 1/10
+        # （重疊區塊和只有約 240 個彼此高度相關的值，會把年化波動低估 / 高估 30% 以上）
+        # 索引排成 (抽樣次數, 路徑數)：沿第 0 軸加總是整列連續相加，比逐路徑加總快約一倍；float32 累加 25 項誤差 < 1e-6
+        pool = rets.astype("f4")
+        blocks = pool[_fast_draw(rng, len(pool), (FAST_BLOCK, FAST_POOL))].sum(axis=0)
+        draws, rest = divmod(horizon, FAST_BLOCK)
+        total = blocks[_fast_draw(rng, FAST_POOL, (draws, n_paths))].sum(axis=0).astype("f8")
+        if rest:
+            total += pool[_fast_draw(rng, len(pool), (rest, n_paths))].sum(axis=0)
+        return total
+
+    pool = rets.astype("f4")
+    total = np.empty(n_paths)
+    for start in range(0, n_paths, CHUNK_PATHS):
+        stop = min(start + CHUNK_PATHS, n_paths)
+        total[start:stop] = pool[_draw(rng, len(pool), (stop - start, horizon))].sum(axis=1, dtype="f8")
+    return total
+
+def outlook(price, closes, horizon=252, percentiles=(10, 50, 90), n_paths=SIM_PATHS,
+            method="bootstrap", fast=True, seed=42):
+    """
+    價格展望：回傳各百分位價格與中位數年化報酬
+    歷史資料不足時回傳 None，由呼叫端沿用原本的簡易推估
+    """
+    rets = log_returns(closes)
+    if len(rets) < MIN_HISTORY:
+        return None
+
+    t0 = time.perf_counter()
+    total = simulate_log_growth(rets, horizon, n_paths, method, fast, seed)
+    # 百分位在對數空間一次算完（exp 為單調函數，結果相同）
+    qs = np.exp(np.percentile(total, list(percentiles) + [50]))
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+
+    median_growth = float(qs[-1])
+    result = {f"p{p}": float(v) * price for p, v in zip(percentiles, qs[:-1])}
+    result.update({
+        "median": price * median_growth,
+        "annual_return": (median_growth ** (252 / horizon) - 1) * 100,
+        "prob_up": float((total > 0).mean() * 100),
+        "paths": n_paths,
+        "elapsed_ms": elapsed_ms,
+    })
+    logging.info(f"🎲 蒙地卡羅展望 {n_paths:,} 路徑 × {horizon} 日：{elapsed_ms:.0f}ms")
+    return result
+
+def check_fast(closes, horizon=252, percentiles=(10, 16, 50, 84, 90), seed=0, tol=FAST_TOLERANCE):
+    """
+    快速模式與完整逐日重抽樣比對：回傳 {百分位: 對數報酬差}，任一超過 tol 就拋 AssertionError
+    （兩邊各用 SIM_PATHS 條路徑；10 萬條路徑本身的抽樣誤差約 0.002）
+    """
+    rets = log_returns(closes)
+    fast = np.percentile(simulate_log_growth(rets, horizon, fast=True, seed=seed), percentiles)
+    full = np.percentile(simulate_log_growth(rets, horizon, fast=False, seed=seed + 1), percentiles)
+    diff = {p: float(d) for p, d in zip(percentiles, fast - full)}
+    worst = max(diff.values(), key=abs)
+    assert abs(worst) <= tol, f"快速模式百分位偏差 {worst:+.4f} 超過容許值 {tol}"
+    return diff
+
+# === 效能量測 ===
+if __name__ == "__main__":
+    rng = np.random.default_rng(1)
+    closes = 10 * np.exp(np.cumsum(rng.normal(0.0004, 0.012, 252)))
+    outlook(float(closes[-1]), closes, n_paths=1000)  # 暖機（首次呼叫的配置成本不計）
+    fast_ms = sorted(outlook(float(closes[-1]), closes, seed=i)["elapsed_ms"] for i in range(11))
+    res = outlook(float(closes[-1]), closes, fast=False)
+    mark = "✅" if fast_ms[5] < FAST_TARGET_MS else "⚠️"
+    print(f"{mark} 快速模式: 中位數 {fast_ms[5]:.0f} ms / 最慢 {fast_ms[-1]:.0f} ms（目標 < {FAST_TARGET_MS} ms，11 次）")
+    print(f"完整模式: {res['elapsed_ms']:.0f} ms | P10 {res['p10']:.2f} / P50 {res['p50']:.2f} / P90 {res['p90']:.2f}")
+    # 一致性檢查：多組隨機序列 × 種子，百分位（對數報酬）差都要在 FAST_TOLERANCE 內
+    for series_seed in range(3):
+        rets_rng = np.random.default_rng(series_seed)
+        series = 10 * np.exp(np.cumsum(rets_rng.normal(0.0004, 0.012, 252)))
+        diff = check_fast(series, seed=series_seed)
+        print(f"✅ 序列 {series_seed}: 百分位差 " + " / ".join(f"P{p} {d:+.4f}" for p, d in diff.items())
+              + f"（容許 ±{FAST_TOLERANCE}）")
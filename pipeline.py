@@ -0,0 +1,201 @@
+# pipeline.py - 報告流程 DAG 執行器（階段宣告相依、可平行的階段同時跑、關鍵路徑計時）
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from tick_context import current_tick
+
+# 階段多半在等網路（yfinance / Gemini / Discord），繪圖也已執行緒安全，用執行緒池即可
+# 每次 run 各開一個執行緒池（執行緒用到才建立）：逾時卡住的階段只佔住那一次的池子，跟著被放棄，
+# 不會把共用池的工作執行緒耗盡、讓之後的巡檢排不進去
+POOL_WORKERS = 6
+
+# 每條管線最近一次的計時摘要（供儀表板讀取）
+LAST_RUNS = {}
+
+class Stage:
+    """
+    一個階段：fn(inputs) → 結果，inputs 為 {相依階段名稱: 結果}
+    相依階段失敗時下游仍會執行、拿到 None（與原本各段各自 try/except 的行為一致）
+    """
+
+    def __init__(self, name, fn, deps=()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+class Pipeline:
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = {s.name: s for s in stages}
+        self._check()
+
+    def _check(self):
+        """相依名稱必須存在且不可成環（Kahn 拓撲排序）"""
+        for stage in self.stages.values():
+            unknown = [d for d in stage.deps if d not in self.stages]
+            if unknown:
+                raise ValueError(f"階段 {stage.name} 相依未知階段 {unknown}")
+        indegree = {n: len(s.deps) for n, s in self.stages.items()}
+        ready = [n for n, d in indegree.items() if d == 0]
+        seen = 0
+        while ready:
+            name = ready.pop()
+            seen += 1
+            for other in self.stages.values():
+                if name in other.deps:
+                    indegree[other.name] -= 1
+                    if indegree[other.name] == 0:
+                        ready.append(other.name)
+        if seen != len(self.stages):
+            raise ValueError(f"管線 {self.name} 的相依關係成環")
+
+    def run(self, initial=None, pool=None):
+        """
+        執行整條管線；initial 為已有結果的階段（例如盤中掃描已抓好的行情），直接略過
+        相依都完成的階段立即送進執行緒池，呼叫端執行緒只負責調度
+        在巡檢週期內最多等到 deadline：逾時仍在跑 / 還沒開始的階段記為 TimeoutError、結果為 None，
+        直接回傳已完成的部分（卡住的執行緒無法中止，在背景結束後結果丟棄）
+        pool: 呼叫端自備的執行緒池（不會被關閉）；預設每次 run 新開一個，結束時放棄（不等卡住的階段）
+        """
+        own = pool is None
+        if own:
+            pool = ThreadPoolExecutor(max_workers=POOL_WORKERS, thread_name_prefix=f"stage-{self.name}")
+        tick = current_tick()
+        run = PipelineRun(self)
+        run.results.update(initial or {})
+        pending = {n: s for n, s in self.stages.items() if n not in run.results}
+        waiting = {n: {d for d in s.deps if d not in run.results} for n, s in pending.items()}
+        running = {}
+
+        while pending or running:
+            if tick is not None and tick.remaining() <= 0:
+                run.expire(list(running.values()) + list(pending))
+                break
+            for name in [n for n in pending if not waiting[n]]:
+                stage = pending.pop(name)
+                inputs = {d: run.results.get(d) for d in stage.deps}
+                # 複製 context：巡檢時間預算（tick_context）跟著階段進到工作執行緒
+                running[pool.submit(contextvars.copy_context().run, run._execute, stage, inputs)] = name
+            if not running:
+                break
+            done, _ = wait(running, timeout=tick.remaining() if tick is not None else None,
+                           return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                run.results[name] = fut.result()
+                for deps in waiting.values():
+                    deps.discard(name)
+
+        if own:
+            pool.shutdown(wait=False, cancel_futures=True)
+        run.elapsed = time.perf_counter() - run.t0
+        summary = LAST_RUNS[self.name] = run.summary()
+        tick = current_tick()
+        if tick is not None:
+            tick.spans.append({"pipeline": self.name, **summary})
+        logging.info(run.format_report())
+        return run
+
+class PipelineRun:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.results = {}
+        self.errors = {}
+        self.timings = {}  # 階段 → (開始, 結束)，相對於管線開始的秒數
+        self.started = {}
+        self.t0 = time.perf_counter()
+        self.elapsed = 0.0
+
+    def _execute(self, stage, inputs):
+        start = time.perf_counter() - self.t0
+        self.started[stage.name] = start
+        try:
+            return stage.fn(inputs)
+        except Exception as e:
+            logging.error(f"❌ 階段 {stage.name} 失敗: {e}")
+            self.errors.setdefault(stage.name, e)  # 已判定逾時的階段保留逾時紀錄
+            return None
+        finally:
+            self.timings.setdefault(stage.name, (start, time.perf_counter() - self.t0))
+
+    def expire(self, names):
+        """巡檢預算用完：未完成的階段一律記為逾時（結果 None，計時算到現在）"""
+        now = time.perf_counter() - self.t0
+        for name in names:
+            self.results[name] = None
+            self.errors[name] = TimeoutError(f"階段 {name} 超過巡檢時間預算")
+            if name in self.started:
+                self.timings[name] = (self.started[name], now)
+        logging.error(f"⏰ 管線 {self.pipeline.name} 超過巡檢時間預算，未完成的階段：{', '.join(names)}")
+
+    def critical_path(self):
+        """從最晚結束的階段往回，每一步取最晚完成的相依階段"""
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = [name]
+        while True:
+            deps = [d for d in self.pipeline.stages[name].deps if d in self.timings]
+            if not deps:
+                break
+            name = max(deps, key=lambda n: self.timings[n][1])
+            path.append(name)
+        return path[::-1]
+
+    def summary(self):
+        busy = sum(end - start for start, end in self.timings.values())
+        return {
+            "elapsed_ms": self.elapsed * 1000,
+            "busy_ms": busy * 1000,
+            "stages": {n: {"start_ms": s * 1000, "ms": (e - s) * 1000} for n, (s, e) in self.timings.items()},
+            "critical_path": self.critical_path(),
+            "errors": sorted(self.errors),
+        }
+
+    def format_report(self):
+        busy = sum(end - start for start, end in self.timings.values())
+        parallel = busy / self.elapsed if self.elapsed else 1.0
+        path = " → ".join(f"{n} {self.timings[n][1] - self.timings[n][0]:.1f}s" for n in self.critical_path())
+        lines = [
+            f"🧭 管線 {self.pipeline.name}：總耗時 {self.elapsed:.1f}s（各階段合計 {busy:.1f}s，平行度 {parallel:.1f}×）",
+            f"   關鍵路徑：{path or '（無）'}",
+        ]
+        if self.errors:
+            lines.append(f"   失敗階段：{', '.join(sorted(self.errors))}")
+        return "\n".join(lines)
+
+# === 檢查：上一輪巡檢有階段卡住（佔滿 POOL_WORKERS 條執行緒）時，下一輪健康的巡檢仍能在預算內跑完 ===
+if __name__ == "__main__":
+    import threading
+
+    from tick_context import TickContext, tick_scope
+
+    logging.basicConfig(level=logging.CRITICAL)
+    release = threading.Event()
+
+    def hung(inputs):
+        release.wait(30)  # 模擬卡住不回應的網路請求
+
+    hung_stages = [Stage(f"hung_{i}", hung) for i in range(POOL_WORKERS)]
+    healthy = Pipeline("healthy", [Stage("fetch", lambda i: 1), Stage("report", lambda i: i["fetch"] + 1, deps=("fetch",))])
+
+    def two_ticks(pool=None):
+        with tick_scope(TickContext(budget=0.3, label="卡住")):
+            stuck = Pipeline("stuck", hung_stages).run(pool=pool)
+        with tick_scope(TickContext(budget=0.3, label="健康")):
+            t0 = time.perf_counter()
+            run = healthy.run(pool=pool)
+        return stuck, run, (time.perf_counter() - t0) * 1000
+
+    try:
+        stuck, run, ms = two_ticks()
+        print(f"✅ 每次 run 各自的執行緒池：卡住那輪逾時 {len(stuck.errors)} 個階段；下一輪 report = {run.results['report']}，"
+              f"錯誤 {sorted(run.errors) or '無'}，{ms:.1f}ms")
+        assert run.results["report"] == 2 and not run.errors
+        shared = ThreadPoolExecutor(max_workers=POOL_WORKERS)
+        _, run, ms = two_ticks(shared)
+        print(f"⚠️ 對照（共用執行緒池）：下一輪 report = {run.results['report']}，錯誤 {sorted(run.errors)}，{ms:.0f}ms")
+    finally:
+        release.set()
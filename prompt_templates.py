@@ -0,0 +1,194 @@
+# prompt_templates.py - 提示詞模板中心（預編譯模板 + 共用美股情境 + token 估算）
+import math
+import threading
+from string import Formatter
+
+# === 模板註冊表 ===
+TEMPLATES = {}
+
+# === 使用統計（每次送出的提示詞 token 估算）===
+PROMPT_STATS = {}
+_stats_lock = threading.Lock()
+
+class PromptTemplate:
+    """
+    預編譯模板：註冊時就把格式字串拆成 (文字, 欄位, 格式) 片段，
+    渲染時只做拼接，不再每次重新解析 f-string
+    """
+    __slots__ = ("name", "fields", "_parts")
+
+    def __init__(self, name, source):
+        self.name = name
+        self._parts = [
+            (literal, field, spec)
+            for literal, field, spec, _ in Formatter().parse(source)
+        ]
+        self.fields = tuple(f for _, f, _ in self._parts if f)
+
+    def render(self, values):
+        out = []
+        for literal, field, spec in self._parts:
+            out.append(literal)
+            if field:
+                out.append(format(values.get(field, "N/A"), spec or ""))
+        return "".join(out)
+
+def register(name, source):
+    TEMPLATES[name] = PromptTemplate(name, source)
+    return TEMPLATES[name]
+
+def render(name, values=None, **kwargs):
+    """渲染模板並記錄 token 估算"""
+    data = dict(values or {})
+    data.update(kwargs)
+    text = TEMPLATES[name].render(data)
+    note_prompt(name, text)
+    return text
+
+def estimate_tokens(text):
+    """
+    粗估 token 數：中日韓字元約 1 字 1 token，其餘約 4 字元 1 token
+    （足以比較模板大小，非精確計費）
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def note_prompt(name, text):
+    with _stats_lock:
+        st = PROMPT_STATS.setdefault(name, {"calls": 0, "chars": 0, "tokens": 0})
+        st["calls"] += 1
+        st["chars"] += len(text)
+        st["tokens"] += estimate_tokens(text)
+
+def prompt_stats():
+    with _stats_lock:
+        return {k: dict(v) for k, v in PROMPT_STATS.items()}
+
+# =====================
+# 🌍 共用美股情境（台股 / 網格共用，依情緒內容快取）
+# =====================
+_context_cache = {"key": None, "text": ""}
+
+def shared_us_context(us_sentiment):
+    """
+    產生共用的美股參考段落；同一份情緒只組一次字串
+    支援 systemInstruction 的模型會以系統指令送出，不支援的（gemma）則併入提示詞
+    """
+    key = (
+        us_sentiment.get("sentiment", "未知"),
+        us_sentiment.get("tsm_trend", "未知"),
+        us_sentiment.get("next_day_prediction", "未知"),
+    )
+    if _context_cache["key"] != key:
+        _context_cache["text"] = TEMPLATES["us_context"].render(
+            {"sentiment": key[0], "tsm_trend": key[1], "next_day": key[2]}
+        )
+        _context_cache["key"] = key
+    return _context_cache["text"]
+
+# =====================
+# 📝 模板定義
+# =====================
+register("us_context", """美股參考（昨日盤後）：情緒 {sentiment}｜台積電ADR {tsm_trend}｜台股明日 {next_day}""")
+
+register("us_market", """你是專業美股分析師，分析今日盤後數據並預測台股明日開盤。
+標普500 {spx}｜那斯達克 {nasdaq}｜台積電ADR {tsm}｜技術面 {tech}
+步驟：評估整體情緒（多頭/空頭/中性）→ 科技股動能強度（0-100）→ 台積電ADR對台股影響 → 台股明日方向（上漲/下跌/震盪）。
+只輸出 JSON（不含 Markdown）：
+{{"sentiment":"多頭/空頭/中性","strength":75,"tsm_trend":"強勢/弱勢/持平","next_day":"上漲/下跌/震盪","reason":"原因（100字內）"}}""")
+
+register("taiwan_stock", """你是專業存股經理人，分析台股標的「{target_name}」並給出今日開盤策略。
+技術數據：{tech_summary}
+系統評分 {score}｜價格位階 {position}｜長期展望 {outlook}
+步驟：美股對開盤影響（高開/低開/平盤）→ 價格位階（低檔積極/高檔觀望）→ 技術面與基本面。
+只輸出 JSON（不含 Markdown）：
+{{"decision":"積極買進/定期定額/觀望等待","confidence":70,"reason":"是否該進場及美股影響（100字內）"}}""")
+
+register("grid_trading", """你是網格交易專家，分析「{target_name}」的網格策略並給出今日策略。
+現價 {price}｜趨勢 {trend}｜RSI {rsi}｜補倉點 {grid_buy}｜美股推估開盤 {gap_est}
+步驟：美股影響（偏多高開→等回檔？偏空低開→提早佈局？）→ RSI 超買超賣 → 趨勢與補倉點。
+只輸出 JSON（不含 Markdown）：
+{{"decision":"立即買進/等待回檔/觀望","confidence":65,"reason":"是否該進場及美股影響（100字內）"}}""")
+
+# === 每個巡檢週期的提示詞組成（1 次存股 + 3 次網格）===
+TICK_MIX = {"taiwan_stock": 1, "grid_trading": 3}
+
+def tick_token_estimate(samples, us_sentiment):
+    """估算一個巡檢週期送出的輸入 token 總數"""
+    ctx = estimate_tokens(shared_us_context(us_sentiment))
+    return sum(
+        (estimate_tokens(TEMPLATES[name].render(samples[name])) + ctx) * count
+        for name, count in TICK_MIX.items()
+    )
+
+# === 節省量測 ===
+if __name__ == "__main__":
+    # 重構前 ai_expert 內手寫 f-string 的提示詞（僅作比較基準）
+    legacy_tw = """你是專業存股經理人，請深度分析台股標的「{target_name}」。
+
+技術數據：
+{tech_summary}
+
+美股參考（昨日盤後）：
+- 市場情緒: {sentiment}
+- 台積電ADR: {tsm_trend}
+- 明日預測: {next_day}
+
+存股策略評估：
+1. 系統評分: {score}
+2. 價格位階: {position}
+3. 長期展望: {outlook}
+
+分析步驟：
+1. 考量美股開盤方向（可能高開/低開/平盤）
+2. 評估當前價格位階（低檔適合積極/高檔宜觀望）
+3. 結合技術面與基本面
+4. 給出今日開盤策略
+
+請輸出 JSON（不要包含 Markdown 標記）：
+{{
+  "decision": "積極買進/定期定額/觀望等待",
+  "confidence": 70,
+  "reason": "詳細解釋原因，並告知現在是否該進場（100字內，需說明美股影響）"
+}}"""
+    legacy_grid = """你是網格交易專家，請深度分析「{target_name}」的網格策略。
+
+技術面：
+- 現價: {price}
+- 趨勢: {trend}
+- RSI: {rsi}
+- 補倉點: {grid_buy}
+
+美股參考（昨日盤後）：
+- 明日預測: {next_day}
+- 台積電ADR: {tsm_trend}
+
+分析步驟：
+1. 判斷美股對台股開盤的影響
+   - 美股偏多 → 台股可能高開 → 是否等回檔
+   - 美股偏空 → 台股可能低開 → 是否提早佈局
+2. 評估 RSI 超買/超賣狀態
+3. 結合趨勢與補倉點
+4. 給出今日策略
+
+請輸出 JSON（不要包含 Markdown 標記）：
+{{
+  "decision": "立即買進/等待回檔/觀望",
+  "confidence": 65,
+  "reason": "詳細解釋原因，並告知現在是否該進場（100字內，需說明美股影響）"
+}}"""
+    us = {"sentiment": "多頭", "tsm_trend": "強勢", "next_day_prediction": "上漲"}
+    samples = {
+        "taiwan_stock": {"target_name": "凱基台灣 TOP 50", "tech_summary": "現價 10.09, 距發行價 +0.9%, 價格位階 31%, 年化報酬 17.7%",
+                         "score": "70/100", "position": "31%（0.31）", "outlook": "2027目標 11.88, 複利年化 17.7%"},
+        "grid_trading": {"target_name": "2317 鴻海", "price": 215.0, "trend": "🟢 強勢空頭", "rsi": "32.1", "grid_buy": "210.49", "gap_est": "+0.42%（那斯達克 ρ 0.61）"},
+    }
+    legacy_vals = {"sentiment": "多頭", "tsm_trend": "強勢", "next_day": "上漲"}
+    old = (estimate_tokens(PromptTemplate("", legacy_tw).render({**samples["taiwan_stock"], **legacy_vals}))
+           + 3 * estimate_tokens(PromptTemplate("", legacy_grid).render({**samples["grid_trading"], **legacy_vals})))
+    new = tick_token_estimate(samples, us)
+    print(f"📏 每週期輸入 token（舊手寫 f-string）: ~{old}")
+    print(f"📏 每週期輸入 token（預編譯模板）: ~{new}")
+    print(f"📉 節省: {(1 - new / old) * 100:.0f}%")
@@ -0,0 +1,349 @@
+# replay_driver.py - 交易日回放（模擬時鐘 + 錄製行情 / AI 回應，離線壓測排程與快取）
+import os
+import sys
+import json
+import time
+import zlib
+import logging
+import argparse
+import itertools
+import tempfile
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from market_clock import SimClock, use_clock, now as clock_now
+
+SESSION_OPEN = (9, 0)
+SESSION_CLOSE = (13, 30)
+DEFAULT_AI_RESPONSES = [
+    {"decision": "定期定額", "confidence": 70, "reason": "回放：位階中性，分批佈局",
+     "sentiment": "中性偏多", "strength": 62, "tsm_trend": "走強", "next_day": "小漲"},
+    {"decision": "等待回檔", "confidence": 60, "reason": "回放：短線過熱，等待拉回",
+     "sentiment": "中性", "strength": 50, "tsm_trend": "持平", "next_day": "震盪"},
+]
+
+# =====================
+# 📼 錄製行情
+# =====================
+def _synthetic_frame(symbol, end, days=260):
+    """沒有錄製檔時的替代行情：以代號為種子的隨機漫步日線（每次結果相同）"""
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+    idx = pd.bdate_range(end=end, periods=days)
+    base = 10 + zlib.crc32(symbol.encode()) % 400
+    close = base * np.exp(np.cumsum(rng.normal(0.0003, 0.012, days)))
+    open_ = close * (1 + rng.normal(0, 0.004, days))
+    spread = np.abs(rng.normal(0, 0.006, days)) * close
+    return pd.DataFrame({
+        "Open": open_,
+        "High": np.maximum(open_, close) + spread,
+        "Low": np.minimum(open_, close) - spread,
+        "Close": close,
+        "Volume": rng.integers(1_000, 50_000, days).astype("f8") * 1000,
+    }, index=idx)
+
+def record_fixtures(out_dir, symbols):
+    """把目前的一年日線存成 <symbol>.csv，之後可重複回放同一天（需要網路）"""
+    import yfinance as yf
+
+    os.makedirs(out_dir, exist_ok=True)
+    for symbol in symbols:
+        df = yf.download(symbol, period="1y", interval="1d", progress=False)
+        if isinstance(df.columns, pd.MultiIndex):
+            df.columns = df.columns.get_level_values(0)
+        df.to_csv(os.path.join(out_dir, f"{symbol}.csv"))
+        logging.info(f"📼 已錄製 {symbol}：{len(df)} 根日線")
+
+class ReplayFeed:
+    """
+    取代 yfinance 的行情來源（提供 download / Ticker().history 兩種介面）
+    - 台股標的：回放日之前為完整日線，回放日當天依模擬時間生成盤中 K 棒
+      （價格沿 開→低→高→收 或 開→高→低→收 線性移動）
+    - 美股標的：只看得到回放日之前的收盤（台北早上時美股已收盤）
+    """
+
+    def __init__(self, frames, replay_date, us_symbols=()):
+        self.replay_date = pd.Timestamp(replay_date).normalize()
+        self.us_symbols = set(us_symbols)
+        self._frames = {}
+        for symbol, df in frames.items():
+            df = df.copy()
+            df.index = pd.DatetimeIndex(df.index).tz_localize(None).normalize()
+            self._frames[symbol] = df
+        self._cache_key = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def load(cls, fixture_dir, symbols, replay_date=None, us_symbols=()):
+        """讀 <fixture_dir>/<symbol>.csv；缺檔的標的以替代行情補上"""
+        frames = {}
+        for symbol in symbols:
+            path = os.path.join(fixture_dir, f"{symbol}.csv") if fixture_dir else ""
+            if path and os.path.exists(path):
+                frames[symbol] = pd.read_csv(path, index_col=0, parse_dates=True)
+        if replay_date is None:
+            replay_date = max(df.index[-1] for df in frames.values()) if frames else pd.Timestamp("2026-10-16")
+        for symbol in symbols:
+            if symbol not in frames:
+                frames[symbol] = _synthetic_frame(symbol, replay_date)
+        return cls(frames, replay_date, us_symbols)
+
+    def _session_fraction(self, now):
+        open_ = now.replace(hour=SESSION_OPEN[0], minute=SESSION_OPEN[1], second=0, microsecond=0)
+        close = now.replace(hour=SESSION_CLOSE[0], minute=SESSION_CLOSE[1], second=0, microsecond=0)
+        return (now - open_) / (close - open_)
+
+    def _build(self, symbol, now):
+        df = self._frames[symbol]
+        before = df[df.index < self.replay_date]
+        if symbol in self.us_symbols:
+            return before
+        frac = self._session_fraction(now)
+        today = df[df.index == self.replay_date]
+        if frac < 0 or today.empty:
+            return before
+        bar = today.iloc[0]
+        o, h, l, c = (float(bar[k]) for k in ("Open", "High", "Low", "Close"))
+        knots = np.array([o, l, h, c] if c >= o else [o, h, l, c])
+        xs = np.linspace(0, 1, len(knots))
+        frac = min(frac, 1.0)
+        price = float(np.interp(frac, xs, knots))
+        seen = np.append(knots[xs <= frac], price)
+        partial = pd.DataFrame({
+            "Open": [o], "High": [seen.max()], "Low": [seen.min()], "Close": [price],
+            "Volume": [float(bar.get("Volume", 0.0)) * frac],
+        }, index=[self.replay_date])
+        return pd.concat([before, partial])
+
+    def history_at(self, symbol, now=None):
+        now = now or clock_now()
+        minute = now.replace(second=0, microsecond=0)
+        with self._lock:
+            self.calls += 1
+            if self._cache_key != minute:
+                self._cache_key, self._cache = minute, {}
+            df = self._cache.get(symbol)
+            if df is None:
+                df = self._cache[symbol] = self._build(symbol, now)
+        return df.copy()
+
+    # --- yfinance 相容介面 ---
+    def download(self, symbol, *args, **kwargs):
+        if symbol not in self._frames:
+            return pd.DataFrame()
+        return self.history_at(symbol)
+
+    def Ticker(self, symbol):
+        feed = self
+
+        class _Ticker:
+            def history(self, *args, **kwargs):
+                return feed.download(symbol)
+
+        return _Ticker()
+
+# =====================
+# 🤖 錄製 AI 回應
+# =====================
+class ReplayAI:
+    """取代 ai_expert._call_gemini_api：依序循環回傳錄製的回應（可加固定延遲模擬 API 耗時）"""
+
+    def __init__(self, responses=None, latency=0.0):
+        self.responses = list(responses or DEFAULT_AI_RESPONSES)
+        self.latency = latency
+        self._cycle = itertools.cycle(self.responses)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def load(cls, path, latency=0.0):
+        """JSONL：每行一個 AI 回傳的 JSON 物件"""
+        with open(path, encoding="utf-8") as fh:
+            return cls([json.loads(line) for line in fh if line.strip()], latency)
+
+    def __call__(self, prompt, debug=False, stream=None, system_context=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            return dict(next(self._cycle))
+
+# =====================
+# 📤 Discord 替代出口
+# =====================
+class ReplaySink:
+    """取代 Discord 出口：圖片照常由投遞路由壓縮（量測編碼成本），這裡只記錄訊息數與位元組"""
+    channel = "discord"
+    name = "replay"
+
+    def __init__(self):
+        self.messages = 0
+        self.images = 0
+        self.bytes = 0
+
+    def deliver(self, msg):
+        self.messages += 1
+        self.bytes += len(msg.text.encode("utf-8"))
+        image = msg.image(self.channel)
+        if image is not None:
+            self.images += 1
+            self.bytes += len(image[0])
+
+    def warm(self):
+        pass
+
+# =====================
+# 🎬 回放主流程
+# =====================
+def _percentiles(samples, qs=(50, 90, 99)):
+    if not samples:
+        return {q: 0.0 for q in qs}
+    return dict(zip(qs, np.percentile(samples, qs)))
+
+def replay_session(feed, ai=None, start="05:30", end="13:40", speed=None, encode=True, warmup=True):
+    """
+    用模擬時鐘從 start 跑到 end（回放日的台北時間），整條排程與報告流程照常執行
+    回傳每次巡檢的量測與彙總（吞吐、延遲百分位、CPU、RSS）
+    warmup=False 時略過 08:45 開盤前暖機（比較首次巡檢的冷啟動成本）
+    """
+    import main
+    import ai_expert
+    import monitor_009816
+    import new_ten_thousand_grid
+    import us_post_market_robot
+    from alert_engine import AlertEngine
+    from chart_renderer import _rss_mb
+    from delivery import DeliveryRouter
+    from grid_ledger import GridLedger
+    from history_cache import HISTORY
+    from report_archive import ARCHIVE
+    from warmup import first_tick_report
+
+    day = feed.replay_date.to_pydatetime()
+    t_start = datetime.combine(day.date(), datetime.strptime(start, "%H:%M").time())
+    t_end = datetime.combine(day.date(), datetime.strptime(end, "%H:%M").time())
+    sim = SimClock(t_start, speed=speed)
+    ai = ai or ReplayAI()
+    sink = ReplaySink()
+    ticks = []
+
+    def timed(kind, fn):
+        def wrapper(*args, **kwargs):
+            sim_time = sim.now()
+            w0, c0 = time.perf_counter(), time.process_time()
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+                return result
+            finally:
+                ticks.append({
+                    "sim_time": sim_time, "kind": kind, "result": result,
+                    "wall_ms": (time.perf_counter() - w0) * 1000,
+                    "cpu_ms": (time.process_time() - c0) * 1000,
+                    "rss_mb": _rss_mb(),
+                })
+        return wrapper
+
+    patches = [
+        (monitor_009816, "yf", feed), (new_ten_thousand_grid, "yf", feed), (us_post_market_robot, "yf", feed),
+        (ai_expert, "_call_gemini_api", ai),
+        (main, "ROUTER", DeliveryRouter([sink], encode=encode)),
+        (main, "ALERT_ENGINE", AlertEngine()),
+        # 每次回放從空帳本開始
+        (new_ten_thousand_grid, "GRID_LEDGER", GridLedger(os.path.join(tempfile.mkdtemp(prefix="replay-ledger-"), "grid_ledger.jsonl"))),
+        (main, "task_us_summary", timed("us_summary", main.task_us_summary)),
+        (main, "task_taiwan_realtime_monitor", timed("tw_monitor", main.task_taiwan_realtime_monitor)),
+        (main, "task_premarket_warmup", timed("warmup", main.task_premarket_warmup)),
+        (main, "WARMUP_TIME", main.WARMUP_TIME if warmup else "99:99"),
+    ]
+    saved = [(mod, name, getattr(mod, name)) for mod, name, _ in patches]
+    for mod, name, value in patches:
+        setattr(mod, name, value)
+
+    HISTORY.clear()
+    rss0 = _rss_mb()
+    w0, c0 = time.perf_counter(), time.process_time()
+    try:
+        with use_clock(sim):
+            main.scheduler_engine(until=t_end)
+            main.ROUTER.flush()  # 等背景發送全部完成
+    finally:
+        for mod, name, value in saved:
+            setattr(mod, name, value)
+        ARCHIVE.flush()
+    wall = time.perf_counter() - w0
+    cpu = time.process_time() - c0
+
+    lat = [t["wall_ms"] for t in ticks]
+    simulated = (t_end - t_start).total_seconds()
+    return {
+        "ticks": ticks,
+        "summary": {
+            "replay_date": f"{day:%Y-%m-%d}",
+            "simulated_s": simulated,
+            "wall_s": wall,
+            "speedup": simulated / wall if wall else float("inf"),
+            "ticks": len(ticks),
+            "ticks_per_s": len(ticks) / wall if wall else 0.0,
+            "latency_ms": _percentiles(lat),
+            "latency_max_ms": max(lat, default=0.0),
+            "cpu_pct": cpu / wall * 100 if wall else 0.0,
+            "cpu_ms_per_tick": cpu * 1000 / max(len(ticks), 1),
+            "rss_mb": (rss0, max((t["rss_mb"] for t in ticks), default=rss0), _rss_mb()),
+            "messages": sink.messages, "images": sink.images, "bytes": sink.bytes,
+            "ai_calls": ai.calls, "feed_calls": feed.calls,
+            "warmup_ms": sum(t["wall_ms"] for t in ticks if t["kind"] == "warmup"),
+            "first_tick": first_tick_report([(t["result"], t["wall_ms"]) for t in ticks if t["kind"] == "tw_monitor"] or [(None, 0.0)]),
+        },
+    }
+
+def format_summary(s):
+    lat = s["latency_ms"]
+    rss0, peak, rss1 = s["rss_mb"]
+    return "\n".join([
+        f"🎬 回放 {s['replay_date']}：模擬 {s['simulated_s'] / 3600:.1f} 小時，實際 {s['wall_s']:.1f} 秒（{s['speedup']:.0f}× 倍速）",
+        f"⏱️ 巡檢 {s['ticks']} 次（{s['ticks_per_s']:.2f} 次/秒）：P50 {lat[50]:.0f}ms / P90 {lat[90]:.0f}ms / P99 {lat[99]:.0f}ms / 最大 {s['latency_max_ms']:.0f}ms",
+        f"🧮 CPU {s['cpu_pct']:.0f}%（每次巡檢 {s['cpu_ms_per_tick']:.0f}ms），RSS {rss0:.0f} → {rss1:.0f} MB（峰值 {peak:.0f}）",
+        f"📤 訊息 {s['messages']} 則 / 圖 {s['images']} 張 / {s['bytes'] / 1024:.0f}KB，AI 呼叫 {s['ai_calls']} 次，行情讀取 {s['feed_calls']} 次",
+        f"{s['first_tick'] or '🔥 首次巡檢：無可比較的同類巡檢'}（暖機 {s['warmup_ms']:.0f}ms）",
+    ])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="交易日回放壓測")
+    parser.add_argument("fixtures", nargs="?", default="", help="錄製行情目錄（<symbol>.csv）；省略則用替代行情")
+    parser.add_argument("--date", help="回放日期 YYYY-MM-DD（預設為錄製資料最後一天）")
+    parser.add_argument("--start", default="05:30")
+    parser.add_argument("--end", default="13:40")
+    parser.add_argument("--speed", type=float, help="固定倍速（省略則全速）")
+    parser.add_argument("--ai", help="錄製的 AI 回應（JSONL）")
+    parser.add_argument("--ai-latency", type=float, default=0.0, help="每次 AI 呼叫的模擬延遲（秒）")
+    parser.add_argument("--record", action="store_true", help="先把目前行情錄製到 fixtures 目錄")
+    parser.add_argument("--no-warmup", action="store_true", help="略過 08:45 開盤前暖機")
+    args = parser.parse_args()
+
+    # 回放不得寫入正式的共享狀態與歸檔
+    import warnings
+    warnings.filterwarnings("ignore")
+    scratch = tempfile.mkdtemp(prefix="replay-")
+    os.environ.setdefault("SHARED_STATE_DIR", scratch)
+    os.environ.setdefault("REPORT_ARCHIVE_DIR", os.path.join(scratch, "archive"))
+    logging.basicConfig(level=logging.WARNING)
+
+    from monitor_009816 import SYMBOL as TW_SYMBOL
+    from new_ten_thousand_grid import TARGETS as GRID_TARGETS
+    from us_post_market_robot import TARGETS as US_TARGETS
+
+    symbols = [TW_SYMBOL, *GRID_TARGETS, *US_TARGETS]
+    if args.record:
+        if not args.fixtures:
+            sys.exit("--record 需要指定 fixtures 目錄")
+        record_fixtures(args.fixtures, symbols)
+
+    feed = ReplayFeed.load(args.fixtures, symbols, args.date, US_TARGETS)
+    ai = ReplayAI.load(args.ai, args.ai_latency) if args.ai else ReplayAI(latency=args.ai_latency)
+    result = replay_session(feed, ai, args.start, args.end, args.speed, warmup=not args.no_warmup)
+    print(format_summary(result["summary"]))
@@ -0,0 +1,199 @@
+# report_archive.py - 巡檢結果歸檔（每日分區、欄位式壓縮、批次寫入）
+import os
+import glob
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import pandas as pd
+
+import market_clock as clock
+
+TW_TZ = timezone(timedelta(hours=8))
+ARCHIVE_DIR = os.environ.get("REPORT_ARCHIVE_DIR", os.path.join(os.getcwd(), "report_archive"))
+
+# === 欄位定義（欄位式儲存：每欄一個 NumPy 陣列）===
+SCHEMA = (
+    ("ts", "i8"),            # UTC epoch 毫秒
+    ("source", "U16"),       # taiwan_stock / grid / us_market
+    ("symbol", "U16"),
+    ("price", "f8"),
+    ("rsi", "f8"),
+    ("ma20", "f8"),
+    ("ma60", "f8"),
+    ("grid_buy", "f8"),
+    ("month_low", "f8"),
+    ("position", "f8"),      # 價格位階 0~1
+    ("score", "f8"),         # 系統評分
+    ("trend", "U16"),
+    ("decision", "U32"),
+    ("confidence", "f8"),
+    ("origin", "U8"),        # 判斷來源 ai / rescued / cached / rule / error / none（見 ai_expert.ORIGINS；舊檔為空字串）
+    ("fetch_ms", "f8"),
+    ("ai_ms", "f8"),
+    ("total_ms", "f8"),
+)
+_DEFAULTS = {"i8": 0, "f8": np.nan}
+
+class ReportArchive:
+    """
+    只追加的巡檢歸檔：
+    - record() 只把一列放進記憶體緩衝，巡檢本身幾乎不增加耗時
+    - 背景執行緒在緩衝滿或定時把整批寫成一個壓縮欄位檔
+      (<root>/<YYYY-MM-DD>/chunk-<ns>-<pid>.npz)，既有檔案從不改寫
+    - query() 只讀範圍內的日期分區
+    """
+
+    def __init__(self, root=ARCHIVE_DIR, batch_size=64, flush_interval=60):
+        self.root = root
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buf = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher = None
+
+    # ---------- 寫入 ----------
+    def record(self, source, symbol, ts=None, **fields):
+        """記錄一列巡檢結果（未知欄位忽略，缺漏欄位補 NaN / 空字串）"""
+        try:
+            row = {"ts": int((ts if ts is not None else clock.timestamp()) * 1000), "source": source, "symbol": symbol}
+            for name, dtype in SCHEMA[3:]:
+                value = fields.get(name)
+                if value is None:
+                    continue
+                if dtype == "f8":
+                    # AI 回傳的 confidence 可能是字串，無法轉數字就記 NaN
+                    try:
+                        value = float(value)
+                    except (TypeError, ValueError):
+                        value = np.nan
+                row[name] = value
+            with self._lock:
+                self._buf.append(row)
+                full = len(self._buf) >= self.batch_size
+            self._ensure_flusher()
+            if full:
+                self._wake.set()
+        except Exception as e:
+            logging.error(f"❌ 歸檔記錄失敗: {e}")
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """把緩衝寫成壓縮欄位檔（依台灣日期分區）"""
+        with self._lock:
+            rows, self._buf = self._buf, []
+        if not rows:
+            return 0
+        try:
+            cols = _rows_to_columns(rows)
+            days = _partition_keys(cols["ts"])
+            for day in np.unique(days):
+                mask = days == day
+                part_dir = os.path.join(self.root, str(day))
+                os.makedirs(part_dir, exist_ok=True)
+                path = os.path.join(part_dir, f"chunk-{time.time_ns()}-{os.getpid()}.npz")
+                tmp = path + ".tmp"
+                with open(tmp, "wb") as fh:
+                    np.savez_compressed(fh, **{k: v[mask] for k, v in cols.items()})
+                os.replace(tmp, path)
+            return len(rows)
+        except Exception as e:
+            logging.error(f"❌ 歸檔寫入失敗（{len(rows)} 筆放回緩衝）: {e}")
+            with self._lock:
+                self._buf[:0] = rows
+            return 0
+
+    # ---------- 查詢 ----------
+    def query(self, start, end=None, source=None, symbol=None, columns=None):
+        """
+        區間查詢（start / end 為 datetime 或 'YYYY-MM-DD'，含頭含尾）
+        回傳依時間排序的 DataFrame，ts 轉為台灣時間
+        """
+        start_dt, end_dt = _to_range(start, end)
+        names = columns or [n for n, _ in SCHEMA]
+        if "ts" not in names:
+            names = ["ts"] + list(names)
+
+        parts = []
+        day = start_dt.date()
+        while day <= end_dt.date():
+            for path in sorted(glob.glob(os.path.join(self.root, day.isoformat(), "chunk-*.npz"))):
+                with np.load(path) as z:
+                    parts.append({n: z[n] for n in names if n in z.files})
+            day += timedelta(days=1)
+        with self._lock:
+            pending = list(self._buf)
+        if pending:
+            cols = _rows_to_columns(pending)
+            parts.append({n: cols[n] for n in names})
+
+        if not parts:
+            return pd.DataFrame(columns=names)
+
+        # 新增欄位之前寫入的分區檔沒有該欄：以預設值補齊（字串欄為空字串）
+        dtypes = dict(SCHEMA)
+        data = {n: np.concatenate([p[n] if n in p else _fill(dtypes[n], len(next(iter(p.values())))) for p in parts])
+                for n in names}
+        mask = (data["ts"] >= int(start_dt.timestamp() * 1000)) & (data["ts"] <= int(end_dt.timestamp() * 1000))
+        if source is not None:
+            mask &= data["source"] == source
+        if symbol is not None:
+            mask &= data["symbol"] == symbol
+        df = pd.DataFrame({n: v[mask] for n, v in data.items()})
+        df["ts"] = pd.to_datetime(df["ts"], unit="ms", utc=True).dt.tz_convert(TW_TZ)
+        return df.sort_values("ts").reset_index(drop=True)
+
+def _rows_to_columns(rows):
+    cols = {}
+    for name, dtype in SCHEMA:
+        if dtype.startswith("U"):
+            width = int(dtype[1:])
+            cols[name] = np.array([str(r.get(name, ""))[:width] for r in rows], dtype=dtype)
+        else:
+            default = _DEFAULTS[dtype]
+            cols[name] = np.array([r.get(name, default) for r in rows], dtype=dtype)
+    return cols
+
+def _fill(dtype, n):
+    if dtype.startswith("U"):
+        return np.full(n, "", dtype=dtype)
+    return np.full(n, _DEFAULTS[dtype], dtype=dtype)
+
+def _partition_keys(ts_ms):
+    """UTC 毫秒 → 台灣日期字串（向量化）"""
+    local = (ts_ms + 8 * 3600 * 1000).astype("datetime64[ms]").astype("datetime64[D]")
+    return local.astype(str)
+
+def _to_range(start, end):
+    def _parse(v, end_of_day=False):
+        if isinstance(v, str):
+            v = datetime.strptime(v, "%Y-%m-%d")
+            if end_of_day:
+                v = v + timedelta(days=1) - timedelta(milliseconds=1)
+        if v.tzinfo is None:
+            v = v.replace(tzinfo=TW_TZ)
+        return v.astimezone(TW_TZ)
+    start_dt = _parse(start)
+    end_dt = _parse(end, end_of_day=True) if end is not None else clock.now(TW_TZ)
+    return start_dt, end_dt
+
+# === 全域歸檔實例 ===
+ARCHIVE = ReportArchive()
+atexit.register(ARCHIVE.flush)
+
+def record_snapshot(source, symbol, **fields):
+    ARCHIVE.record(source, symbol, **fields)
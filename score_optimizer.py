@@ -0,0 +1,181 @@
+# score_optimizer.py - 009816 評分規則最佳化（參數組 × 交易日矩陣向量化評分，行程池平行）
+import os
+import time
+import logging
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from scoring_config import DEFAULT_SCORING, LAUNCH_PRICE, action_level, normalize_scoring, save_scoring, score
+
+# 搜尋空間（預設規則的每個值都在其中）
+PARAM_GRID = {
+    "base": [65],
+    "launch_price": [10.0, 10.05, 10.1, 10.2, 10.5],
+    "launch_bonus": [0, 5, 10, 15],
+    "dist_max": [0.0, 1.0, 2.0, 3.0, 5.0, 8.0],
+    "dist_bonus": [0, 5, 10],
+    "position_max": [0.2, 0.3, 0.4, 0.5, 0.6],
+    "position_bonus": [0, 5, 10, 15, 20],
+    "buy_cutoff": [70, 75, 80],
+    "dca_cutoff": [60, 65],
+}
+HORIZON = 20          # 前瞻報酬天數
+POSITION_WINDOW = 252 # 價格位階回看天數（與盤中抓一年日線一致）
+MIN_SIGNALS = 10      # 積極佈局訊號少於此數不排名
+CHUNK = 2000          # 每個行程一次評估的參數組數
+
+def build_grid(grid=PARAM_GRID):
+    """笛卡兒積 → {參數: 陣列}（只保留 dca_cutoff < buy_cutoff 的組合）"""
+    keys = list(grid)
+    rows = np.array(list(itertools.product(*(grid[k] for k in keys))), dtype="f8")
+    params = {k: rows[:, i] for i, k in enumerate(keys)}
+    keep = params["dca_cutoff"] < params["buy_cutoff"]
+    return {k: v[keep] for k, v in params.items()}
+
+def daily_features(close, horizon=HORIZON, window=POSITION_WINDOW):
+    """每個交易日的 (現價, 價格位階, 前瞻報酬)；位階與 compute_position 同一定義（低點至少計入發行價）"""
+    close = pd.Series(np.asarray(close, dtype="f8"))
+    high = close.rolling(window, min_periods=1).max()
+    low = np.minimum(close.rolling(window, min_periods=1).min(), LAUNCH_PRICE)
+    span = (high - low).to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        position = np.where(span > 0, (close.to_numpy() - low) / span, 0.5)
+    fwd = close.shift(-horizon).to_numpy() / close.to_numpy() - 1
+    return close.to_numpy(), position, fwd
+
+def evaluate_params(params, price, position, fwd):
+    """
+    一次評估一批參數：評分矩陣 shape=(參數組, 交易日)
+    回傳每組的訊號數、積極佈局 / 其餘日子的平均前瞻報酬、命中率、依建議配置的平均報酬
+    """
+    cfg = {k: np.asarray(v)[:, None] for k, v in params.items()}
+    valid = ~np.isnan(fwd)
+    price, position, ret = price[valid][None, :], position[valid][None, :], fwd[valid][None, :]
+    level = action_level(score(price, position, cfg), cfg)
+
+    buy = level == 2
+    n_buy = buy.sum(axis=1)
+    buy_sum = (buy * ret).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        buy_ret = buy_sum / n_buy
+        rest_ret = (ret.sum() - buy_sum) / (ret.shape[1] - n_buy)
+        hit = (buy & (ret > 0)).sum(axis=1) / n_buy
+    alloc = np.array([0.0, 0.5, 1.0])[level]  # 觀望 0 / 定期定額 0.5 / 積極 1
+    exposure = alloc.mean(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        per_exposure = (alloc * ret).mean(axis=1) / exposure
+    return {
+        "n_buy": n_buy, "n_days": np.full(len(n_buy), ret.shape[1]),
+        "buy_ret": buy_ret, "rest_ret": rest_ret, "hit": hit,
+        "exposure": exposure, "ret_per_exposure": per_exposure,
+    }
+
+# ---------- 行程池：特徵在 initializer 送一次，之後只傳參數批次 ----------
+_FEATURES = None
+
+def _init_worker(price, position, fwd):
+    global _FEATURES
+    _FEATURES = (price, position, fwd)
+
+def _evaluate_chunk(params):
+    return evaluate_params(params, *_FEATURES)
+
+def _chunks(params, size):
+    n = len(next(iter(params.values())))
+    for start in range(0, n, size):
+        yield {k: v[start:start + size] for k, v in params.items()}
+
+def optimize(close, grid=PARAM_GRID, horizon=HORIZON, workers=None, chunk=CHUNK):
+    """回傳依「積極佈局訊號的超額前瞻報酬」排序的參數表（DataFrame）"""
+    price, position, fwd = daily_features(close, horizon)
+    params = build_grid(grid)
+    if workers == 1:
+        parts = [evaluate_params(p, price, position, fwd) for p in _chunks(params, chunk)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(price, position, fwd)) as pool:
+            parts = list(pool.map(_evaluate_chunk, _chunks(params, chunk)))
+    metrics = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+    table = pd.DataFrame({**params, **metrics})
+    baseline = float(np.nanmean(fwd))
+    table["excess"] = table["buy_ret"] - baseline
+    table["spread"] = table["buy_ret"] - table["rest_ret"]
+    table["default"] = np.logical_and.reduce([table[k] == v for k, v in DEFAULT_SCORING.items()])
+    ranked = table[table["n_buy"] >= MIN_SIGNALS].sort_values(["excess", "hit", "default"], ascending=False)
+    # 不同參數若產生完全相同的訊號（例如加分為 0 時門檻無作用）只保留一列（預設規則優先）
+    ranked = ranked.drop_duplicates(subset=list(metrics)).reset_index(drop=True)
+    ranked.index += 1
+    ranked.attrs["baseline"] = baseline
+    ranked.attrs["evaluated"] = len(table)
+    return ranked
+
+def config_from_row(row):
+    """排名表的一列 → 評分設定（整數值還原為 int，非整數保留 float）"""
+    return normalize_scoring({k: row[k] for k in DEFAULT_SCORING})
+
+def _load_close(args):
+    if args.csv:
+        df = pd.read_csv(args.csv, index_col=0, parse_dates=True)
+        return df["Close"].dropna()
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        return pd.Series(10 * np.exp(np.cumsum(rng.normal(0.0003, 0.011, args.synthetic))))
+    import yfinance as yf
+    from monitor_009816 import SYMBOL
+    return yf.Ticker(SYMBOL).history(period=args.period)["Close"].dropna()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="009816 評分規則參數最佳化")
+    parser.add_argument("--csv", help="日線 CSV（含 Close 欄）；未指定則以 yfinance 下載")
+    parser.add_argument("--period", default="max", help="yfinance 下載區間")
+    parser.add_argument("--synthetic", type=int, metavar="DAYS", help="改用模擬日線（離線測試）")
+    parser.add_argument("--horizon", type=int, default=HORIZON, help="前瞻報酬天數")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="行程數（1 = 不開行程池）")
+    parser.add_argument("--top", type=int, default=15, help="顯示前幾名")
+    parser.add_argument("--save", type=int, metavar="RANK", help="把第 RANK 名寫入評分設定檔（執行中的服務下次巡檢即套用）")
+    parser.add_argument("--bench", action="store_true", help="比較單行程與行程池耗時")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    close = _load_close(args)
+    n_params = len(next(iter(build_grid().values())))
+    print(f"📚 {len(close)} 個交易日，{n_params:,} 組參數，前瞻 {args.horizon} 日")
+
+    if args.bench:
+        # 對照：逐參數逐日呼叫 score()（取 200 組推算全體）
+        price, position, fwd = daily_features(close, args.horizon)
+        params = build_grid()
+        t0 = time.perf_counter()
+        for i in range(200):
+            cfg = {k: v[i] for k, v in params.items()}
+            levels = [action_level(score(p, q, cfg), cfg) for p, q in zip(price, position)]
+        loop = (time.perf_counter() - t0) / 200 * n_params
+        print(f"   逐一迴圈（推算）: {loop:.1f}s")
+        for workers in sorted({1, 2, args.workers}):
+            t0 = time.perf_counter()
+            optimize(close, horizon=args.horizon, workers=workers)
+            print(f"   向量化 workers={workers}: {time.perf_counter() - t0:.2f}s")
+
+    t0 = time.perf_counter()
+    ranked = optimize(close, horizon=args.horizon, workers=args.workers)
+    elapsed = time.perf_counter() - t0
+    cells = ranked.attrs["evaluated"] * len(close)
+    print(f"⚡ {elapsed:.2f}s（{cells / elapsed / 1e6:.0f}M 參數×日/秒），基準前瞻報酬 {ranked.attrs['baseline'] * 100:+.2f}%，"
+          f"訊號不同的組合 {len(ranked):,} 組")
+
+    cols = list(PARAM_GRID)[1:] + ["n_buy", "hit", "buy_ret", "excess", "spread", "ret_per_exposure", "default"]
+    print(ranked[cols].head(args.top).to_string(float_format=lambda v: f"{v:.3f}"))
+    default = ranked[ranked["default"]]
+    if not default.empty:
+        print(f"📍 目前預設規則排名第 {default.index[0]} / {len(ranked)}")
+
+    if args.save:
+        row = ranked.loc[args.save]
+        path = save_scoring(config_from_row(row), rank=args.save, horizon=args.horizon,
+                            excess=float(row["excess"]), hit=float(row["hit"]), n_buy=int(row["n_buy"]))
+        print(f"💾 已寫入第 {args.save} 名設定：{path}")
@@ -0,0 +1,91 @@
+# scoring_config.py - 009816 系統評分規則（門檻 / 加分可由 JSON 檔熱更新，免改程式）
+import os
+import json
+import logging
+import threading
+
+import numpy as np
+
+LAUNCH_PRICE = 10.0
+SCORING_CONFIG = os.environ.get(
+    "SCORING_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_009816.json")
+)
+
+# 與原本寫死的規則相同
+DEFAULT_SCORING = {
+    "base": 65,
+    "launch_price": 10.05,   # 現價 ≤ 此價加分（貼近發行價）
+    "launch_bonus": 10,
+    "dist_max": 2.0,         # 距發行價 < 此百分比加分
+    "dist_bonus": 5,
+    "position_max": 0.4,     # 價格位階 < 此值加分（低檔）
+    "position_bonus": 10,
+    "buy_cutoff": 75,        # 評分 ≥ 此值：積極佈局
+    "dca_cutoff": 60,        # 評分 ≥ 此值：定期定額
+}
+SYSTEM_ACTIONS = ("🔴 觀望等待", "🟡 定期定額", "🟢 積極佈局")
+
+def normalize_scoring(data):
+    """
+    設定檔 / 最佳化排名列 → 評分設定（缺的鍵用預設值）
+    評分與門檻比較都接受小數：整數欄位遇到非整數值（例如 buy_cutoff 72.5）保留 float，不截斷
+    """
+    cfg = {}
+    for key, default in DEFAULT_SCORING.items():
+        value = data.get(key, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float, np.integer, np.floating)):
+            raise TypeError(f"評分設定 {key} 必須是數字：{value!r}")
+        value = float(value)
+        cfg[key] = int(value) if isinstance(default, int) and value.is_integer() else value
+    return cfg
+
+_cache = {"mtime": None, "cfg": dict(DEFAULT_SCORING)}
+_lock = threading.Lock()
+
+def load_scoring(path=None):
+    """讀取評分設定；檔案不存在用預設值，檔案更新（mtime 改變）才重新解析，格式錯誤沿用上一份"""
+    path = path or SCORING_CONFIG
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return dict(DEFAULT_SCORING)
+    with _lock:
+        if _cache["mtime"] != (path, mtime):
+            try:
+                with open(path, encoding="utf-8") as fh:
+                    data = json.load(fh)
+                cfg = normalize_scoring(data)
+                _cache["cfg"], _cache["mtime"] = cfg, (path, mtime)
+                logging.info(f"⚖️ 已載入 009816 評分設定：{path}")
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                logging.error(f"❌ 評分設定無法讀取，沿用目前設定: {e}")
+                _cache["mtime"] = (path, mtime)
+        return dict(_cache["cfg"])
+
+def save_scoring(cfg, path=None, **meta):
+    """寫入評分設定（原子替換；meta 一併記錄來源，例如最佳化的排名與指標）"""
+    path = path or SCORING_CONFIG
+    data = {k: cfg[k] for k in DEFAULT_SCORING}
+    data.update(meta)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, ensure_ascii=False, indent=2, default=float)
+    os.replace(tmp, path)
+    return path
+
+def score(price, position, cfg):
+    """
+    系統評分；price / position 與 cfg 的值都可以是 NumPy 陣列（可廣播），
+    最佳化時以 (參數組, 1) 對 (1, 交易日) 一次算完整個矩陣
+    """
+    dist = (price / LAUNCH_PRICE - 1) * 100
+    return (
+        cfg["base"]
+        + cfg["launch_bonus"] * (price <= cfg["launch_price"])
+        + cfg["dist_bonus"] * (dist < cfg["dist_max"])
+        + cfg["position_bonus"] * (position < cfg["position_max"])
+    )
+
+def action_level(scores, cfg):
+    """0 觀望等待 / 1 定期定額 / 2 積極佈局（同樣可廣播）"""
+    return (np.asarray(scores) >= cfg["dca_cutoff"]).astype("i1") + (np.asarray(scores) >= cfg["buy_cutoff"])
@@ -0,0 +1,120 @@
+# shared_state.py - 跨行程共享狀態（mmap 檔案 + 版本號快照，讀取端免鎖）
+import os
+import copy
+import json
+import mmap
+import time
+import struct
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 本機開發：退化為單行程鎖
+    fcntl = None
+
+# 檔頭：版本號 (uint64) + 內容長度 (uint32)；版本為奇數代表寫入中
+_HEADER = struct.Struct("<QI")
+
+STATE_DIR = os.environ.get("SHARED_STATE_DIR", tempfile.gettempdir())
+
+@contextmanager
+def _file_lock(path):
+    """寫入端跨行程互斥（flock），讀取端不需要"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+def try_file_lock(path):
+    """非阻塞取得獨佔檔案鎖；成功回傳開啟中的檔案（關閉即釋放），失敗回傳 None"""
+    fh = open(path, "a")
+    if fcntl is None:
+        return fh
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fh
+    except OSError:
+        fh.close()
+        return None
+
+class SharedState:
+    """
+    以 mmap 檔案保存的 JSON 狀態（seqlock 寫法）：
+    - 寫入端：取檔案鎖 → 版本改奇數 → 寫內容 → 版本改偶數
+    - 讀取端：版本前後一致且為偶數才採用，否則重讀；版本未變直接回傳快取
+    所有 gunicorn worker / 行程池子行程開同一個檔案即可看到同一份狀態
+    """
+
+    def __init__(self, name, capacity=16384, default=None, state_dir=None):
+        self.path = os.path.join(state_dir or STATE_DIR, f"{name}.state")
+        self.capacity = capacity
+        self.default = dict(default or {})
+        self._lock = threading.Lock()
+        self._cache = (0, self.default)
+
+        size = _HEADER.size + capacity
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def snapshot(self):
+        """免鎖讀取，回傳 (版本, 狀態副本)；尚未寫入過則回傳預設值"""
+        mm = self._mm
+        for _ in range(200):
+            v1, length = _HEADER.unpack_from(mm, 0)
+            if v1 == 0:
+                return 0, dict(self.default)
+            if v1 & 1:
+                time.sleep(0)  # 寫入中，讓出執行權後重試
+                continue
+            cached_ver, cached = self._cache
+            if cached_ver == v1:
+                return v1, dict(cached)
+            raw = mm[_HEADER.size:_HEADER.size + length]
+            v2, _ = _HEADER.unpack_from(mm, 0)
+            if v1 == v2:
+                data = json.loads(raw.decode("utf-8"))
+                self._cache = (v1, data)
+                return v1, dict(data)
+
+        # 寫入端中途異常留下奇數版本：沿用最後一份成功讀到的快照
+        logging.warning(f"⚠️ 共享狀態 {self.path} 讀取逾時，使用快取版本")
+        cached_ver, cached = self._cache
+        return cached_ver, dict(cached)
+
+    def publish(self, data):
+        """寫入新快照，回傳新版本號"""
+        return self.update(lambda _: data)[0]
+
+    def update(self, fn):
+        """
+        讀取 → 修改 → 寫回（持有檔案鎖，跨行程的計數不會互相覆蓋）
+        fn 收到目前狀態的副本、回傳新狀態；回傳 (新版本號, 新狀態)
+        """
+        mm = self._mm
+        with self._lock, _file_lock(self.path + ".lock"):
+            data = fn(copy.deepcopy(self.snapshot()[1]))  # snapshot 是淺複製，巢狀內容不能改到快取
+            raw = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            if len(raw) > self.capacity:
+                raise ValueError(f"共享狀態超出容量 ({len(raw)} > {self.capacity} bytes)")
+            version, _ = _HEADER.unpack_from(mm, 0)
+            writing = version if version & 1 else version + 1
+            _HEADER.pack_into(mm, 0, writing, len(raw))
+            mm[_HEADER.size:_HEADER.size + len(raw)] = raw
+            _HEADER.pack_into(mm, 0, writing + 1, len(raw))
+        return writing + 1, data
+
+    def version(self):
+        return _HEADER.unpack_from(self._mm, 0)[0]
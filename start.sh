@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+# 正式環境入口：gunicorn 多 worker，排程由檔案鎖選出的單一 worker 執行
+set -e
+exec gunicorn -c gunicorn.conf.py main:app
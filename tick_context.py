@@ -0,0 +1,70 @@
+# tick_context.py - 巡檢週期的時間預算（deadline 隨 contextvars 傳到各階段，預算不足時依序降級）
+import time
+import contextvars
+from contextlib import contextmanager
+
+TICK_SECONDS = 180      # 盤中巡檢週期
+TICK_BUDGET = 170       # 單次巡檢可用時間（保留餘裕給排程本身）
+
+# 降級順序：剩餘秒數低於門檻就啟用，一旦啟用本週期內不再恢復
+DEGRADE_STEPS = (
+    ("ai_fallback", 90, "AI 改用快取 / 規則判斷"),
+    ("skip_chart", 45, "略過圖表繪製"),
+    ("text_only", 20, "只發文字（不上傳圖片）"),
+)
+_THRESHOLDS = {name: seconds for name, seconds, _ in DEGRADE_STEPS}
+_LABELS = {name: label for name, _, label in DEGRADE_STEPS}
+
+class TickContext:
+    def __init__(self, budget=TICK_BUDGET, label=""):
+        self.label = label
+        self.budget = budget
+        self.deadline = time.monotonic() + budget
+        self.spans = []  # 本週期內各條管線的計時摘要（飛行記錄器保存用）
+        self._applied = set()
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def degrade(self, step):
+        """此步驟是否該降級（剩餘預算低於門檻；啟用過的步驟一律維持）"""
+        if step in self._applied:
+            return True
+        if self.remaining() <= _THRESHOLDS[step]:
+            self._applied.add(step)
+            return True
+        return False
+
+    def timeout(self, cap, reserve=5.0):
+        """網路請求的逾時：不超過 cap，也不超過剩餘預算（至少留 1 秒）"""
+        return max(min(cap, self.remaining() - reserve), 1.0)
+
+    @property
+    def applied(self):
+        return [name for name, _, _ in DEGRADE_STEPS if name in self._applied]
+
+    def describe(self):
+        return "、".join(_LABELS[name] for name in self.applied)
+
+_CURRENT = contextvars.ContextVar("tick_context", default=None)
+
+def current_tick():
+    """目前所在的巡檢週期（手動觸發等沒有時間預算的流程回傳 None）"""
+    return _CURRENT.get()
+
+@contextmanager
+def tick_scope(ctx):
+    token = _CURRENT.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _CURRENT.reset(token)
+
+def degrade(step):
+    """沒有巡檢週期時永遠不降級"""
+    ctx = _CURRENT.get()
+    return ctx is not None and ctx.degrade(step)
+
+def request_timeout(cap):
+    ctx = _CURRENT.get()
+    return cap if ctx is None else ctx.timeout(cap)
@@ -1,17 +1,10 @@
 import yfinance as yf
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import io
-import os
+import time
 from datetime import datetime, timedelta, timezone
 import logging
 
-# 強制 Agg 後端
-import matplotlib
-matplotlib.use('Agg')
-
 # 導入 AI 判斷模組
 try:
     from ai_expert import analyze_us_market
@@ -20,24 +13,11 @@ except ImportError:
     AI_AVAILABLE = False
     logging.warning("⚠️ ai_expert 模組未找到，將跳過 AI 判斷")
 
-# =====================
-# 🛠️ 終極中文字體與符號解決方案
-# =====================
-def setup_chinese_font():
-    font_filename = "NotoSansTC-Regular.ttf"
-    font_path = os.path.join(os.getcwd(), font_filename)
-    
-    if os.path.exists(font_path):
-        fm.fontManager.addfont(font_path)
-        font_name = fm.FontProperties(fname=font_path).get_name()
-        plt.rcParams['font.family'] = [font_name, 'DejaVu Sans', 'sans-serif']
-        plt.rcParams['axes.unicode_minus'] = False 
-        logging.info(f"✅ 美股模組：成功載入本地字體 {font_name}")
-    else:
-        logging.error(f"❌ 美股模組：找不到字體檔 {font_filename}")
-
-# 初始化字體
-setup_chinese_font()
+from report_archive import record_snapshot
+from outlook_engine import outlook
+from chart_renderer import render_us_dashboard
+from history_cache import HISTORY, fetch_timeout
+import market_clock as clock
 
 # ==== 設定 ====
 TARGETS_MAP = {"^GSPC": "標普500", "^DJI": "道瓊工業", "^IXIC": "那斯達克", "TSM": "台積電ADR"}
@@ -66,11 +46,15 @@ def compute_indicators(df):
     else: 
         trend = "🟡 空頭反彈"
     
-    # 計算波動區間
-    returns = np.log(close / close.shift(1))
-    volatility = returns.std() * np.sqrt(5)
-    range_up = last_price * (1 + volatility)
-    range_down = last_price * (1 - volatility)
+    # 計算下週波動區間：5 日蒙地卡羅 P16~P84（約對應 ±1 標準差）
+    sim = outlook(last_price, close.to_numpy(), horizon=5, percentiles=(16, 84))
+    if sim:
+        range_down, range_up = sim["p16"], sim["p84"]
+    else:
+        returns = np.log(close / close.shift(1))
+        volatility = returns.std() * np.sqrt(5)
+        range_up = last_price * (1 + volatility)
+        range_down = last_price * (1 - volatility)
     
     return {
         "price": last_price,
@@ -84,68 +68,45 @@ def compute_indicators(df):
 
 def generate_us_dashboard(dfs):
     """繪製美股多維度決策儀表板"""
-    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(12, 16), gridspec_kw={'height_ratios': [2, 1, 1]})
-    
-    for symbol, df in dfs.items():
-        name = TARGETS_MAP[symbol]
-        norm_close = df['Close'] / df['Close'].iloc[0] * 100
-        ax1.plot(df.index, norm_close, label=name, linewidth=2.5)
-        
-        # RSI 曲線
-        delta = df['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-        rsi = 100 - (100 / (1 + (gain / loss.replace(0, 0.001))))
-        ax3.plot(df.index, rsi, label=f"{name}", alpha=0.8)
+    return render_us_dashboard(dfs, TARGETS_MAP)
 
-    ax1.set_title("市場指數相對表現 (基準 100)", fontsize=18, fontweight='bold', pad=20)
-    ax1.legend(loc='upper left', fontsize=12)
-    ax1.grid(True, linestyle='--', alpha=0.5)
-    
-    # S&P 500 MACD
-    gspc_close = dfs["^GSPC"]['Close']
-    exp12 = gspc_close.ewm(span=12, adjust=False).mean()
-    exp26 = gspc_close.ewm(span=26, adjust=False).mean()
-    macd = exp12 - exp26
-    signal = macd.ewm(span=9, adjust=False).mean()
-    hist = macd - signal
-    colors = ['#ff4d4d' if h > 0 else '#2ecc71' for h in hist]
-    ax2.bar(dfs["^GSPC"].index, hist, color=colors, alpha=0.8, width=0.8)
-    ax2.set_title("標普 500 市場動能 (MACD)", fontsize=16, fontweight='bold')
-    ax2.grid(True, axis='y', alpha=0.3)
-    
-    # RSI 熱力
-    ax3.axhline(70, color='#ff4d4d', linestyle='--', linewidth=1.5)
-    ax3.axhline(30, color='#2ecc71', linestyle='--', linewidth=1.5)
-    ax3.set_title("RSI 強弱熱度掃描", fontsize=16, fontweight='bold')
-    ax3.set_ylim(0, 100)
-    
-    plt.tight_layout()
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=180, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-    return buf
+def _download(symbol, period):
+    df = yf.download(symbol, period=period, interval="1d", progress=False, timeout=fetch_timeout())
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    return df
 
-def run_us_ai():
+def fetch_us_history():
+    """抓取美股各指數一年日線（DAG 的 fetch 階段與 run_us_ai 共用；昨天以前走日線快取）"""
     dfs = {}
-    trade_date = "" 
-    
     for s in TARGETS:
         try:
-            df = yf.download(s, period="1y", interval="1d", progress=False)
+            df = HISTORY.get(s, lambda period, s=s: _download(s, period))
             if not df.empty:
-                if isinstance(df.columns, pd.MultiIndex):
-                    df.columns = df.columns.get_level_values(0)
                 dfs[s] = df
-                if not trade_date:
-                    trade_date = df.index[-1].strftime("%Y-%m-%d")
         except Exception as e:
             logging.error(f"抓取 {s} 失敗: {e}")
-            
+    return dfs
+
+def compute_us_indicators(dfs):
+    """各指數指標（DAG 的 indicators 階段）"""
+    return {symbol: compute_indicators(df) for symbol, df in dfs.items()}
+
+def run_us_ai(dfs=None, indicators=None, render=True):
+    """
+    dfs / indicators: 已抓好的日線與已算好的指標（DAG 執行時傳入，避免重複計算）
+    render: False 時不畫圖（由 DAG 的 render 階段另外平行繪製）
+    """
+    t_start = time.perf_counter()
+    ai_ms = 0.0
+
+    if dfs is None:
+        dfs = fetch_us_history()
     if not dfs: return "❌ 數據抓取失敗", None
+    trade_date = next(iter(dfs.values())).index[-1].strftime("%Y-%m-%d")
+    fetch_ms = (time.perf_counter() - t_start) * 1000
 
-    tw_now = datetime.now(timezone(timedelta(hours=8))).strftime("%H:%M")
+    tw_now = clock.now(timezone(timedelta(hours=8))).strftime("%H:%M")
     
     report = [
         "# 美股盤後快報 🦅",
@@ -159,7 +120,7 @@ def run_us_ai():
     for symbol in TARGETS:
         if symbol not in dfs: continue
         df = dfs[symbol]
-        info = compute_indicators(df)
+        info = (indicators or {}).get(symbol) or compute_indicators(df)
         all_indicators[symbol] = info
         
         name = TARGETS_MAP[symbol]
@@ -184,7 +145,7 @@ def run_us_ai():
     # =====================
     # 🤖 美股綜合 AI 判斷 + 台股明日預測
     # =====================
-    ai_result = {"decision": "震盪", "confidence": 50, "reason": "AI 未啟用"}
+    ai_result = {"decision": "震盪", "confidence": 50, "reason": "AI 未啟用", "origin": "none"}
     
     if AI_AVAILABLE and "^GSPC" in all_indicators:
         try:
@@ -210,11 +171,13 @@ def run_us_ai():
                 "tech": f"S&P {spx_info['trend']}, NASDAQ {nasdaq_info.get('trend', 'N/A')}"
             }
             
+            t_ai = time.perf_counter()
             ai_result = analyze_us_market(extra_data, debug=False)
+            ai_ms = (time.perf_counter() - t_ai) * 1000
             
         except Exception as e:
             logging.error(f"美股 AI 判斷異常: {e}")
-            ai_result = {"decision": "震盪", "confidence": 50, "reason": "AI 分析異常"}
+            ai_result = {"decision": "震盪", "confidence": 50, "reason": "AI 分析異常", "origin": "error"}
     
     # 加入 AI 判斷結果
     report.append("---")
@@ -230,5 +193,17 @@ def run_us_ai():
     report.append("---")
     report.append(f"📈 **美股多維度決策儀表板已生成，請參閱下方附件**")
     
-    img_buf = generate_us_dashboard(dfs)
+    # 歸檔：各指數指標 + 一筆市場層級的 AI 判斷
+    for symbol, info in all_indicators.items():
+        record_snapshot(
+            "us_market", symbol,
+            price=info['price'], rsi=info['rsi'], ma20=info['ma20'], ma60=info['ma60'], trend=info['trend']
+        )
+    record_snapshot(
+        "us_market", "US_MARKET",
+        decision=ai_result['decision'], confidence=ai_result['confidence'], origin=ai_result.get('origin', ''),
+        fetch_ms=fetch_ms, ai_ms=ai_ms, total_ms=(time.perf_counter() - t_start) * 1000
+    )
+
+    img_buf = generate_us_dashboard(dfs) if render else None
     return "\n".join(report).strip(), img_buf
@@ -0,0 +1,82 @@
+# warmup.py - 開盤前暖機（08:45 先付掉 09:00 第一輪巡檢的冷啟動成本）
+import time
+import logging
+
+import numpy as np
+
+WARMUP_TIME = "08:45"
+
+def _step(steps, name, fn):
+    t0 = time.perf_counter()
+    try:
+        return fn()
+    except Exception as e:
+        logging.error(f"⚠️ 暖機步驟 {name} 失敗: {e}")
+        return None
+    finally:
+        steps[name] = (time.perf_counter() - t0) * 1000
+
+def run_warmup(extra_steps=None):
+    """
+    依序暖機，回傳 {步驟: 毫秒}；只有 history / lead_lag / 連線池 / 壓縮設定會留給第一輪巡檢直接使用：
+    - history：三組標的的一年日線放進日線快取，開盤後只需補最近幾天
+    - lead_lag：美股連動特徵算好當天份（巡檢的 lead_lag 階段當天直接沿用，開盤後只補上實際跳空）
+    - warm_compute：趨勢矩陣 / 美股指標 / 蒙地卡羅展望各跑一次，只為載入模組、熱起 pandas / NumPy 路徑，
+      結果丟棄（開盤後的 K 棒會變，第一輪巡檢必須用最新資料重算）
+    - warm_charts：三種圖各畫一張並壓縮，結果丟棄；保留的是字型 / 版面快取與各圖表選定的壓縮格式
+    - http：Gemini 連線放進連線池
+    extra_steps: 額外的 {名稱: 函式}（例如 Discord 連線，由 main 提供）
+    """
+    from ai_expert import warm_connection
+    from lead_lag import LEAD_LAG
+    from image_encoder import encode_chart
+    from monitor_009816 import SYMBOL, compute_position, fetch_history, generate_taiwan_chart
+    from new_ten_thousand_grid import compute_grid_indicators, fetch_grid_history, generate_grid_chart
+    from outlook_engine import outlook
+    from us_post_market_robot import compute_us_indicators, fetch_us_history, generate_us_dashboard
+
+    steps = {}
+    data = _step(steps, "history", lambda: (fetch_history(), fetch_grid_history(), fetch_us_history()))
+    tw_df, grid_dfs, us_dfs = data or (None, {}, {})
+
+    _step(steps, "lead_lag", lambda: LEAD_LAG.update(us_dfs, {SYMBOL: tw_df, **grid_dfs}))
+
+    def warm_compute():
+        compute_grid_indicators(grid_dfs)
+        compute_us_indicators(us_dfs)
+        if tw_df is not None and not tw_df.empty:
+            close = tw_df["Close"]
+            compute_position(close)
+            outlook(float(close.iloc[-1]), close.to_numpy(), horizon=252)
+    _step(steps, "warm_compute", warm_compute)
+
+    def warm_charts():
+        rendered = {
+            "tw_realtime": generate_taiwan_chart(tw_df),
+            "grid_live": generate_grid_chart(grid_dfs) if grid_dfs else None,
+            "us_close": generate_us_dashboard(us_dfs) if us_dfs else None,
+        }
+        for chart_type, buf in rendered.items():
+            if buf is not None:
+                encode_chart(buf, chart_type)
+    _step(steps, "warm_charts", warm_charts)
+
+    _step(steps, "http", warm_connection)
+    for name, fn in (extra_steps or {}).items():
+        _step(steps, name, fn)
+
+    logging.info("🔥 開盤前暖機完成：" + "，".join(f"{k} {v:.0f}ms" for k, v in steps.items())
+                 + "（warm_* 只熱模組與快取，結果不保留）")
+    return steps
+
+def first_tick_report(ticks):
+    """
+    ticks: 當天依序的 [(種類, 毫秒)]，種類為 "full"（完整報告）或 "scan"（事件掃描）
+    首次巡檢與之後同種類巡檢（中位數）比較；還沒有可比較的對象時回傳 None
+    """
+    kind, first = ticks[0]
+    same = [ms for k, ms in ticks[1:] if k == kind]
+    if not same:
+        return None
+    normal = float(np.median(same))
+    return f"🔥 首次巡檢（{kind}）{first:.0f}ms，之後同類 {len(same)} 次中位數 {normal:.0f}ms（{first / normal if normal else 0:.1f}×）"